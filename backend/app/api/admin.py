@@ -2,11 +2,13 @@
 Admin API endpoints
 """
 
+import asyncio
 from typing import List
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.security import get_current_admin_user
 from app.db.database import get_db
 from app.models.user import User
@@ -16,6 +18,13 @@ from app.models.user_course_progress import UserCourseProgress
 from app.schemas.user import UserResponse
 from app.schemas.course import CourseResponse, CourseCreate, CourseUpdate
 from app.schemas.lesson import LessonResponse, LessonCreate, LessonUpdate
+from app.services.transcript_index import transcript_index
+from app.services.answer_cache import answer_cache
+from app.services.learning_snapshot import learning_snapshot
+from app.services.llm_instrumentation import llm_calls
+from app.services.model_router import model_router
+from app.services.ai_service import ai_service
+from app.services.chat_storage import chat_storage
 
 router = APIRouter()
 
@@ -72,6 +81,7 @@ async def update_course(
     for field, value in update_data.items():
         setattr(course, field, value)
     
+    learning_snapshot.mark_course_stale(db, course_id)
     db.commit()
     db.refresh(course)
     return course
@@ -92,6 +102,8 @@ async def delete_course(
             detail="Course not found"
         )
     
+    learning_snapshot.mark_course_stale(db, course_id)
+    
     # Delete related lessons first
     db.query(Lesson).filter(Lesson.course_id == course_id).delete()
     
@@ -124,8 +136,12 @@ async def create_lesson(
     
     lesson = Lesson(**lesson_create.dict())
     db.add(lesson)
+    learning_snapshot.mark_course_stale(db, lesson.course_id)
     db.commit()
     db.refresh(lesson)
+    transcript_index.index_lesson(lesson.id, lesson.transcript)
+    if lesson.transcript:
+        ai_service.schedule_study_aids(lesson.id)
     return lesson
 
 
@@ -150,8 +166,16 @@ async def update_lesson(
     for field, value in update_data.items():
         setattr(lesson, field, value)
     
+    learning_snapshot.mark_course_stale(db, lesson.course_id)
     db.commit()
     db.refresh(lesson)
+    
+    # Title and duration reach the prompt too, not just the transcript
+    await answer_cache.invalidate_lesson(lesson.id)
+    if "transcript" in update_data:
+        transcript_index.index_lesson(lesson.id, lesson.transcript)
+        if lesson.transcript:
+            ai_service.schedule_study_aids(lesson.id)
     return lesson
 
 
@@ -170,8 +194,11 @@ async def delete_lesson(
             detail="Lesson not found"
         )
     
+    learning_snapshot.mark_course_stale(db, lesson.course_id)
     db.delete(lesson)
     db.commit()
+    transcript_index.remove(lesson_id)
+    await answer_cache.invalidate_lesson(lesson_id)
     
     return {"message": "Lesson deleted successfully"}
 
@@ -313,6 +340,7 @@ async def grant_course_access(
     )
     
     db.add(progress)
+    learning_snapshot.mark_stale(db, user_id)
     db.commit()
     db.refresh(progress)
     
@@ -369,6 +397,7 @@ async def revoke_course_access(
         db.delete(lp)
     
     db.delete(progress)
+    learning_snapshot.mark_stale(db, user_id)
     db.commit()
     
     return {
@@ -499,3 +528,67 @@ async def get_dashboard_stats(
             detail=f"Failed to fetch dashboard stats: {str(e)}"
         )
 
+
+
+@router.get("/llm-usage")
+async def get_llm_usage(
+    limit: int = Query(50, ge=1, le=500),
+    order_by: str = Query("total_tokens", pattern="^(total_tokens|cost|calls)$"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Heaviest LLM users of this worker since it started (admin only)"""
+    
+    return {
+        "users": llm_calls.top_users(limit=limit, order_by=order_by),
+        "prompt_cache": llm_calls.prompt_cache_report()
+    }
+
+
+@router.get("/llm-routing")
+async def get_llm_routing(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Model tiers and per-endpoint latency against SLOs for this worker (admin only)"""
+    
+    return {
+        "enabled": settings.LLM_ROUTING_ENABLED,
+        "tiers": {
+            name: {"model": tier.model, "max_tokens": tier.max_tokens}
+            for name, tier in model_router.tiers.items()
+        },
+        "routes": model_router.report()
+    }
+
+
+@router.post("/study-aids/refresh", status_code=status.HTTP_202_ACCEPTED)
+async def refresh_study_aids(
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Generate study aids for every lesson missing current ones (admin only)"""
+    
+    return {"scheduled": ai_service.refresh_study_aids(db)}
+
+
+@router.post("/chat-storage/maintenance")
+async def run_chat_storage_maintenance(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Create upcoming chat_messages partitions and archive expired months now (admin only)"""
+    
+    try:
+        result = await asyncio.to_thread(chat_storage.maintain)
+        if result["errors"]:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=result
+            )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Chat storage maintenance failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Chat storage maintenance failed: {e}"
+        )
@@ -2,8 +2,11 @@
 Chat API endpoints
 """
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+import json
+from typing import List, AsyncIterator, Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
@@ -16,42 +19,189 @@ from app.models.course import Course
 from app.models.personal_chat import PersonalChat
 from app.schemas.chat import (
     ChatMessageCreate, ChatMessageResponse, ChatThreadCreate, ChatThreadResponse,
-    LessonChatMessageCreate, LessonChatHistoryResponse
+    LessonChatMessageCreate, LessonChatHistoryResponse, ChatSearchResult
 )
 from app.schemas.personal_chat import (
     PersonalChatCreate, PersonalChatResponse, PersonalChatUpdate
 )
 from app.services.ai_service import ai_service
+from app.services.course_materials import course_materials_sync
+from app.services.chat_storage import chat_storage
+from app.services.chat_search import chat_search
 
 router = APIRouter()
 
+# History pages carry their neighbours' cursors in headers, so the body stays a plain message list
+NEXT_CURSOR_HEADER = "X-Next-Cursor"  # Newer messages
+PREV_CURSOR_HEADER = "X-Prev-Cursor"  # Older messages
+HISTORY_MAX_LIMIT = 200
+
+
+async def _sse_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Format AI service stream events as Server-Sent Events"""
+    async for event in events:
+        yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """Streaming response that isn't buffered by proxies"""
+    return StreamingResponse(
+        _sse_stream(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _history_page(
+    db: Session,
+    scope: Dict[str, Any],
+    response: Response,
+    limit: int,
+    before_id: Optional[int],
+    after_id: Optional[int]
+) -> List[ChatMessage]:
+    """One page of the messages matching scope in chronological order, keyset-paginated on (created_at, id).
+    
+    scope holds ChatMessage column values (None meaning IS NULL). Without a cursor the page
+    holds the newest messages; before_id pages back to older ones, after_id forward to newer
+    ones. Either is an index seek however deep the page. Once the hot table runs out, pages
+    continue into the archive, whose messages are all older. Cursors of the neighbouring
+    pages are set in the response headers when such messages exist.
+    """
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or after_id, not both")
+    
+    query = db.query(ChatMessage).filter(*[getattr(ChatMessage, column) == value for column, value in scope.items()])
+    key = tuple_(ChatMessage.created_at, ChatMessage.id)
+    
+    def position(message_id: int):
+        # The cursor message's stored created_at, so timestamps are never round-tripped through clients
+        created_at = select(ChatMessage.created_at).where(ChatMessage.id == message_id).scalar_subquery()
+        return tuple_(created_at, message_id)
+    
+    # Cursors must name a message in scope, hot or archived; anything else gets an empty page
+    cursor_id = after_id if after_id is not None else before_id
+    archived_cursor = None
+    if cursor_id is not None and not query.filter(ChatMessage.id == cursor_id).with_entities(ChatMessage.id).first():
+        archived_cursor = chat_storage.locate(db, scope, cursor_id)
+        if archived_cursor is None:
+            return []
+    
+    if after_id is not None:
+        rows = []
+        hot = query
+        if archived_cursor is not None:
+            rows = chat_storage.page(db, scope, limit + 1, after=archived_cursor)
+        else:
+            hot = query.filter(key > position(after_id))
+        if len(rows) <= limit:
+            rows += hot.order_by(ChatMessage.created_at, ChatMessage.id).limit(limit + 1 - len(rows)).all()
+        messages = rows[:limit]
+        has_older, has_newer = True, len(rows) > limit
+    else:
+        if archived_cursor is not None:
+            rows = chat_storage.page(db, scope, limit + 1, before=archived_cursor)
+        else:
+            if before_id is not None:
+                query = query.filter(key < position(before_id))
+            rows = query.order_by(
+                ChatMessage.created_at.desc(), ChatMessage.id.desc()
+            ).limit(limit + 1).all()
+            if len(rows) <= limit:
+                rows += chat_storage.page(db, scope, limit + 1 - len(rows))
+        messages = rows[:limit][::-1]  # Reverse to get chronological order
+        has_older, has_newer = len(rows) > limit, before_id is not None
+    
+    if messages:
+        if has_older:
+            response.headers[PREV_CURSOR_HEADER] = str(messages[0].id)
+        if has_newer:
+            response.headers[NEXT_CURSOR_HEADER] = str(messages[-1].id)
+    return messages
+
 
 @router.get("/history", response_model=List[ChatMessageResponse])
 async def get_chat_history(
+    response: Response,
     thread_id: str = None,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=HISTORY_MAX_LIMIT),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get chat history for user"""
+    """Get chat history for user, a page at a time (see _history_page)"""
     
-    query = db.query(ChatMessage).filter(ChatMessage.user_id == current_user.id)
+    scope = {"user_id": current_user.id}
     
     if thread_id:
-        query = query.filter(ChatMessage.thread_id == thread_id)
+        scope["thread_id"] = thread_id
+    
+    return _history_page(db, scope, response, limit, before_id, after_id)
+
+
+@router.get("/search", response_model=List[ChatSearchResult])
+async def search_chat_history(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    course_id: Optional[int] = None,
+    lesson_id: Optional[int] = None,
+    chat_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_LIMIT),
+    before_id: Optional[int] = None,
+    include_archive: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Full-text search of the user's chat messages, newest first.
+    
+    Narrow it to a course, a lesson or a personal chat. Archived months are searched
+    too with include_archive, after the recent messages. Each hit's snippet is HTML-escaped
+    text with matched terms wrapped in <mark></mark>. The next page's cursor is set in
+    the X-Prev-Cursor header; pass it back as before_id, with the same include_archive.
+    """
+    
+    scope = {"user_id": current_user.id}
+    
+    if course_id is not None:
+        scope["course_id"] = course_id
+    if lesson_id is not None:
+        scope["lesson_id"] = lesson_id
+    if chat_id is not None:
+        chat = db.query(PersonalChat).filter(
+            PersonalChat.id == chat_id,
+            PersonalChat.user_id == current_user.id,
+            PersonalChat.is_active == True
+        ).first()
+        if not chat:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chat not found"
+            )
+        scope["thread_id"] = chat.thread_id
     
-    messages = query.order_by(ChatMessage.created_at.desc()).limit(limit).all()
+    hits = chat_search.search(db, q, scope, limit + 1, before_id, include_archive)
+    if len(hits) > limit:
+        hits = hits[:limit]
+        response.headers[PREV_CURSOR_HEADER] = str(hits[-1][0].id)
     
-    return messages[::-1]  # Reverse to get chronological order
+    return [
+        ChatSearchResult(**ChatMessageResponse.model_validate(message).model_dump(), snippet=snippet)
+        for message, snippet in hits
+    ]
 
 
 @router.get("/lesson/{lesson_id}/history", response_model=LessonChatHistoryResponse)
 async def get_lesson_chat_history(
     lesson_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=HISTORY_MAX_LIMIT),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get chat history for a specific lesson and course context"""
+    """Get chat history for a specific lesson and course context, a page at a time"""
     
     # Get lesson and course info
     lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
@@ -62,20 +212,21 @@ async def get_lesson_chat_history(
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    # Get all messages for this course (for context)
-    course_messages = db.query(ChatMessage).filter(
+    # Messages specific to this lesson
+    scope = {"user_id": current_user.id, "course_id": lesson.course_id, "lesson_id": lesson_id}
+    lesson_messages = _history_page(db, scope, response, limit, before_id, after_id)
+    
+    # Messages across the whole course, counted without loading them
+    total_course_messages = db.query(func.count(ChatMessage.id)).filter(
         ChatMessage.user_id == current_user.id,
         ChatMessage.course_id == lesson.course_id
-    ).order_by(ChatMessage.created_at).all()
-    
-    # Get messages specific to this lesson
-    lesson_messages = [msg for msg in course_messages if msg.lesson_id == lesson_id]
+    ).scalar() + chat_storage.count(db, {"user_id": current_user.id, "course_id": lesson.course_id})
     
     return LessonChatHistoryResponse(
         messages=lesson_messages,
         lesson_title=lesson.title,
         course_title=course.title,
-        total_course_messages=len(course_messages)
+        total_course_messages=total_course_messages
     )
 
 
@@ -104,7 +255,7 @@ async def send_lesson_message(
     
     if not result["success"]:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=status.HTTP_409_CONFLICT if result.get("busy") else status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=result["message"]
         )
     
@@ -116,6 +267,28 @@ async def send_lesson_message(
     return assistant_message
 
 
+@router.post("/lesson/{lesson_id}/message/stream")
+async def stream_lesson_message(
+    lesson_id: int,
+    message_data: LessonChatMessageCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Send a message about a lesson and stream the answer as Server-Sent Events"""
+    
+    lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
+    if not lesson:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    
+    return _sse_response(ai_service.stream_lesson_message(
+        user=current_user,
+        message=message_data.content,
+        lesson_id=lesson_id,
+        course_id=message_data.course_id,
+        db=db
+    ))
+
+
 @router.post("/message", response_model=ChatMessageResponse)
 async def send_message(
     message_data: ChatMessageCreate,
@@ -129,7 +302,7 @@ async def send_message(
     
     if not result["success"]:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=status.HTTP_409_CONFLICT if result.get("busy") else status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=result["message"]
         )
     
@@ -149,7 +322,7 @@ async def create_new_thread(
 ):
     """Create a new chat thread"""
     
-    thread_id = ai_service.create_thread(current_user.id)
+    thread_id = await ai_service.create_thread(current_user.id)
     if not thread_id:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -166,12 +339,11 @@ async def create_new_thread(
     }
 
 
-@router.post("/upload-materials")
+@router.post("/upload-materials", status_code=status.HTTP_202_ACCEPTED)
 async def upload_course_materials(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user)
 ):
-    """Upload course materials to AI assistant (admin only)"""
+    """Start syncing course materials to AI assistant (admin only)"""
     
     if current_user.role != "admin":
         raise HTTPException(
@@ -179,15 +351,36 @@ async def upload_course_materials(
             detail="Admin access required"
         )
     
-    success = ai_service.upload_course_materials(db)
+    job = await ai_service.upload_course_materials()
     
-    if success:
-        return {"message": "Course materials uploaded successfully"}
-    else:
+    if job is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to upload course materials"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI assistant is not available"
         )
+    
+    return {"message": "Course materials sync started", "job": job.to_dict()}
+
+
+@router.get("/upload-materials/status")
+async def get_upload_materials_status(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Progress of the latest course materials sync (admin only)"""
+    
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    
+    if course_materials_sync.job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No course materials sync has run yet"
+        )
+    
+    return course_materials_sync.job.to_dict()
 
 
 # WebSocket connection manager
@@ -243,22 +436,25 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int, db: Session = D
 
 @router.get("/personal/history", response_model=List[ChatMessageResponse])
 async def get_personal_assistant_history(
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=HISTORY_MAX_LIMIT),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get personal assistant (Jarvis) chat history"""
+    """Get personal assistant (Jarvis) chat history, a page at a time"""
     
     thread_id = f"personal_assistant_user_{current_user.id}"
     
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.user_id == current_user.id,
-        ChatMessage.thread_id == thread_id,
-        ChatMessage.course_id.is_(None),  # Personal assistant messages have no course
-        ChatMessage.lesson_id.is_(None)   # Personal assistant messages have no lesson
-    ).order_by(ChatMessage.created_at.desc()).limit(limit).all()
+    scope = {
+        "user_id": current_user.id,
+        "thread_id": thread_id,
+        "course_id": None,  # Personal assistant messages have no course
+        "lesson_id": None   # Personal assistant messages have no lesson
+    }
     
-    return messages[::-1]  # Reverse to get chronological order
+    return _history_page(db, scope, response, limit, before_id, after_id)
 
 
 @router.post("/personal/message", response_model=ChatMessageResponse)
@@ -284,12 +480,19 @@ async def send_personal_assistant_message(
             ).first()
             
             return assistant_message
+        elif result.get("busy"):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=result["error"]
+            )
         else:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"AI service error: {result.get('error', 'Unknown error')}"
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in personal assistant endpoint: {str(e)}")
         raise HTTPException(
@@ -300,6 +503,22 @@ async def send_personal_assistant_message(
 
 # Personal Chat Management Endpoints
 
+def _personal_chat_response(chat: PersonalChat) -> PersonalChatResponse:
+    """Chat list entry from the chat's denormalized message counters"""
+    return PersonalChatResponse(
+        id=chat.id,
+        user_id=chat.user_id,
+        title=chat.title,
+        thread_id=chat.thread_id,
+        is_active=chat.is_active,
+        created_at=chat.created_at,
+        updated_at=chat.updated_at,
+        message_count=chat.message_count or 0,
+        last_message_at=chat.last_message_at or chat.created_at,
+        last_message_preview=chat.last_message_preview
+    )
+
+
 @router.get("/personal/chats", response_model=List[PersonalChatResponse])
 async def get_personal_chats(
     current_user: User = Depends(get_current_active_user),
@@ -311,33 +530,7 @@ async def get_personal_chats(
         PersonalChat.is_active == True
     ).order_by(PersonalChat.updated_at.desc()).all()
     
-    # Add message count and last message time for each chat
-    chat_responses = []
-    for chat in chats:
-        # Count messages in this chat
-        message_count = db.query(ChatMessage).filter(
-            ChatMessage.thread_id == chat.thread_id
-        ).count()
-        
-        # Get last message time
-        last_message = db.query(ChatMessage).filter(
-            ChatMessage.thread_id == chat.thread_id
-        ).order_by(ChatMessage.created_at.desc()).first()
-        
-        chat_response = PersonalChatResponse(
-            id=chat.id,
-            user_id=chat.user_id,
-            title=chat.title,
-            thread_id=chat.thread_id,
-            is_active=chat.is_active,
-            created_at=chat.created_at,
-            updated_at=chat.updated_at,
-            message_count=message_count,
-            last_message_at=last_message.created_at if last_message else chat.created_at
-        )
-        chat_responses.append(chat_response)
-    
-    return chat_responses
+    return [_personal_chat_response(chat) for chat in chats]
 
 
 @router.post("/personal/chats", response_model=PersonalChatResponse)
@@ -363,17 +556,7 @@ async def create_personal_chat(
     db.commit()
     db.refresh(new_chat)
     
-    return PersonalChatResponse(
-        id=new_chat.id,
-        user_id=new_chat.user_id,
-        title=new_chat.title,
-        thread_id=new_chat.thread_id,
-        is_active=new_chat.is_active,
-        created_at=new_chat.created_at,
-        updated_at=new_chat.updated_at,
-        message_count=0,
-        last_message_at=new_chat.created_at
-    )
+    return _personal_chat_response(new_chat)
 
 
 @router.put("/personal/chats/{chat_id}", response_model=PersonalChatResponse)
@@ -404,26 +587,7 @@ async def update_personal_chat(
     db.commit()
     db.refresh(chat)
     
-    # Get message count and last message time
-    message_count = db.query(ChatMessage).filter(
-        ChatMessage.thread_id == chat.thread_id
-    ).count()
-    
-    last_message = db.query(ChatMessage).filter(
-        ChatMessage.thread_id == chat.thread_id
-    ).order_by(ChatMessage.created_at.desc()).first()
-    
-    return PersonalChatResponse(
-        id=chat.id,
-        user_id=chat.user_id,
-        title=chat.title,
-        thread_id=chat.thread_id,
-        is_active=chat.is_active,
-        created_at=chat.created_at,
-        updated_at=chat.updated_at,
-        message_count=message_count,
-        last_message_at=last_message.created_at if last_message else chat.created_at
-    )
+    return _personal_chat_response(chat)
 
 
 @router.delete("/personal/chats/{chat_id}")
@@ -454,11 +618,14 @@ async def delete_personal_chat(
 @router.get("/personal/chats/{chat_id}/history", response_model=List[ChatMessageResponse])
 async def get_personal_chat_history(
     chat_id: int,
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=HISTORY_MAX_LIMIT),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get message history for a specific personal chat"""
+    """Get message history for a specific personal chat, a page at a time"""
     # Verify chat belongs to user
     chat = db.query(PersonalChat).filter(
         PersonalChat.id == chat_id,
@@ -473,11 +640,7 @@ async def get_personal_chat_history(
         )
     
     # Get messages for this chat
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.thread_id == chat.thread_id
-    ).order_by(ChatMessage.created_at.desc()).limit(limit).all()
-    
-    return messages[::-1]  # Return in chronological order
+    return _history_page(db, {"thread_id": chat.thread_id}, response, limit, before_id, after_id)
 
 
 @router.post("/personal/chats/{chat_id}/message", response_model=ChatMessageResponse)
@@ -511,22 +674,25 @@ async def send_message_to_personal_chat(
         )
         
         if result["success"]:
-            # Update chat's updated_at timestamp
-            chat.updated_at = func.now()
-            db.commit()
-            
             # Get the saved assistant message
             assistant_message = db.query(ChatMessage).filter(
                 ChatMessage.id == result["message_id"]
             ).first()
             
             return assistant_message
+        elif result.get("busy"):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=result["error"]
+            )
         else:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"AI service error: {result.get('error', 'Unknown error')}"
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in personal chat message endpoint: {str(e)}")
         raise HTTPException(
@@ -534,3 +700,31 @@ async def send_message_to_personal_chat(
             detail="Failed to process message in personal chat"
         )
 
+
+@router.post("/personal/chats/{chat_id}/message/stream")
+async def stream_message_to_personal_chat(
+    chat_id: int,
+    message_data: ChatMessageCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Send message to a specific personal chat and stream the answer as Server-Sent Events"""
+    chat = db.query(PersonalChat).filter(
+        PersonalChat.id == chat_id,
+        PersonalChat.user_id == current_user.id,
+        PersonalChat.is_active == True
+    ).first()
+    
+    if not chat:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat not found"
+        )
+    
+    # The chat's counters and updated_at are bumped along with the saved messages
+    return _sse_response(ai_service.stream_personal_assistant_message_to_thread(
+        user=current_user,
+        message=message_data.content,
+        thread_id=chat.thread_id,
+        db=db
+    ))
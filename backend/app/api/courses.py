@@ -14,6 +14,7 @@ from app.models.lesson import Lesson
 from app.models.user_lesson_progress import UserLessonProgress
 from app.models.user_course_progress import UserCourseProgress
 from app.schemas.course import CourseResponse, CourseCreate, CourseUpdate, CourseWithLessons
+from app.services.learning_snapshot import learning_snapshot
 
 router = APIRouter()
 
@@ -250,6 +251,7 @@ async def update_course(
     for field, value in update_data.items():
         setattr(course, field, value)
     
+    learning_snapshot.mark_course_stale(db, course_id)
     db.commit()
     db.refresh(course)
     
@@ -271,6 +273,7 @@ async def delete_course(
             detail="Course not found"
         )
     
+    learning_snapshot.mark_course_stale(db, course_id)
     db.delete(course)
     db.commit()
     
@@ -3,7 +3,7 @@ Lessons API endpoints
 """
 
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
 
 from app.core.security import get_current_active_user, get_current_admin_user, get_current_user_optional, check_course_access
@@ -14,6 +14,11 @@ from app.models.course import Course
 from app.models.user_course_progress import UserCourseProgress
 from app.models.user_lesson_progress import UserLessonProgress
 from app.schemas.lesson import LessonResponse, LessonCreate, LessonUpdate, LessonProgress
+from app.services.transcript_index import transcript_index
+from app.services.answer_cache import answer_cache
+from app.services.learning_snapshot import learning_snapshot
+from app.services.study_aids import study_aids
+from app.services.ai_service import ai_service
 
 router = APIRouter()
 
@@ -45,8 +50,14 @@ async def get_lesson(
             detail="Lesson not found"
         )
     
+    _check_lesson_access(lesson, current_user, db)
+    return lesson
+
+
+def _check_lesson_access(lesson: Lesson, current_user: Optional[User], db: Session):
+    """Raise unless current_user may view the lesson"""
+    
     # Get course information
-    from app.models.course import Course
     course = db.query(Course).filter(Course.id == lesson.course_id).first()
     if not course:
         raise HTTPException(
@@ -59,11 +70,11 @@ async def get_lesson(
     # 2. For premium lessons in premium courses, check course access
     # 3. For premium lessons in free courses, allow access
     if lesson.is_free:
-        return lesson
+        return
     
     if not course.is_premium:
         # Free course - all lessons accessible
-        return lesson
+        return
     
     # Premium course with premium lesson - check course access
     if not check_course_access(current_user, lesson.course_id, db):
@@ -71,8 +82,54 @@ async def get_lesson(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied. This lesson requires course purchase or subscription."
         )
+
+
+@router.get("/{lesson_id}/study-aids")
+async def get_lesson_study_aids(
+    lesson_id: int,
+    response: Response,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db)
+):
+    """Pre-generated summary, key points and quiz for a lesson.
     
-    return lesson
+    Answers 202 with the generation status while they are not ready yet. Signed-in
+    viewers start generation when it never ran or failed, within study_aids' retry limits.
+    """
+    
+    lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
+    if not lesson:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Lesson not found"
+        )
+    
+    _check_lesson_access(lesson, current_user, db)
+    
+    if not lesson.transcript:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Lesson has no transcript"
+        )
+    
+    aid = study_aids.get(lesson, db)
+    if aid is None or aid.status != "ready":
+        aid_status = study_aids.status(lesson, db)
+        # Anonymous callers never trigger LLM calls
+        if current_user is not None and study_aids.retry_due(lesson, db):
+            ai_service.schedule_study_aids(lesson.id)
+            aid_status = "pending"
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"lesson_id": lesson.id, "status": aid_status}
+    
+    return {
+        "lesson_id": lesson.id,
+        "status": aid.status,
+        "summary": aid.summary,
+        "key_points": aid.key_points or [],
+        "quiz": aid.quiz or [],
+        "generated_at": aid.generated_at
+    }
 
 
 @router.post("/", response_model=LessonResponse)
@@ -95,6 +152,9 @@ async def create_lesson(
     db.add(db_lesson)
     db.commit()
     db.refresh(db_lesson)
+    transcript_index.index_lesson(db_lesson.id, db_lesson.transcript)
+    if db_lesson.transcript:
+        ai_service.schedule_study_aids(db_lesson.id)
     
     # Update total lessons count for all user progress records
     progress_records = db.query(UserCourseProgress).filter(
@@ -110,6 +170,7 @@ async def create_lesson(
         if progress.total_lessons > 0:
             progress.progress_percentage = (progress.completed_lessons / progress.total_lessons) * 100
     
+    learning_snapshot.mark_course_stale(db, lesson_data.course_id)
     db.commit()
     
     return db_lesson
@@ -136,9 +197,17 @@ async def update_lesson(
     for field, value in update_data.items():
         setattr(lesson, field, value)
     
+    learning_snapshot.mark_course_stale(db, lesson.course_id)
     db.commit()
     db.refresh(lesson)
     
+    # Title and duration reach the prompt too, not just the transcript
+    await answer_cache.invalidate_lesson(lesson.id)
+    if "transcript" in update_data:
+        transcript_index.index_lesson(lesson.id, lesson.transcript)
+        if lesson.transcript:
+            ai_service.schedule_study_aids(lesson.id)
+    
     return lesson
 
 
@@ -160,6 +229,8 @@ async def delete_lesson(
     course_id = lesson.course_id
     db.delete(lesson)
     db.commit()
+    transcript_index.remove(lesson_id)
+    await answer_cache.invalidate_lesson(lesson_id)
     
     # Update total lessons count for all user progress records
     progress_records = db.query(UserCourseProgress).filter(
@@ -177,6 +248,7 @@ async def delete_lesson(
         else:
             progress.progress_percentage = 0
     
+    learning_snapshot.mark_course_stale(db, course_id)
     db.commit()
     
     return {"message": "Lesson deleted successfully"}
@@ -294,6 +366,7 @@ async def update_lesson_progress(
     else:
         progress.completed_at = None  # Reset course completion if not all lessons completed
     
+    learning_snapshot.apply_course_progress(db, progress)
     db.commit()
     db.refresh(progress)
     
@@ -3,7 +3,7 @@ Application configuration settings
 """
 
 import os
-from typing import List
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 
@@ -41,6 +41,98 @@ class Settings(BaseSettings):
     # OpenAI
     OPENAI_API_KEY: str = ""
     OPENAI_API_BASE: str = "https://api.openai.com/v1"
+    OPENAI_TIMEOUT: float = 60.0  # seconds per upstream request
+    OPENAI_CONNECT_TIMEOUT: float = 5.0
+    OPENAI_MAX_CONNECTIONS: int = 100  # Shared async connection pool size
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    
+    # Upstream routing across OpenAI-compatible bases (empty = OPENAI_API_BASE only)
+    OPENAI_API_BASES: List[str] = []  # Priority order; the Assistants API stays on OPENAI_API_BASE
+    CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures before an upstream is skipped
+    CIRCUIT_OPEN_SECONDS: float = 30.0  # Then a single probe request is let through
+    LLM_HEDGING_ENABLED: bool = False  # Duplicate slow requests to the next upstream
+    LLM_HEDGE_QUANTILE: float = 0.95
+    LLM_HEDGE_MIN_DELAY: float = 1.0  # Never hedge sooner than this
+    
+    AI_WARMUP_ON_STARTUP: bool = True  # Bootstrap the assistant in the background at startup
+    
+    # LLM provider
+    LLM_PROVIDER: str = "openai"  # openai or local (deterministic, offline)
+    LLM_MODEL: str = "gpt-3.5-turbo"
+    LLM_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    LOCAL_LLM_LATENCY: float = 0.5  # seconds to first token
+    LOCAL_LLM_TOKENS_PER_SECOND: float = 50.0
+    LOCAL_LLM_EMBEDDING_DIM: int = 256
+    
+    # LLM admission scheduler
+    LLM_MAX_CONCURRENCY: int = 16  # Concurrent upstream calls per worker
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY: float = 1.0
+    LLM_RETRY_MAX_DELAY: float = 30.0
+    
+    # Assistants API run polling
+    ASSISTANT_RUN_TIMEOUT: float = 60.0  # seconds before a run is cancelled
+    ASSISTANT_POLL_INITIAL_DELAY: float = 0.25
+    ASSISTANT_POLL_MAX_DELAY: float = 2.0
+    
+    # Lesson transcript retrieval
+    LESSON_CHUNK_WORDS: int = 150
+    LESSON_CHUNK_OVERLAP_WORDS: int = 30
+    LESSON_CONTEXT_TOP_K: int = 4
+    LESSON_CONTEXT_FULL_TRANSCRIPT_TOKENS: int = 1000  # Shorter transcripts are sent whole
+    
+    # Prompt assembly
+    LLM_MAX_COMPLETION_TOKENS: int = 1000
+    PROMPT_TOKEN_BUDGET: int = 3000  # gpt-3.5-turbo 4k context minus the completion
+    PROMPT_HISTORY_MESSAGES: int = 20  # Most recent messages considered for chat history
+    PROMPT_HISTORY_ITEM_MAX_TOKENS: int = 300  # One long answer can't crowd out the rest
+    
+    # Model routing by question complexity (strong tier uses LLM_MAX_COMPLETION_TOKENS)
+    LLM_ROUTING_ENABLED: bool = True  # Off: every chat call uses the strong tier
+    LLM_FAST_MODEL: str = ""  # Empty = LLM_MODEL
+    LLM_FAST_MAX_TOKENS: int = 500
+    LLM_STRONG_MODEL: str = ""  # Empty = LLM_MODEL
+    LLM_ROUTE_LONG_QUESTION_TOKENS: int = 60  # Longer questions go to the strong tier
+    LLM_ROUTE_LARGE_CONTEXT_TOKENS: int = 1500  # So do prompts with this much context
+    LLM_LATENCY_SLO_SECONDS: Dict[str, float] = {"lesson_chat": 8.0, "personal_chat": 8.0, "jarvis": 8.0}
+    LLM_FIRST_TOKEN_SLO_SECONDS: float = 2.0  # Streamed answers
+    
+    # Rolling conversation summaries
+    SUMMARY_KEEP_RECENT_MESSAGES: int = 6  # Newest messages always sent verbatim
+    SUMMARY_REFRESH_MESSAGES: int = 10  # Fold older messages once this many pile up past the tail
+    SUMMARY_MAX_BATCH_MESSAGES: int = 40  # Long existing threads are caught up in batches
+    SUMMARY_MAX_TOKENS: int = 300
+    SUMMARY_SHUTDOWN_TIMEOUT: float = 10.0  # seconds in-flight compactions get to finish on shutdown
+    
+    # Course materials sync
+    COURSE_MATERIALS_MANIFEST: str = "./course_materials_manifest.json"  # Uploaded file IDs and content hashes
+    COURSE_MATERIALS_UPLOAD_CONCURRENCY: int = 4
+    
+    # Per-thread serialization of chat messages
+    THREAD_QUEUE_BACKEND: str = "memory"  # memory (one worker) or redis (lock shared by all workers)
+    THREAD_QUEUE_TIMEOUT: float = 90.0  # Max wait behind earlier work on the same thread
+    THREAD_LOCK_TTL: int = 300  # seconds; frees a thread whose worker died mid-run
+    
+    # Pre-generated lesson study aids (summary, key points, quiz)
+    STUDY_AIDS_ENABLED: bool = True  # Generate in the background when a transcript changes
+    STUDY_AIDS_CONCURRENCY: int = 2
+    STUDY_AIDS_MAX_TOKENS: int = 1500
+    STUDY_AIDS_MAX_ATTEMPTS: int = 3  # Per transcript version, when retried by lesson viewers
+    STUDY_AIDS_RETRY_AFTER: int = 10 * 60  # seconds after a failed attempt; doubles with every attempt
+    STUDY_AIDS_PENDING_TIMEOUT: int = 15 * 60  # seconds; older pending rows were left by a dead worker
+    STUDY_AIDS_SHUTDOWN_TIMEOUT: float = 10.0  # seconds in-flight generations get to finish on shutdown
+    
+    # Chat message storage: monthly partitions (PostgreSQL) and the compressed archive
+    CHAT_PARTITIONS_AHEAD_MONTHS: int = 2  # Partitions created in advance of the current month
+    CHAT_ARCHIVE_AFTER_MONTHS: int = 12  # Whole months older than this move to the archive; 0 = never
+    CHAT_ARCHIVE_BATCH_MESSAGES: int = 5000  # Messages moved per transaction
+    CHAT_STORAGE_MAINTENANCE_INTERVAL: int = 6 * 60 * 60  # seconds; 0 = at startup and on demand only
+    
+    # Lesson-chat answer cache
+    ANSWER_CACHE_BACKEND: str = "redis"  # redis (falls back to memory) or memory
+    ANSWER_CACHE_TTL: int = 24 * 60 * 60  # seconds
+    ANSWER_CACHE_MAX_ENTRIES: int = 5000  # In-process LRU size
+    ANSWER_CACHE_MIN_QUESTION_CHARS: int = 12  # Shorter messages are treated as follow-ups
     
     # File Upload
     MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 100MB
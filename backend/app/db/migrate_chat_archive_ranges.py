@@ -0,0 +1,97 @@
+"""
+Migration script to add first_created_at and last_created_at to chat_message_archives
+Archive history pages skip the blocks outside the requested range before decompressing them.
+"""
+
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.models.chat_message_archive import ChatMessageArchive
+from app.services.chat_storage import _items, _item_position
+
+BACKFILL_BATCH = 500
+
+def run_migration():
+    """Run the migration to add the created_at range to chat_message_archives"""
+
+    # Create database engine
+    engine = create_engine(settings.DATABASE_URL)
+
+    # Create a session
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = SessionLocal()
+
+    try:
+        print("🔄 Starting migration to add created_at ranges to chat_message_archives...")
+
+        inspector = inspect(engine)
+        if not inspector.has_table("chat_message_archives"):
+            print("ℹ️ chat_message_archives does not exist yet; it is created with the columns")
+            return
+
+        existing_columns = {column["name"] for column in inspector.get_columns("chat_message_archives")}
+        timestamp_type = "TIMESTAMP WITH TIME ZONE" if engine.dialect.name == "postgresql" else "DATETIME"
+
+        for column in ("first_created_at", "last_created_at"):
+            if column not in existing_columns:
+                print(f"Adding {column} column...")
+                session.execute(text(f"ALTER TABLE chat_message_archives ADD COLUMN {column} {timestamp_type}"))
+                print(f"✅ Added {column} column")
+            else:
+                print(f"ℹ️ {column} column already exists")
+        session.commit()
+
+        print("Backfilling ranges from the archived blocks...")
+        filled = 0
+        while True:
+            blocks = session.query(ChatMessageArchive.id, ChatMessageArchive.payload).filter(
+                ChatMessageArchive.first_created_at.is_(None)
+            ).limit(BACKFILL_BATCH).all()
+            if not blocks:
+                break
+            for block in blocks:
+                items = _items(block)
+                session.query(ChatMessageArchive).filter(ChatMessageArchive.id == block.id).update({
+                    "first_created_at": _item_position(items[0])[0],
+                    "last_created_at": _item_position(items[-1])[0],
+                }, synchronize_session=False)
+            session.commit()
+            filled += len(blocks)
+        print(f"✅ Backfilled {filled} blocks")
+
+        if engine.dialect.name == "postgresql":
+            print("Making the range columns NOT NULL...")
+            session.execute(text(
+                "ALTER TABLE chat_message_archives "
+                "ALTER COLUMN first_created_at SET NOT NULL, "
+                "ALTER COLUMN last_created_at SET NOT NULL"
+            ))
+            session.commit()
+            print("✅ Range columns are NOT NULL")
+
+        print("🎉 Migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    print("Chat Archive Ranges Migration")
+    print("=" * 40)
+
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"\n❌ Migration failed with error: {e}")
+        sys.exit(1)
+
+    print("\n✅ All done! Archive pages now skip blocks outside their range.")
@@ -0,0 +1,60 @@
+"""
+Migration script to add the keyset pagination indexes to chat_messages
+New databases get them from the model; run this once on existing ones
+"""
+
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+
+INDEXES = {
+    "idx_chat_messages_thread_created": "chat_messages(thread_id, created_at, id)",
+    "idx_chat_messages_user_created": "chat_messages(user_id, created_at, id)",
+    "idx_chat_messages_user_lesson_created": "chat_messages(user_id, course_id, lesson_id, created_at, id)",
+}
+
+def run_migration():
+    """Create the (thread_id|user_id|lesson chat, created_at, id) indexes used by chat history pages"""
+    
+    # Create database engine
+    engine = create_engine(settings.DATABASE_URL)
+    
+    # Create a session
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = SessionLocal()
+    
+    try:
+        print("🔄 Starting migration to add chat history pagination indexes...")
+        
+        for name, target in INDEXES.items():
+            session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {target}"))
+            print(f"✅ Added index {name} on {target}")
+        
+        # Commit all changes
+        session.commit()
+        print("🎉 Migration completed successfully!")
+            
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    print("Chat History Indexes Migration")
+    print("=" * 40)
+    
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"\n❌ Migration failed with error: {e}")
+        sys.exit(1)
+    
+    print("\n✅ All done! Chat history pages now use keyset pagination indexes.")
@@ -0,0 +1,116 @@
+"""
+Migration script to add full-text search over chat_messages content and the chat archive
+Archive blocks get a search_text column (their distinct words), filled from the existing blocks.
+PostgreSQL: GIN indexes on to_tsvector('russian', content) and on to_tsvector('russian', search_text).
+SQLite: the chat_messages_fts and chat_message_archives_fts FTS5 tables with their sync triggers.
+New databases get these from the models and app startup; run this once on existing ones.
+"""
+
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.models.chat_message import SEARCH_CONFIG
+from app.models.chat_message_archive import ChatMessageArchive
+from app.services.chat_search import chat_search
+from app.services.chat_storage import _items, search_text
+
+BACKFILL_BATCH = 500
+
+def add_archive_search_text(engine, session):
+    """Add search_text to chat_message_archives and fill it for the blocks archived before it"""
+
+    inspector = inspect(engine)
+    if not inspector.has_table("chat_message_archives"):
+        print("ℹ️ chat_message_archives does not exist yet; it is created with search_text")
+        return
+
+    existing_columns = {column["name"] for column in inspector.get_columns("chat_message_archives")}
+    if "search_text" not in existing_columns:
+        print("Adding search_text column...")
+        session.execute(text("ALTER TABLE chat_message_archives ADD COLUMN search_text TEXT NOT NULL DEFAULT ''"))
+        session.commit()
+        print("✅ Added search_text column")
+    else:
+        print("ℹ️ search_text column already exists")
+
+    print("Filling search_text from the archived blocks...")
+    filled = 0
+    last_id = 0
+    while True:
+        blocks = session.query(ChatMessageArchive.id, ChatMessageArchive.payload).filter(
+            ChatMessageArchive.search_text == "",
+            ChatMessageArchive.id > last_id
+        ).order_by(ChatMessageArchive.id).limit(BACKFILL_BATCH).all()
+        if not blocks:
+            break
+        for block in blocks:
+            session.query(ChatMessageArchive).filter(ChatMessageArchive.id == block.id).update(
+                {"search_text": search_text(_items(block))}, synchronize_session=False
+            )
+        last_id = blocks[-1].id
+        session.commit()
+        filled += len(blocks)
+    print(f"✅ Filled search_text for {filled} blocks")
+
+def run_migration():
+    """Create the chat message and archive full-text indexes for the database's dialect"""
+
+    # Create database engine
+    engine = create_engine(settings.DATABASE_URL)
+
+    # Create a session
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = SessionLocal()
+
+    try:
+        print("🔄 Starting migration to add the chat search indexes...")
+
+        add_archive_search_text(engine, session)
+
+        if engine.dialect.name == "sqlite":
+            created = chat_search.ensure_index(engine)
+            for fts_table in created:
+                print(f"✅ Created {fts_table} and indexed the existing rows")
+            if not created:
+                print("ℹ️ Chat search tables already exist")
+        else:
+            # Must match search_vector() in the models, or searches won't use them
+            session.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_content_search
+                ON chat_messages USING GIN (to_tsvector('{SEARCH_CONFIG}', content))
+            """))
+            print(f"✅ Added GIN index idx_chat_messages_content_search ({SEARCH_CONFIG} configuration)")
+            session.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS idx_chat_message_archives_search
+                ON chat_message_archives USING GIN (to_tsvector('{SEARCH_CONFIG}', search_text))
+            """))
+            print(f"✅ Added GIN index idx_chat_message_archives_search ({SEARCH_CONFIG} configuration)")
+
+        # Commit all changes
+        session.commit()
+        print("🎉 Migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    print("Chat Search Index Migration")
+    print("=" * 40)
+
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"\n❌ Migration failed with error: {e}")
+        sys.exit(1)
+
+    print("\n✅ All done! GET /api/chat/search is backed by the full-text indexes.")
@@ -0,0 +1,123 @@
+"""
+Migration script to convert chat_messages into a table range-partitioned by month (PostgreSQL only)
+Rebuilds the table in one transaction: monthly partitions from the oldest message up to
+CHAT_PARTITIONS_AHEAD_MONTHS ahead plus a default partition, then copies the rows over.
+The table is locked while it runs, so run it in a maintenance window.
+"""
+
+import sys
+import os
+from datetime import datetime, timezone
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
+from app.core.config import settings
+from app.models.chat_message import ChatMessage
+from app.services.chat_storage import DEFAULT_PARTITION, month_start, partition_ddl
+
+COLUMNS = "id, user_id, course_id, lesson_id, thread_id, sender, content, message_data, created_at"
+
+def run_migration():
+    """Run the migration to partition chat_messages by month"""
+
+    # Create database engine
+    engine = create_engine(settings.DATABASE_URL)
+
+    if engine.dialect.name != "postgresql":
+        print(f"ℹ️ Partitioning needs PostgreSQL, database is {engine.dialect.name}; nothing to do")
+        return
+
+    # Create a session
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = SessionLocal()
+
+    try:
+        print("🔄 Starting migration to partition chat_messages by month...")
+
+        partitioned = session.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('chat_messages'))"
+        )).scalar()
+        if partitioned:
+            print("ℹ️ chat_messages is already partitioned")
+            return
+
+        session.execute(text("LOCK TABLE chat_messages IN ACCESS EXCLUSIVE MODE"))
+        session.execute(text("ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned"))
+
+        # Keep the ID sequence: it would be dropped with the old table
+        sequence = session.execute(text(
+            "SELECT pg_get_serial_sequence('chat_messages_unpartitioned', 'id')"
+        )).scalar()
+        session.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+
+        # The partition key must be part of the primary key
+        session.execute(text(f"""
+            CREATE TABLE chat_messages (
+                id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+                user_id INTEGER NOT NULL REFERENCES users(id),
+                course_id INTEGER REFERENCES courses(id),
+                lesson_id INTEGER REFERENCES lessons(id),
+                thread_id VARCHAR(255) NOT NULL,
+                sender VARCHAR(20) NOT NULL,
+                content TEXT NOT NULL,
+                message_data JSON,
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """))
+        print("✅ Created partitioned chat_messages")
+
+        oldest = session.execute(text("SELECT MIN(created_at) FROM chat_messages_unpartitioned")).scalar()
+        now = datetime.now(timezone.utc)
+        start = month_start(oldest or now)
+        last = month_start(now, settings.CHAT_PARTITIONS_AHEAD_MONTHS)
+        partitions = 0
+        while start <= last:
+            session.execute(text(partition_ddl(start)))
+            start = month_start(start, 1)
+            partitions += 1
+        session.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF chat_messages DEFAULT"))
+        print(f"✅ Created {partitions} monthly partitions and {DEFAULT_PARTITION}")
+
+        result = session.execute(text(f"""
+            INSERT INTO chat_messages ({COLUMNS})
+            SELECT id, user_id, course_id, lesson_id, thread_id, sender, content, message_data,
+                   COALESCE(created_at, now())
+            FROM chat_messages_unpartitioned
+        """))
+        print(f"✅ Copied {result.rowcount} messages")
+
+        session.execute(text("DROP TABLE chat_messages_unpartitioned"))
+        session.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY chat_messages.id"))
+
+        # Indexes declared on the model, created on every partition
+        for index in ChatMessage.__table__.indexes:
+            session.execute(CreateIndex(index))
+            print(f"✅ Added index {index.name}")
+
+        # Commit all changes
+        session.commit()
+        print("🎉 Migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    print("Chat Messages Partitioning Migration")
+    print("=" * 40)
+
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"\n❌ Migration failed with error: {e}")
+        sys.exit(1)
+
+    print("\n✅ All done! New partitions are created by the app's chat storage maintenance.")
@@ -0,0 +1,95 @@
+"""
+Migration script to add message_count, last_message_at and last_message_preview to personal_chats
+Adds the columns and the chat list index, then backfills the counters from chat_messages.
+Safe to re-run: the backfill recomputes every chat from its messages.
+"""
+
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.models.personal_chat import LAST_MESSAGE_PREVIEW_CHARS
+
+COLUMNS = {
+    "message_count": "INTEGER NOT NULL DEFAULT 0",
+    "last_message_at": "TIMESTAMP WITH TIME ZONE",
+    "last_message_preview": f"VARCHAR({LAST_MESSAGE_PREVIEW_CHARS})",
+}
+
+def run_migration():
+    """Run the migration to denormalize chat list counters onto personal_chats"""
+
+    # Create database engine
+    engine = create_engine(settings.DATABASE_URL)
+
+    # Create a session
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = SessionLocal()
+
+    try:
+        print("🔄 Starting migration to add chat counters to personal_chats...")
+
+        existing_columns = {column["name"] for column in inspect(engine).get_columns("personal_chats")}
+
+        for name, definition in COLUMNS.items():
+            if name not in existing_columns:
+                print(f"Adding {name} column...")
+                session.execute(text(f"ALTER TABLE personal_chats ADD COLUMN {name} {definition}"))
+                print(f"✅ Added {name} column")
+            else:
+                print(f"ℹ️ {name} column already exists")
+
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_personal_chats_user_active_updated
+            ON personal_chats(user_id, is_active, updated_at)
+        """))
+        print("✅ Added chat list index on user_id, is_active, updated_at")
+
+        # One statement, so every chat is consistent with the messages it saw
+        print("Backfilling counters from chat_messages...")
+        result = session.execute(text(f"""
+            UPDATE personal_chats SET
+                message_count = (
+                    SELECT COUNT(*) FROM chat_messages m
+                    WHERE m.thread_id = personal_chats.thread_id
+                ),
+                last_message_at = (
+                    SELECT MAX(m.created_at) FROM chat_messages m
+                    WHERE m.thread_id = personal_chats.thread_id
+                ),
+                last_message_preview = (
+                    SELECT SUBSTR(m.content, 1, {LAST_MESSAGE_PREVIEW_CHARS}) FROM chat_messages m
+                    WHERE m.thread_id = personal_chats.thread_id
+                    ORDER BY m.created_at DESC, m.id DESC
+                    LIMIT 1
+                )
+        """))
+        print(f"✅ Backfilled {result.rowcount} chats")
+
+        # Commit all changes
+        session.commit()
+        print("🎉 Migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    print("Personal Chats Counters Migration")
+    print("=" * 40)
+
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"\n❌ Migration failed with error: {e}")
+        sys.exit(1)
+
+    print("\n✅ All done! The chat list now reads counters from personal_chats.")
@@ -0,0 +1,59 @@
+"""
+Migration script to add the attempts column to lesson_study_aids
+Viewer-triggered study aid generation is capped and backed off by attempts per transcript version.
+"""
+
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+
+def run_migration():
+    """Run the migration to add attempts to lesson_study_aids"""
+    
+    # Create database engine
+    engine = create_engine(settings.DATABASE_URL)
+    
+    # Create a session
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = SessionLocal()
+    
+    try:
+        print("🔄 Starting migration to add attempts to lesson_study_aids...")
+        
+        existing_columns = {column["name"] for column in inspect(engine).get_columns("lesson_study_aids")}
+        
+        if "attempts" not in existing_columns:
+            print("Adding attempts column...")
+            session.execute(text("ALTER TABLE lesson_study_aids ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"))
+            print("✅ Added attempts column")
+        else:
+            print("ℹ️ attempts column already exists")
+        
+        # Commit all changes
+        session.commit()
+        print("🎉 Migration completed successfully!")
+            
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    print("Lesson Study Aid Attempts Migration")
+    print("=" * 40)
+    
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"\n❌ Migration failed with error: {e}")
+        sys.exit(1)
+    
+    print("\n✅ All done! Failed study aids are now retried with backoff.")
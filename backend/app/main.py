@@ -6,13 +6,22 @@ Main FastAPI application entry point
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
+from app.core.metrics import metrics
 from app.db.database import engine, Base
 from app.api import auth, courses, lessons, chat, users, admin
+from app.services.ai_service import ai_service
+from app.services.answer_cache import answer_cache
+from app.services.conversation_summary import conversation_summaries
+from app.services.course_materials import course_materials_sync
+from app.services.thread_queue import thread_queue
+from app.services.study_aids import study_aids
+from app.services.chat_storage import chat_storage
+from app.services.chat_search import chat_search
 
 
 @asynccontextmanager
@@ -25,10 +34,28 @@ async def lifespan(app: FastAPI):
     Base.metadata.create_all(bind=engine)
     print("📊 Database tables created")
     
+    # SQLite full-text search tables over chat messages and their archive (PostgreSQL uses GIN indexes)
+    if chat_search.ensure_index(engine):
+        print("🔎 Chat search index built")
+    
+    # Upcoming chat_messages partitions and the archive of old months
+    chat_storage.start()
+    
+    # Assistant bootstrap talks to OpenAI, so don't hold up startup for it
+    if settings.AI_WARMUP_ON_STARTUP:
+        ai_service.warm_up()
+    
     yield
     
     # Shutdown
     print("🛑 Shutting down ExpoVisionED Backend...")
+    await course_materials_sync.aclose()
+    await conversation_summaries.aclose()
+    await study_aids.aclose()
+    await chat_storage.aclose()
+    await ai_service.aclose()
+    await answer_cache.aclose()
+    await thread_queue.aclose()
 
 
 # Create FastAPI application
@@ -48,6 +75,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor"],  # Chat history page cursors
 )
 
 # Mount static files
@@ -65,6 +93,28 @@ async def health_check():
     return {"status": "healthy", "service": "ExpoVisionED Backend"}
 
 
+# Readiness endpoint
+@app.get("/ready")
+async def readiness_check():
+    """Ready once the AI assistant warm-up has finished (chat completions work either way).
+    
+    Providers without the Assistants API report "disabled" and never warm up.
+    """
+    assistant_status = ai_service.assistant_status
+    ready = assistant_status in ("ready", "unavailable", "disabled") or not settings.AI_WARMUP_ON_STARTUP
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", "assistant": assistant_status}
+    )
+
+
+# Metrics endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics for this worker"""
+    return metrics.render_prometheus()
+
+
 # Root endpoint
 @app.get("/")
 async def root():
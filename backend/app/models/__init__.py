@@ -7,6 +7,10 @@ from .user_course_progress import UserCourseProgress
 from .user_lesson_progress import UserLessonProgress
 from .chat_message import ChatMessage
 from .personal_chat import PersonalChat
+from .user_learning_snapshot import UserLearningSnapshot
+from .conversation_summary import ConversationSummary
+from .lesson_study_aid import LessonStudyAid
+from .chat_message_archive import ChatMessageArchive
 
 __all__ = [
     "User",
@@ -15,6 +19,10 @@ __all__ = [
     "UserCourseProgress",
     "UserLessonProgress",
     "ChatMessage",
-    "PersonalChat"
+    "PersonalChat",
+    "UserLearningSnapshot",
+    "ConversationSummary",
+    "LessonStudyAid",
+    "ChatMessageArchive"
 ]
 
@@ -2,12 +2,20 @@
 Chat Message model
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index, literal_column
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
 from app.db.database import Base
 
+# PostgreSQL text search configuration of message content (stemming and stop words)
+SEARCH_CONFIG = "russian"
+
+
+def search_vector(content):
+    """to_tsvector over content; the search query must use this exact expression to hit the GIN index"""
+    return func.to_tsvector(literal_column(f"'{SEARCH_CONFIG}'"), content)
+
 
 class ChatMessage(Base):
     """Chat Message model"""
@@ -28,6 +36,18 @@ class ChatMessage(Base):
     # Relationships
     # user = relationship("User", back_populates="chat_messages")
     
+    # Keyset pagination of history walks (created_at, id) within a thread, a user or a lesson chat;
+    # the lesson index also serves per-course message counts by its (user_id, course_id) prefix.
+    # Full-text search uses a GIN index on PostgreSQL and the chat_messages_fts table on SQLite
+    __table_args__ = (
+        Index("idx_chat_messages_thread_created", "thread_id", "created_at", "id"),
+        Index("idx_chat_messages_user_created", "user_id", "created_at", "id"),
+        Index("idx_chat_messages_user_lesson_created", "user_id", "course_id", "lesson_id", "created_at", "id"),
+        Index(
+            "idx_chat_messages_content_search", search_vector(content), postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
+    
     def __repr__(self):
         return f"<ChatMessage(id={self.id}, sender='{self.sender}', user_id={self.user_id}, lesson_id={self.lesson_id})>"
 
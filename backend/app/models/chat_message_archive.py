@@ -0,0 +1,45 @@
+"""
+Chat Message Archive model
+"""
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, LargeBinary, Index
+from sqlalchemy.sql import func
+from app.db.database import Base
+from app.models.chat_message import search_vector
+
+
+class ChatMessageArchive(Base):
+    """Archived chat messages of one thread and month, stored as one compressed block"""
+    __tablename__ = "chat_message_archives"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # Same scope columns as ChatMessage, so history filters apply to whole blocks
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=True)
+    thread_id = Column(String(255), nullable=False)
+    month = Column(String(7), nullable=False)  # YYYY-MM (UTC) the messages were written in
+    message_count = Column(Integer, nullable=False)
+    first_message_id = Column(Integer, nullable=False)  # ID range, to find a cursor's block
+    last_message_id = Column(Integer, nullable=False)
+    first_created_at = Column(DateTime(timezone=True), nullable=False)  # Time range, to skip blocks outside a page
+    last_created_at = Column(DateTime(timezone=True), nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed JSON list of messages, oldest first
+    search_text = Column(Text, nullable=False, default="")  # Distinct words of the messages, to find blocks worth searching
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("idx_chat_message_archives_thread_month", "thread_id", "month"),
+        Index("idx_chat_message_archives_user_month", "user_id", "course_id", "lesson_id", "month"),
+        Index("idx_chat_message_archives_message_ids", "last_message_id", "first_message_id"),
+        # Full-text search over search_text; chat_message_archives_fts stands in on SQLite
+        Index(
+            "idx_chat_message_archives_search", search_vector(search_text), postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
+    
+    def __repr__(self):
+        return f"<ChatMessageArchive(thread_id='{self.thread_id}', month='{self.month}', message_count={self.message_count})>"
@@ -0,0 +1,30 @@
+"""
+Lesson Study Aid model
+"""
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+
+class LessonStudyAid(Base):
+    """Pre-generated summary, key points and quiz for one lesson transcript"""
+    __tablename__ = "lesson_study_aids"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id", ondelete="CASCADE"), nullable=False, unique=True, index=True)
+    transcript_version = Column(String(64), nullable=False)  # transcript_version() the aids were generated from
+    status = Column(String(20), nullable=False, default="pending")  # pending, ready, failed
+    summary = Column(Text, nullable=True)
+    key_points = Column(JSON, nullable=True)  # List of strings
+    quiz = Column(JSON, nullable=True)  # List of {question, options, answer, explanation}
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")  # Generations started for transcript_version
+    generated_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<LessonStudyAid(lesson_id={self.lesson_id}, status='{self.status}')>"
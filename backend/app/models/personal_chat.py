@@ -1,10 +1,13 @@
 """
 Personal Chat model
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
 from app.db.database import Base
 
+# Characters of the last message kept for the chat list
+LAST_MESSAGE_PREVIEW_CHARS = 200
+
 
 class PersonalChat(Base):
     __tablename__ = "personal_chats"
@@ -15,9 +18,19 @@ class PersonalChat(Base):
     thread_id = Column(String(255), unique=True, nullable=False, index=True)
     is_active = Column(Boolean, default=True)
     
+    # Denormalized from chat_messages, kept in step by AIService._save_exchange
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    last_message_preview = Column(String(LAST_MESSAGE_PREVIEW_CHARS), nullable=True)
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    # The chat list: a user's active chats, most recently updated first
+    __table_args__ = (
+        Index("idx_personal_chats_user_active_updated", "user_id", "is_active", "updated_at"),
+    )
+    
     def __repr__(self):
-        return f"<PersonalChat(id={self.id}, title='{self.title}', user_id={self.user_id})>" 
\ No newline at end of file
+        return f"<PersonalChat(id={self.id}, title='{self.title}', user_id={self.user_id})>" 
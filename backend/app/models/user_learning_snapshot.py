@@ -0,0 +1,24 @@
+"""
+User Learning Snapshot model
+"""
+
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Boolean, JSON
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+
+class UserLearningSnapshot(Base):
+    """Materialized per-user learning summary read by the personal assistant"""
+    __tablename__ = "user_learning_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True, index=True)
+    data = Column(JSON, nullable=False)  # courses, lesson_activity, recent_questions
+    is_stale = Column(Boolean, default=False, nullable=False)  # Rebuilt from scratch on next read
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<UserLearningSnapshot(user_id={self.user_id}, is_stale={self.is_stale})>"
@@ -58,3 +58,8 @@ class LessonChatHistoryResponse(BaseModel):
     course_title: str
     total_course_messages: int
 
+
+
+class ChatSearchResult(ChatMessageResponse):
+    """Chat search hit: the message with its matched terms highlighted in snippet"""
+    snippet: str
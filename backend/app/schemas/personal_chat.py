@@ -20,6 +20,7 @@ class PersonalChatResponse(BaseModel):
     updated_at: datetime
     message_count: Optional[int] = 0  # Количество сообщений в чате
     last_message_at: Optional[datetime] = None  # Время последнего сообщения
+    last_message_preview: Optional[str] = None  # Начало последнего сообщения
 
     class Config:
         from_attributes = True
@@ -4,65 +4,185 @@ AI Service for OpenAI Assistants API integration
 
 import os
 import json
+import hashlib
+import math
+import time
+import random
 import asyncio
-from typing import Optional, List, Dict, Any
-from openai import OpenAI
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Hashable, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+from sqlalchemy import or_, func
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import SessionLocal
+from app.services.transcript_index import transcript_index, count_tokens, CHARS_PER_TOKEN
+from app.services.answer_cache import answer_cache
+from app.services.llm_scheduler import llm_scheduler
+from app.services.llm_provider import create_provider, Completion
+from app.services.llm_instrumentation import llm_calls
+from app.services.model_router import model_router, RouteDecision
+from app.services.single_flight import SingleFlight
+from app.services.prompt_builder import Prompt, completion_usage
+from app.services.prompt_templates import LESSON_CHAT_TEMPLATE, PERSONAL_CHAT_TEMPLATE
+from app.services.learning_snapshot import learning_snapshot
+from app.services.conversation_summary import conversation_summaries
+from app.services.course_materials import course_materials_sync, MaterialsSyncJob
+from app.services.thread_queue import thread_queue, ThreadBusyError
+from app.services.study_aids import study_aids
 from app.models.user import User
 from app.models.course import Course
 from app.models.lesson import Lesson
 from app.models.chat_message import ChatMessage
+from app.models.personal_chat import PersonalChat, LAST_MESSAGE_PREVIEW_CHARS
+
+
+RUN_PENDING_STATUSES = ("queued", "in_progress", "cancelling")
+
+ASSISTANT_ID_FILE = "assistant_id.txt"
+
+# How long to wait before retrying a failed assistant bootstrap
+ASSISTANT_INIT_RETRY_INTERVAL = 30.0
 
+THREAD_BUSY_MESSAGE = "Предыдущее сообщение в этом чате еще обрабатывается. Подождите немного и попробуйте снова."
+
+run_polls = metrics.histogram(
+    "assistant_run_polls",
+    "runs.retrieve calls made while waiting for an assistant run",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64)
+)
+run_wait_seconds = metrics.histogram(
+    "assistant_run_wait_seconds",
+    "Time spent waiting for an assistant run to finish"
+)
+lesson_context_tokens = metrics.histogram(
+    "lesson_context_tokens",
+    "Estimated transcript tokens sent per lesson-chat prompt",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+lesson_context_tokens_saved = metrics.counter(
+    "lesson_context_tokens_saved_total",
+    "Estimated transcript tokens not sent thanks to chunk retrieval"
+)
+personal_context_seconds = metrics.histogram(
+    "personal_context_seconds",
+    "Wall time of the pre-LLM reads for a personal-assistant prompt"
+)
+personal_context_read_seconds = metrics.histogram(
+    "personal_context_read_seconds",
+    "Time of each concurrent personal-assistant context read"
+)
+lesson_flights = SingleFlight("lesson_chat")
 
 class AIService:
     """AI Service for managing OpenAI Assistants"""
     
     def __init__(self):
-        self.client = OpenAI(
+        # No network calls here: the assistant is bootstrapped lazily or by warm_up()
+        
+        # Shared connection pool for all request-time calls, so completions
+        # never block the event loop and reuse keep-alive connections
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+        )
+        # Assistants API state (threads, runs, files) lives on the primary upstream only
+        self.async_client = self._openai_client(settings.OPENAI_API_BASE)
+        # Chat completions, streaming and embeddings, routed across all configured upstreams
+        self.provider = create_provider(self._openai_client)
+        self.assistant_id = None
+        self._assistant_task: Optional[asyncio.Task] = None
+        self._assistant_retry_at = 0.0
+    
+    def _openai_client(self, base_url: str) -> AsyncOpenAI:
+        """Client for one upstream base URL over the shared connection pool"""
+        return AsyncOpenAI(
             api_key=settings.OPENAI_API_KEY,
-            base_url=settings.OPENAI_API_BASE,
+            base_url=base_url,
             default_headers={
                 "OpenAI-Beta": "assistants=v2"
-            }
+            },
+            http_client=self.http_client,
+            max_retries=0  # Retries are handled by the LLM scheduler
         )
-        self.assistant_id = None
-        self._initialize_assistant()
     
-    def _initialize_assistant(self):
+    async def aclose(self):
+        """Close pooled HTTP connections"""
+        if self._assistant_task is not None and not self._assistant_task.done():
+            self._assistant_task.cancel()
+        await self.async_client.close()
+    
+    @property
+    def assistant_status(self) -> str:
+        """not_started, initializing, ready, unavailable or disabled"""
+        if not self.provider.supports_assistants:
+            return "disabled"
+        if self.assistant_id:
+            return "ready"
+        if self._assistant_task is None:
+            return "not_started"
+        if not self._assistant_task.done():
+            return "initializing"
+        return "unavailable"
+    
+    def warm_up(self):
+        """Bootstrap the assistant in the background, without delaying startup"""
+        if self._assistant_task is None and self.provider.supports_assistants:
+            self._assistant_task = asyncio.get_running_loop().create_task(self._initialize_assistant())
+    
+    async def ensure_assistant(self) -> Optional[str]:
+        """Assistant ID, bootstrapping it on first use; None if unavailable"""
+        if self.assistant_id or not self.provider.supports_assistants:
+            return self.assistant_id
+        
+        task = self._assistant_task
+        if task is None or (task.done() and time.monotonic() >= self._assistant_retry_at):
+            task = self._assistant_task = asyncio.get_running_loop().create_task(self._initialize_assistant())
+        
+        # Shielded so one cancelled request doesn't abort the bootstrap for everyone
+        await asyncio.shield(task)
+        return self.assistant_id
+    
+    async def _initialize_assistant(self):
         """Initialize or get existing assistant"""
         try:
-            # Try to get existing assistant ID from environment or file
-            assistant_file = "assistant_id.txt"
-            if os.path.exists(assistant_file):
-                with open(assistant_file, 'r') as f:
-                    self.assistant_id = f.read().strip()
+            # Try to get existing assistant ID from file
+            if os.path.exists(ASSISTANT_ID_FILE):
+                with open(ASSISTANT_ID_FILE, 'r') as f:
+                    assistant_id = f.read().strip()
                     
                 # Verify assistant exists
                 try:
-                    self.client.beta.assistants.retrieve(self.assistant_id)
+                    await self.async_client.beta.assistants.retrieve(assistant_id)
+                    self.assistant_id = assistant_id
                     print(f"✅ Using existing assistant: {self.assistant_id}")
                     return
                 except Exception:
                     print("❌ Existing assistant not found, creating new one...")
-                    self.assistant_id = None
             
             # Create new assistant
-            self.assistant_id = self._create_assistant()
+            assistant_id = await self._create_assistant()
             
             # Save assistant ID
-            with open(assistant_file, 'w') as f:
-                f.write(self.assistant_id)
+            with open(ASSISTANT_ID_FILE, 'w') as f:
+                f.write(assistant_id)
+            self.assistant_id = assistant_id
                 
         except Exception as e:
             print(f"❌ Error initializing assistant: {e}")
             self.assistant_id = None
+            self._assistant_retry_at = time.monotonic() + ASSISTANT_INIT_RETRY_INTERVAL
     
-    def _create_assistant(self) -> str:
+    async def _create_assistant(self) -> str:
         """Create a new OpenAI assistant"""
         try:
-            assistant = self.client.beta.assistants.create(
+            assistant = await self.async_client.beta.assistants.create(
                 name="ExpoVisionED AI Tutor",
                 instructions="""
                 Ты - дружелюбный AI-преподаватель платформы ExpoVisionED. 
@@ -88,7 +208,7 @@ class AIService:
                 - Поощряй любознательность
                 - Помогай структурировать знания
                 """,
-                model="gpt-3.5-turbo",
+                model=settings.LLM_MODEL,
                 tools=[{"type": "file_search"}]
             )
             
@@ -99,20 +219,20 @@ class AIService:
             print(f"❌ Error creating assistant: {e}")
             raise
     
-    def create_thread(self, user_id: int, lesson_id: Optional[int] = None) -> Optional[str]:
+    async def create_thread(self, user_id: int, lesson_id: Optional[int] = None) -> Optional[str]:
         """Create a new conversation thread"""
         try:
-            thread = self.client.beta.threads.create()
+            thread = await self.async_client.beta.threads.create()
             print(f"✅ Created thread {thread.id} for user {user_id}, lesson {lesson_id}")
             return thread.id
         except Exception as e:
             print(f"❌ Error creating thread: {e}")
             return None
     
-    def add_message_to_thread(self, thread_id: str, content: str, role: str = "user") -> bool:
+    async def add_message_to_thread(self, thread_id: str, content: str, role: str = "user") -> bool:
         """Add a message to the thread"""
         try:
-            self.client.beta.threads.messages.create(
+            await self.async_client.beta.threads.messages.create(
                 thread_id=thread_id,
                 role=role,
                 content=content
@@ -122,29 +242,74 @@ class AIService:
             print(f"❌ Error adding message to thread: {e}")
             return False
     
-    def run_assistant(self, thread_id: str) -> Optional[str]:
+    async def _wait_for_run(self, thread_id: str, run):
+        """Poll a run until it leaves the pending states, with jittered exponential backoff.
+        
+        Gives up (and cancels the run upstream) once ASSISTANT_RUN_TIMEOUT passes
+        or when the calling task is cancelled.
+        """
+        started = time.monotonic()
+        deadline = started + settings.ASSISTANT_RUN_TIMEOUT
+        delay = settings.ASSISTANT_POLL_INITIAL_DELAY
+        polls = 0
+        outcome = "error"
+        
+        try:
+            while run.status in RUN_PENDING_STATUSES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    outcome = "timeout"
+                    await self._cancel_run(thread_id, run.id)
+                    return run
+                
+                # Full jitter keeps concurrent waiters from polling in lockstep
+                await asyncio.sleep(min(random.uniform(0, delay), remaining))
+                run = await self.async_client.beta.threads.runs.retrieve(
+                    thread_id=thread_id,
+                    run_id=run.id
+                )
+                polls += 1
+                delay = min(delay * 2, settings.ASSISTANT_POLL_MAX_DELAY)
+            
+            outcome = run.status
+            return run
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            await asyncio.shield(self._cancel_run(thread_id, run.id))
+            raise
+        finally:
+            run_polls.observe(polls, status=outcome)
+            run_wait_seconds.observe(time.monotonic() - started, status=outcome)
+    
+    async def _cancel_run(self, thread_id: str, run_id: str):
+        """Cancel a run upstream so it stops consuming tokens"""
+        try:
+            await self.async_client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            print(f"❌ Error cancelling run {run_id}: {e}")
+    
+    async def run_assistant(self, thread_id: str, user_id: Optional[int] = None) -> Optional[str]:
         """Run the assistant on a thread and get response"""
+        call = None
         try:
-            if not self.assistant_id:
+            assistant_id = await self.ensure_assistant()
+            if not assistant_id:
                 return "Извините, AI-ассистент временно недоступен."
             
             # Create and run the assistant
-            run = self.client.beta.threads.runs.create(
+            call = llm_calls.start("assistants_run", settings.LLM_MODEL, user_id)
+            run = await llm_scheduler.run(user_id, call.wrap(lambda: self.async_client.beta.threads.runs.create(
                 thread_id=thread_id,
-                assistant_id=self.assistant_id
-            )
+                assistant_id=assistant_id
+            )))
             
             # Wait for completion
-            while run.status in ['queued', 'in_progress']:
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread_id,
-                    run_id=run.id
-                )
-                asyncio.sleep(1)
+            run = await self._wait_for_run(thread_id, run)
+            call.finish("ok" if run.status == 'completed' else run.status, *self._run_usage(run))
             
             if run.status == 'completed':
                 # Get the latest message
-                messages = self.client.beta.threads.messages.list(
+                messages = await self.async_client.beta.threads.messages.list(
                     thread_id=thread_id,
                     limit=1
                 )
@@ -156,43 +321,106 @@ class AIService:
             
             return "Извините, произошла ошибка при обработке вашего запроса."
             
-        except Exception as e:
+        except BaseException as e:
+            if call is not None:
+                call.fail(e)
+            if not isinstance(e, Exception):
+                raise
             print(f"❌ Error running assistant: {e}")
             return "Извините, произошла ошибка при обработке вашего запроса."
     
-    def _get_lesson_context(self, lesson_id: int, db: Session) -> str:
-        """Get lesson context for AI assistant"""
+    def _run_usage(self, run) -> Tuple[Optional[int], Optional[int]]:
+        """(prompt, completion) tokens of a finished run, if the API reported them"""
+        usage = getattr(run, "usage", None)
+        if isinstance(usage, dict):
+            return usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if usage is not None:
+            return usage.prompt_tokens, usage.completion_tokens
+        return None, None
+    
+    def _release_connection(self, db: Session):
+        """End the read transaction so the pooled DB connection isn't held while waiting on the LLM.
+        
+        Loaded objects are not expired, otherwise the next attribute access (e.g. user.id)
+        would silently check a connection out again and hold it across the await.
+        """
+        expire_on_commit = db.expire_on_commit
+        db.expire_on_commit = False
+        try:
+            db.commit()
+        finally:
+            db.expire_on_commit = expire_on_commit
+    
+    def _get_lesson_context(self, lesson_id: int, db: Session, question: Optional[str] = None) -> Tuple[str, str]:
+        """Get lesson context for AI assistant as (lesson context, question excerpts).
+        
+        The lesson context is the same for every question on the lesson. Long transcripts
+        are represented by the lesson summary there, plus the chunks most relevant to the
+        question as separate excerpts. The transcript comes last, so the prompt builder
+        can cut it without losing the header.
+        """
+        excerpts = ""
         try:
             lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
             if not lesson:
-                return ""
+                return "", ""
             
             course = db.query(Course).filter(Course.id == lesson.course_id).first()
-            context = f"КОНТЕКСТ УРОКА:\n"
-            context += f"Курс: {course.title if course else 'Неизвестный курс'}\n"
+            context = f"Курс: {course.title if course else 'Неизвестный курс'}\n"
             context += f"Урок: {lesson.title}\n"
+            context += f"Длительность: {lesson.duration or 0} секунд\n\n"
             
             if lesson.transcript:
-                context += f"Содержание урока:\n{lesson.transcript}\n"
+                transcript_tokens = count_tokens(lesson.transcript)
+                index = transcript_index.get(lesson.id, lesson.transcript)
+                
+                if question and transcript_tokens > settings.LESSON_CONTEXT_FULL_TRANSCRIPT_TOKENS:
+                    # Pre-generated summary covers the whole lesson, the excerpts the question
+                    context += study_aids.context_text(study_aids.get(lesson, db))
+                    chunk_ids = index.search(question, settings.LESSON_CONTEXT_TOP_K)
+                    excerpts = "\n...\n".join(index.chunks[i] for i in chunk_ids)
+                    context_tokens = count_tokens(excerpts)
+                    mode = "retrieval"
+                else:
+                    context += f"Содержание урока:\n{lesson.transcript}\n"
+                    context_tokens = transcript_tokens
+                    mode = "full"
+                
+                lesson_context_tokens.observe(context_tokens, mode=mode)
+                lesson_context_tokens_saved.inc(transcript_tokens - context_tokens)
             else:
                 context += "Содержание урока: Транскрипт урока не предоставлен\n"
             
-            context += f"Длительность: {lesson.duration or 0} секунд\n"
-            context += "\nОтвечай на вопросы студента основываясь на этом содержании урока."
-            
-            return context
+            return context, excerpts
             
         except Exception as e:
             print(f"❌ Error getting lesson context: {e}")
-            return ""
+            return "", ""
     
-    def _get_course_chat_history(self, user_id: int, course_id: int, db: Session, limit: int = 10) -> List[Dict]:
-        """Get recent chat history for the course to maintain context"""
+    def _get_course_chat_history(
+        self,
+        user_id: int,
+        course_id: int,
+        db: Session,
+        limit: int = settings.PROMPT_HISTORY_MESSAGES,
+        thread_id: Optional[str] = None,
+        covered_message_id: int = 0
+    ) -> List[Dict]:
+        """Get recent chat history for the course to maintain context.
+        
+        Messages of thread_id up to covered_message_id are skipped, as its summary already covers them.
+        """
         try:
-            messages = db.query(ChatMessage).filter(
+            query = db.query(ChatMessage).filter(
                 ChatMessage.user_id == user_id,
                 ChatMessage.course_id == course_id
-            ).order_by(ChatMessage.created_at.desc()).limit(limit).all()
+            )
+            if thread_id and covered_message_id:
+                query = query.filter(or_(
+                    ChatMessage.thread_id != thread_id,
+                    ChatMessage.id > covered_message_id
+                ))
+            messages = query.order_by(ChatMessage.created_at.desc()).limit(limit).all()
             
             history = []
             for msg in reversed(messages):  # Reverse to get chronological order
@@ -207,6 +435,185 @@ class AIService:
             print(f"❌ Error getting course chat history: {e}")
             return []
 
+    def _build_lesson_messages(
+        self,
+        user: User,
+        message: str,
+        lesson_id: int,
+        course_id: int,
+        db: Session
+    ) -> Tuple[Prompt, Optional[str]]:
+        """Build the lesson-chat prompt with lesson context and course memory.
+        
+        Returns the prompt and its answer cache key, which is None once any per-user
+        course history or thread summary went into it.
+        """
+        # Get lesson context relevant to the question
+        lesson_context, excerpts = self._get_lesson_context(lesson_id, db, question=message)
+        
+        # Older messages of this lesson thread come as a rolling summary
+        thread_id = f"lesson_{lesson_id}_user_{user.id}"
+        summary = conversation_summaries.get(thread_id, db)
+        
+        # Get course chat history for context
+        course_history = self._get_course_chat_history(
+            user.id, course_id, db,
+            thread_id=thread_id,
+            covered_message_id=summary.covered_message_id if summary else 0
+        )
+        history_lines = [
+            f"{'Студент' if hist_msg['role'] == 'user' else 'Преподаватель'}: {hist_msg['content']}"
+            for hist_msg in course_history
+        ]
+        
+        prompt = LESSON_CHAT_TEMPLATE.render(
+            lesson_context=lesson_context,
+            summary=summary.summary if summary else "",
+            history=history_lines,
+            lesson_excerpts=excerpts,
+            question=message
+        )
+        if course_history or summary:
+            return prompt, None
+        return prompt, self._lesson_question_key(lesson_id, message, lesson_context + excerpts)
+    
+    def _save_exchange(
+        self,
+        db: Session,
+        user: User,
+        thread_id: str,
+        message: str,
+        ai_response: str,
+        course_id: Optional[int] = None,
+        lesson_id: Optional[int] = None,
+        user_message_data: Optional[Dict[str, Any]] = None,
+        assistant_message_data: Optional[Dict[str, Any]] = None
+    ) -> ChatMessage:
+        """Save user message and AI response in one transaction, with the chat list's counters"""
+        user_message = ChatMessage(
+            user_id=user.id,
+            course_id=course_id,
+            lesson_id=lesson_id,
+            thread_id=thread_id,
+            sender="user",
+            content=message,
+            message_data=user_message_data
+        )
+        db.add(user_message)
+        db.flush()
+        
+        if lesson_id is not None:
+            learning_snapshot.record_lesson_message(db, user.id, lesson_id, message)
+        
+        assistant_message = ChatMessage(
+            user_id=user.id,
+            course_id=course_id,
+            lesson_id=lesson_id,
+            thread_id=thread_id,
+            sender="assistant",
+            content=ai_response,
+            message_data=assistant_message_data
+        )
+        db.add(assistant_message)
+        
+        if course_id is None and lesson_id is None:
+            self._touch_personal_chat(db, thread_id, ai_response)
+        db.commit()
+        
+        # Fold older messages into the thread summary once enough have piled up
+        conversation_summaries.schedule(thread_id, user.id, self._complete)
+        
+        return assistant_message
+    
+    def _touch_personal_chat(self, db: Session, thread_id: str, last_message: str):
+        """Count an exchange on the thread's PersonalChat, if it has one; part of the caller's transaction"""
+        # Increment in SQL, so concurrent exchanges on other workers aren't lost
+        db.query(PersonalChat).filter(PersonalChat.thread_id == thread_id).update({
+            PersonalChat.message_count: PersonalChat.message_count + 2,
+            PersonalChat.last_message_at: func.now(),
+            PersonalChat.last_message_preview: last_message[:LAST_MESSAGE_PREVIEW_CHARS],
+            PersonalChat.updated_at: func.now(),
+        }, synchronize_session=False)
+    
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        user_key: Hashable,
+        endpoint: str,
+        max_tokens: int = settings.LLM_MAX_COMPLETION_TOKENS,
+        route: Optional[RouteDecision] = None
+    ) -> Completion:
+        """Chat completion through the admission scheduler, instrumented per entry point.
+        
+        A route overrides the model and max_tokens with its tier's.
+        """
+        model = None
+        if route is not None:
+            model, max_tokens = route.tier.model, route.tier.max_tokens
+        call = llm_calls.start(endpoint, self.provider.resolve_model(model), user_key)
+        try:
+            completion = await llm_scheduler.run(
+                user_key, call.wrap(lambda: self.provider.complete(messages, max_tokens, model=model))
+            )
+        except BaseException as e:
+            call.fail(e)
+            raise
+        
+        if route is not None:
+            model_router.observe(endpoint, route, "complete", time.monotonic() - call.started)
+        if completion.prompt_tokens is not None:
+            call.succeed(completion.prompt_tokens, completion.completion_tokens, completion.cached_tokens)
+        else:
+            call.succeed(sum(count_tokens(m["content"]) for m in messages), count_tokens(completion.content))
+        return completion
+    
+    async def _stream_completion(
+        self,
+        messages: List[Dict[str, str]],
+        user_id: int,
+        endpoint: str,
+        route: RouteDecision
+    ) -> AsyncIterator[str]:
+        """Yield completion text deltas; closing the generator aborts the upstream request"""
+        def open_stream():
+            return self.provider.open_stream(messages, route.tier.max_tokens, model=route.tier.model)
+        
+        call = llm_calls.start(endpoint, self.provider.resolve_model(route.tier.model), user_id)
+        chars = 0
+        try:
+            # The admission slot is held until the stream is fully consumed
+            async with llm_scheduler.admitted(user_id, call.wrap(open_stream)) as stream:
+                try:
+                    async for delta in stream:
+                        if call.first_token_at is None:
+                            call.first_token()
+                            model_router.observe(endpoint, route, "first_token", call.first_token_at - call.started)
+                        chars += len(delta)
+                        yield delta
+                finally:
+                    # Runs on normal completion and on client cancellation alike
+                    await stream.aclose()
+        except BaseException as e:
+            call.fail(e)
+            raise
+        
+        # Streams don't report usage, so both counts are estimates
+        call.succeed(
+            sum(count_tokens(m["content"]) for m in messages),
+            math.ceil(chars / CHARS_PER_TOKEN)
+        )
+
+    def _lesson_question_key(self, lesson_id: int, message: str, lesson_context: str) -> Optional[str]:
+        """Key identifying a question about one rendering of the lesson context, or None if the lesson is missing.
+        
+        The context hash covers everything about the course and lesson that reaches the prompt,
+        so any edit to them moves questions to new keys.
+        """
+        if not lesson_context:
+            return None
+        version = hashlib.sha1(lesson_context.encode("utf-8")).hexdigest()[:12]
+        return answer_cache.make_key(lesson_id, version, message)
+
     async def send_lesson_message(
         self, 
         user: User, 
@@ -216,81 +623,77 @@ class AIService:
         db: Session
     ) -> Dict[str, Any]:
         """Send message to AI assistant with lesson context and course memory"""
+        thread_id = f"lesson_{lesson_id}_user_{user.id}"
+        # Don't hold a DB connection while queued behind another message
+        self._release_connection(db)
         try:
-            # Get lesson context
-            lesson_context = self._get_lesson_context(lesson_id, db)
-            
-            # Get course chat history for context
-            course_history = self._get_course_chat_history(user.id, course_id, db)
-            
-            # Create thread ID for this lesson if user doesn't have one
-            thread_id = f"lesson_{lesson_id}_user_{user.id}"
-            
-            # Create a contextual message with lesson info and course history
-            contextual_message = f"{lesson_context}\n\nИСТОРИЯ ЧАТА ПО КУРСУ:\n"
-            
-            # Add recent course history
-            for hist_msg in course_history[-5:]:  # Last 5 messages for context
-                role_name = "Студент" if hist_msg["role"] == "user" else "Преподаватель"
-                contextual_message += f"{role_name}: {hist_msg['content']}\n"
-            
-            contextual_message += f"\nВОПРОС СТУДЕНТА: {message}"
-            
-            # Use OpenAI Chat Completions API directly for better control
-            try:
-                completion = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {
-                            "role": "system", 
-                            "content": """Ты - дружелюбный AI-преподаватель платформы ExpoVisionED. 
-                            Отвечай на вопросы студентов по материалам уроков, используя предоставленный контекст.
-                            Помни предыдущие разговоры по курсу и связывай новые вопросы с ранее изученным материалом.
-                            Всегда отвечай на русском языке дружелюбно и профессионально."""
-                        },
-                        {"role": "user", "content": contextual_message}
-                    ],
-                    temperature=0.7,
-                    max_tokens=1000
-                )
+            async with thread_queue.hold(thread_id, "lesson_chat"):
+                prompt, question_key = self._build_lesson_messages(user, message, lesson_id, course_id, db)
+                messages = prompt.messages
+                route = model_router.route("lesson_chat", message, prompt)
                 
-                ai_response = completion.choices[0].message.content
+                # Serve repeated questions about the same lesson from the cache, unless the
+                # prompt carries this student's course history or thread summary
+                cache_key = question_key if answer_cache.is_cacheable(message) else None
+                self._release_connection(db)
+                cached_answer = await answer_cache.get(cache_key) if cache_key else None
+                if cached_answer is not None:
+                    assistant_message = self._save_exchange(
+                        db, user, thread_id, message, cached_answer,
+                        course_id=course_id,
+                        lesson_id=lesson_id,
+                        assistant_message_data={"model": self.provider.model, "lesson_context": True, "cached": True}
+                    )
+                    return {
+                        "success": True,
+                        "message": cached_answer,
+                        "message_id": assistant_message.id
+                    }
                 
-            except Exception as e:
-                print(f"❌ Error with OpenAI completion: {e}")
-                ai_response = "Извините, произошла ошибка при обработке вашего запроса. Попробуйте еще раз."
-            
-            # Save user message to database
-            user_message = ChatMessage(
-                user_id=user.id,
-                course_id=course_id,
-                lesson_id=lesson_id,
-                thread_id=thread_id,
-                sender="user",
-                content=message
-            )
-            db.add(user_message)
-            db.commit()
-            
-            # Save AI response to database
-            assistant_message = ChatMessage(
-                user_id=user.id,
-                course_id=course_id,
-                lesson_id=lesson_id,
-                thread_id=thread_id,
-                sender="assistant",
-                content=ai_response,
-                message_data={"model": "gpt-3.5-turbo", "lesson_context": True}
-            )
-            db.add(assistant_message)
-            db.commit()
-            
-            return {
-                "success": True,
-                "message": ai_response,
-                "message_id": assistant_message.id
-            }
+
+                # Use OpenAI Chat Completions API directly for better control
+                shared = False
+                usage = prompt.usage_data()
+                try:
+                    if question_key:
+                        # Prompt carries nothing user-specific: share one call among identical questions
+                        completion, shared = await lesson_flights.do(
+                            question_key, lambda: self._complete(messages, user.id, "lesson_chat", route=route)
+                        )
+                    else:
+                        completion, shared = await self._complete(messages, user.id, "lesson_chat", route=route), False
+                
+                    ai_response = completion.content
+                    usage = completion_usage(completion, prompt)
+                
+                    if cache_key and not shared:
+                        await answer_cache.set(cache_key, ai_response)
+                
+                except Exception as e:
+                    print(f"❌ Error with OpenAI completion: {e}")
+                    ai_response = "Извините, произошла ошибка при обработке вашего запроса. Попробуйте еще раз."
+                
+                assistant_message = self._save_exchange(
+                    db, user, thread_id, message, ai_response,
+                    course_id=course_id,
+                    lesson_id=lesson_id,
+                    assistant_message_data={
+                        "model": self.provider.resolve_model(route.tier.model),
+                        "lesson_context": True,
+                        "coalesced": shared,
+                        **route.message_data(),
+                        **usage
+                    }
+                )
+                
+                return {
+                    "success": True,
+                    "message": ai_response,
+                    "message_id": assistant_message.id
+                }
             
+        except ThreadBusyError:
+            return {"success": False, "busy": True, "message": THREAD_BUSY_MESSAGE}
         except Exception as e:
             print(f"❌ Error in send_lesson_message: {e}")
             return {
@@ -298,59 +701,81 @@ class AIService:
                 "message": "Произошла ошибка при обработке сообщения"
             }
 
-    def upload_course_materials(self, db: Session) -> bool:
-        """Upload course materials to assistant for knowledge base"""
+    async def stream_lesson_message(
+        self,
+        user: User,
+        message: str,
+        lesson_id: int,
+        course_id: int,
+        db: Session
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream AI answer about a lesson as delta events, saving both messages once finished"""
+        thread_id = f"lesson_{lesson_id}_user_{user.id}"
+        self._release_connection(db)
         try:
-            if not self.assistant_id:
-                return False
-            
-            # Get all courses with lessons
-            courses = db.query(Course).filter(Course.is_published == True).all()
-            
-            for course in courses:
-                # Create course content file
-                course_content = self._generate_course_content(course, db)
-                
-                if course_content:
-                    # Save to temporary file
-                    filename = f"course_{course.id}_{course.title.replace(' ', '_')}.txt"
-                    filepath = os.path.join(settings.STATIC_DIR, filename)
-                    
-                    with open(filepath, 'w', encoding='utf-8') as f:
-                        f.write(course_content)
-                    
-                    # Upload to OpenAI
-                    try:
-                        with open(filepath, 'rb') as f:
-                            file = self.client.files.create(
-                                file=f,
-                                purpose='assistants'
-                            )
-                        
-                        # Attach file to assistant
-                        self.client.beta.assistants.update(
-                            assistant_id=self.assistant_id,
-                            tool_resources={
-                                "file_search": {
-                                    "vector_store_ids": []
-                                }
-                            }
-                        )
-                        
-                        print(f"✅ Uploaded course materials: {course.title}")
-                        
-                    except Exception as e:
-                        print(f"❌ Error uploading course {course.title}: {e}")
-                    
-                    # Clean up temporary file
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-            
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error uploading course materials: {e}")
-            return False
+            async with thread_queue.hold(thread_id, "lesson_chat"):
+                prompt, question_key = self._build_lesson_messages(user, message, lesson_id, course_id, db)
+                route = model_router.route("lesson_chat", message, prompt)
+                
+                # Personalized prompts are neither answered from nor stored in the shared cache
+                cache_key = question_key if answer_cache.is_cacheable(message) else None
+                self._release_connection(db)
+                cached_answer = await answer_cache.get(cache_key) if cache_key else None
+                if cached_answer is not None:
+                    assistant_message = self._save_exchange(
+                        db, user, thread_id, message, cached_answer,
+                        course_id=course_id,
+                        lesson_id=lesson_id,
+                        assistant_message_data={"model": self.provider.model, "lesson_context": True, "cached": True}
+                    )
+                    yield {"type": "delta", "content": cached_answer}
+                    yield {"type": "done", "message_id": assistant_message.id}
+                    return
+                
+                parts = []
+                try:
+                    async for delta in self._stream_completion(prompt.messages, user.id, "lesson_chat", route):
+                        parts.append(delta)
+                        yield {"type": "delta", "content": delta}
+                except Exception as e:
+                    print(f"❌ Error streaming lesson completion: {e}")
+                    yield {"type": "error", "message": "Произошла ошибка при обработке сообщения"}
+                    return
+                
+                ai_response = "".join(parts)
+                if cache_key:
+                    await answer_cache.set(cache_key, ai_response)
+                
+                assistant_message = self._save_exchange(
+                    db, user, thread_id, message, ai_response,
+                    course_id=course_id,
+                    lesson_id=lesson_id,
+                    assistant_message_data={
+                        "model": self.provider.resolve_model(route.tier.model),
+                        "lesson_context": True,
+                        "streamed": True,
+                        **route.message_data(),
+                        **completion_usage(None, prompt, ai_response)
+                    }
+                )
+                yield {"type": "done", "message_id": assistant_message.id}
+        except ThreadBusyError:
+            yield {"type": "error", "message": THREAD_BUSY_MESSAGE}
+
+    def schedule_study_aids(self, lesson_id: int):
+        """Regenerate a lesson's study aids in the background after its transcript changed"""
+        study_aids.schedule(lesson_id, self._complete)
+    
+    def refresh_study_aids(self, db: Session) -> int:
+        """Schedule study aids for every lesson missing current ones; returns how many"""
+        return study_aids.schedule_stale(db, self._complete)
+    
+    async def upload_course_materials(self) -> Optional[MaterialsSyncJob]:
+        """Start an incremental background sync of course materials to the assistant"""
+        assistant_id = await self.ensure_assistant()
+        if not assistant_id:
+            return None
+        return course_materials_sync.start(self.async_client, assistant_id, self._generate_course_content)
     
     def _generate_course_content(self, course: Course, db: Session) -> str:
         """Generate text content for a course"""
@@ -387,60 +812,68 @@ class AIService:
         lesson_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """Send message to AI assistant and get response"""
+        # One Assistants thread per user, which rejects a second concurrent run
+        self._release_connection(db)
         try:
-            # Get or create thread for user
-            thread_id = user.ai_thread_id
-            if not thread_id:
-                thread_id = self.create_thread(user.id)
-                if thread_id:
-                    user.ai_thread_id = thread_id
-                    db.commit()
-                else:
+            async with thread_queue.hold(f"assistant_user_{user.id}", "assistant"):
+                # Get or create thread for user
+                thread_id = user.ai_thread_id
+                if not thread_id:
+                    thread_id = await self.create_thread(user.id)
+                    if thread_id:
+                        user.ai_thread_id = thread_id
+                        db.commit()
+                    else:
+                        return {
+                            "success": False,
+                            "message": "Не удалось создать сессию чата"
+                        }
+                
+                # Save user message to database
+                user_message = ChatMessage(
+                    user_id=user.id,
+                    course_id=course_id,
+                    lesson_id=lesson_id,
+                    thread_id=thread_id,
+                    sender="user",
+                    content=message
+                )
+                db.add(user_message)
+                if lesson_id is not None:
+                    learning_snapshot.record_lesson_message(db, user.id, lesson_id, message)
+                db.commit()
+                
+                # Add message to OpenAI thread
+                if not await self.add_message_to_thread(thread_id, message):
                     return {
                         "success": False,
-                        "message": "Не удалось создать сессию чата"
+                        "message": "Ошибка отправки сообщения"
                     }
-            
-            # Save user message to database
-            user_message = ChatMessage(
-                user_id=user.id,
-                course_id=course_id,
-                lesson_id=lesson_id,
-                thread_id=thread_id,
-                sender="user",
-                content=message
-            )
-            db.add(user_message)
-            db.commit()
-            
-            # Add message to OpenAI thread
-            if not self.add_message_to_thread(thread_id, message):
+                
+                # Get AI response
+                ai_response = await self.run_assistant(thread_id, user.id)
+                
+                # Save AI response to database
+                assistant_message = ChatMessage(
+                    user_id=user.id,
+                    course_id=course_id,
+                    lesson_id=lesson_id,
+                    thread_id=thread_id,
+                    sender="assistant",
+                    content=ai_response,
+                    message_data={"model": settings.LLM_MODEL}
+                )
+                db.add(assistant_message)
+                db.commit()
+                
                 return {
-                    "success": False,
-                    "message": "Ошибка отправки сообщения"
+                    "success": True,
+                    "message": ai_response,
+                    "message_id": assistant_message.id
                 }
             
-            # Get AI response
-            ai_response = self.run_assistant(thread_id)
-            
-            # Save AI response to database
-            assistant_message = ChatMessage(
-                user_id=user.id,
-                course_id=course_id,
-                lesson_id=lesson_id,
-                thread_id=thread_id,
-                sender="assistant",
-                content=ai_response,
-                message_data={"model": "gpt-3.5-turbo"}
-            )
-            db.add(assistant_message)
-            db.commit()
-            
-            return {
-                "success": True,
-                "message": ai_response,
-                "message_id": assistant_message.id
-            }
+        except ThreadBusyError:
+            return {"success": False, "busy": True, "message": THREAD_BUSY_MESSAGE}
             
         except Exception as e:
             print(f"❌ Error in send_message: {e}")
@@ -449,22 +882,13 @@ class AIService:
                 "message": "Произошла ошибка при обработке сообщения"
             }
 
-    def _get_user_progress_context(self, user: User, db: Session) -> str:
+    def _get_user_progress_context(self, user: User, snapshot: Dict[str, Any]) -> str:
         """Get user progress context for personal assistant"""
-        from app.models.user_course_progress import UserCourseProgress
-        from app.models.user_lesson_progress import UserLessonProgress
-        from app.models.course import Course
-        from app.models.lesson import Lesson
-        
-        # Get user's enrolled courses
-        enrolled_courses = db.query(Course).join(
-            UserCourseProgress
-        ).filter(UserCourseProgress.user_id == user.id).all()
-        
         progress_context = f"ИНФОРМАЦИЯ О СТУДЕНТЕ:\n"
         progress_context += f"Имя: {user.name}\n"
         progress_context += f"Email: {user.email}\n\n"
         
+        enrolled_courses = list(snapshot["courses"].values())
         if not enrolled_courses:
             progress_context += "СТАТУС: Студент пока не записан ни на один курс.\n"
             return progress_context
@@ -472,56 +896,33 @@ class AIService:
         progress_context += f"ЗАПИСАН НА КУРСЫ ({len(enrolled_courses)}):\n"
         
         for course in enrolled_courses:
-            # Get course progress
-            course_progress = db.query(UserCourseProgress).filter(
-                UserCourseProgress.user_id == user.id,
-                UserCourseProgress.course_id == course.id
-            ).first()
-            
-            # Get all lessons in course
-            total_lessons = db.query(Lesson).filter(Lesson.course_id == course.id).count()
-            
-            # Get completed lessons
-            completed_lessons = db.query(UserLessonProgress).join(Lesson).filter(
-                UserLessonProgress.user_id == user.id,
-                UserLessonProgress.completed == True,
-                Lesson.course_id == course.id
-            ).count()
-            
+            completed_lessons = course["completed"]
+            total_lessons = course["total"]
             completion_rate = (completed_lessons / total_lessons * 100) if total_lessons > 0 else 0
             
-            progress_context += f"\n📚 {course.title}\n"
+            progress_context += f"\n📚 {course['title']}\n"
             progress_context += f"   Прогресс: {completed_lessons}/{total_lessons} уроков ({completion_rate:.1f}%)\n"
             
-            if course_progress:
-                progress_context += f"   Начат: {course_progress.created_at.strftime('%d.%m.%Y')}\n"
-                if course_progress.completed_at:
-                    progress_context += f"   Завершен: {course_progress.completed_at.strftime('%d.%m.%Y')}\n"
-                else:
-                    progress_context += f"   Статус: В процессе изучения\n"
+            if course["started_at"]:
+                progress_context += f"   Начат: {course['started_at']}\n"
+            if course["completed_at"]:
+                progress_context += f"   Завершен: {course['completed_at']}\n"
+            else:
+                progress_context += f"   Статус: В процессе изучения\n"
         
         return progress_context
 
-    def _get_user_learning_insights(self, user: User, db: Session) -> str:
+    def _get_user_learning_insights(self, snapshot: Dict[str, Any]) -> str:
         """Analyze user's learning patterns from lesson chats"""
         
-        # Get recent chat messages from lessons
-        recent_messages = db.query(ChatMessage).filter(
-            ChatMessage.user_id == user.id,
-            ChatMessage.lesson_id.isnot(None),
-            ChatMessage.sender == 'user'
-        ).order_by(ChatMessage.created_at.desc()).limit(20).all()
-        
+        recent_messages = snapshot["recent_questions"]
         if not recent_messages:
             return "\nАНАЛИЗ ОБУЧЕНИЯ: Пока нет данных о взаимодействии с уроками.\n"
         
         insights = "\nАНАЛИЗ ОБУЧЕНИЯ:\n"
         
         # Analyze question patterns
-        question_topics = []
-        for msg in recent_messages:
-            if any(word in msg.content.lower() for word in ['как', 'что', 'почему', 'зачем', 'когда']):
-                question_topics.append(msg.content[:100])
+        question_topics = [msg["text"] for msg in recent_messages if msg["is_question"]]
         
         if question_topics:
             insights += f"Часто задаваемые вопросы ({len(question_topics)} последних):\n"
@@ -529,24 +930,83 @@ class AIService:
                 insights += f"{i}. {topic}...\n"
         
         # Get lessons where user was most active
-        from sqlalchemy import func
-        lesson_activity = db.query(
-            Lesson.title,
-            func.count(ChatMessage.id).label('message_count')
-        ).join(ChatMessage, Lesson.id == ChatMessage.lesson_id).filter(
-            ChatMessage.user_id == user.id,
-            ChatMessage.sender == 'user'
-        ).group_by(Lesson.id, Lesson.title).order_by(
-            func.count(ChatMessage.id).desc()
-        ).limit(3).all()
+        lesson_activity = sorted(
+            snapshot["lesson_activity"].values(), key=lambda a: a["count"], reverse=True
+        )[:3]
         
         if lesson_activity:
             insights += f"\nНаиболее активные уроки:\n"
-            for lesson_title, msg_count in lesson_activity:
-                insights += f"• {lesson_title}: {msg_count} вопросов\n"
+            for activity in lesson_activity:
+                insights += f"• {activity['title']}: {activity['count']} вопросов\n"
         
         return insights
 
+    def _read_in_session(self, name: str, read: Callable[[Session], Any]) -> Any:
+        """Run read on its own short-lived session; called from a worker thread"""
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            return read(db)
+        finally:
+            db.close()
+            personal_context_read_seconds.observe(time.monotonic() - started, read=name)
+
+    def _read_personal_history(self, user_id: int, thread_id: str, db: Session) -> Tuple[str, List[str]]:
+        """Thread summary text and the verbatim messages written after it"""
+        # Older messages come as a rolling summary, only the newer tail verbatim
+        summary = conversation_summaries.get(thread_id, db)
+        
+        # Get recent chat history for this specific thread
+        recent_chat = db.query(ChatMessage).filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.thread_id == thread_id,
+            ChatMessage.course_id.is_(None),  # Personal assistant messages have no course_id
+            ChatMessage.lesson_id.is_(None),  # Personal assistant messages have no lesson_id
+            ChatMessage.id > (summary.covered_message_id if summary else 0)
+        ).order_by(ChatMessage.created_at.desc()).limit(settings.PROMPT_HISTORY_MESSAGES).all()
+        history_lines = [
+            f"{'Студент' if msg.sender == 'user' else 'Ассистент'}: {msg.content}"
+            for msg in reversed(recent_chat)  # Chronological order
+        ]
+        return summary.summary if summary else "", history_lines
+
+    async def _build_personal_messages(
+        self,
+        user: User,
+        message: str,
+        thread_id: str
+    ) -> Prompt:
+        """Build the personal assistant prompt with user progress and thread history.
+        
+        The learning snapshot and the thread history are independent reads, so they
+        run concurrently on separate pooled connections rather than one after another
+        on the request session.
+        """
+        user_id = user.id
+        started = time.monotonic()
+        snapshot, (summary_text, history_lines) = await asyncio.gather(
+            asyncio.to_thread(
+                self._read_in_session, "snapshot",
+                lambda db: learning_snapshot.get(user_id, db)
+            ),
+            asyncio.to_thread(
+                self._read_in_session, "history",
+                lambda db: self._read_personal_history(user_id, thread_id, db)
+            )
+        )
+        personal_context_seconds.observe(time.monotonic() - started)
+        
+        progress_context = self._get_user_progress_context(user, snapshot)
+        learning_insights = self._get_user_learning_insights(snapshot)
+        
+        return PERSONAL_CHAT_TEMPLATE.render(
+            progress=progress_context,
+            insights=learning_insights.strip(),
+            summary=summary_text,
+            history=history_lines,
+            question=message
+        )
+
     async def send_personal_assistant_message(
         self, 
         user: User, 
@@ -557,109 +1017,37 @@ class AIService:
         
         # Generate unique thread ID for personal assistant
         thread_id = f"personal_assistant_user_{user.id}"
-        
-        # Get user progress context
-        progress_context = self._get_user_progress_context(user, db)
-        learning_insights = self._get_user_learning_insights(user, db)
-        
-        # Get recent personal assistant chat history
-        recent_chat = db.query(ChatMessage).filter(
-            ChatMessage.user_id == user.id,
-            ChatMessage.thread_id == thread_id,
-            ChatMessage.course_id.is_(None),  # Personal assistant messages have no course_id
-            ChatMessage.lesson_id.is_(None)   # Personal assistant messages have no lesson_id
-        ).order_by(ChatMessage.created_at.desc()).limit(10).all()
-        
-        # Build context message
-        contextual_message = f"""ПЕРСОНАЛЬНЫЙ AI-АССИСТЕНТ
-{progress_context}
-{learning_insights}
-
-ПОСЛЕДНИЕ СООБЩЕНИЯ В ЛИЧНОМ ЧАТЕ:
-"""
-        
-        for msg in reversed(recent_chat[-5:]):  # Last 5 messages in chronological order
-            role_name = "Студент" if msg.sender == "user" else "Ассистент"
-            contextual_message += f"{role_name}: {msg.content}\n"
-        
-        contextual_message += f"\nНОВОЕ СООБЩЕНИЕ СТУДЕНТА: {message}"
+        self._release_connection(db)
         
         try:
-            # Use Chat Completions API for personal assistant
-            completion = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": """Ты - персональный AI-ассистент для обучения на платформе ExpoVisionED. У тебя есть полная информация о прогрессе студента, его курсах, пройденных уроках и активности.
-
-ТВОЯ ЗАДАЧА:
-- Анализировать прогресс студента и давать конкретные рекомендации
-- Помогать с планированием обучения
-- Мотивировать к продолжению изучения курсов
-- Отвечать на вопросы о контенте курсов
-- Предлагать оптимальные стратегии обучения
-
-СТРОГИЕ ПРАВИЛА ОБЩЕНИЯ:
-- НИКОГДА не используй слова "Привет", "Здравствуй" или любые приветствия в ответах
-- НИКОГДА не говори "рад видеть" или подобные фразы
-- СРАЗУ переходи к сути вопроса
-- Если история чата пустая, просто представь свои возможности БЕЗ приветствия
-- Будь конкретным и полезным
-- Анализируй данные и давай персональные советы
-- Отвечай кратко, но информативно
-
-НЕПРАВИЛЬНО: "Привет! Рад видеть твой интерес к обучению..."
-ПРАВИЛЬНО: "После анализа твоего прогресса на курсе..."
-
-ТВОИ ВОЗМОЖНОСТИ:
-- Видишь все курсы студента и прогресс по ним
-- Знаешь какие уроки пройдены, а какие нет
-- Анализируешь вопросы из урочных чатов
-- Можешь определить сложные темы для студента
-- Предлагаешь персональный план развития
-
-Отвечай на русском языке. Будь наставником, а не просто чат-ботом! ЗАПОМНИ: никаких приветствий!"""
-                    },
-                    {"role": "user", "content": contextual_message}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            ai_response = completion.choices[0].message.content
-            
-            # Save user message
-            user_message = ChatMessage(
-                user_id=user.id,
-                thread_id=thread_id,
-                sender="user",
-                content=message,
-                course_id=None,  # Personal assistant has no course
-                lesson_id=None,  # Personal assistant has no lesson
-                message_data={"type": "personal_assistant"}
-            )
-            db.add(user_message)
-            db.flush()
-            
-            # Save assistant response
-            assistant_message = ChatMessage(
-                user_id=user.id,
-                thread_id=thread_id,
-                sender="assistant",
-                content=ai_response,
-                course_id=None,  # Personal assistant has no course
-                lesson_id=None,  # Personal assistant has no lesson
-                message_data={"type": "personal_assistant", "model": "gpt-3.5-turbo"}
-            )
-            db.add(assistant_message)
-            db.commit()
+            async with thread_queue.hold(thread_id, "jarvis"):
+                prompt = await self._build_personal_messages(user, message, thread_id)
+                
+                # Use Chat Completions API for personal assistant
+                route = model_router.route("jarvis", message, prompt)
+                completion = await self._complete(prompt.messages, user.id, "jarvis", route=route)
+                
+                ai_response = completion.content
+                
+                assistant_message = self._save_exchange(
+                    db, user, thread_id, message, ai_response,
+                    user_message_data={"type": "personal_assistant"},
+                    assistant_message_data={
+                        "type": "personal_assistant",
+                        "model": self.provider.resolve_model(route.tier.model),
+                        **route.message_data(),
+                        **completion_usage(completion, prompt)
+                    }
+                )
+                
+                return {
+                    "success": True, 
+                    "message": ai_response, 
+                    "message_id": assistant_message.id
+                }
             
-            return {
-                "success": True, 
-                "message": ai_response, 
-                "message_id": assistant_message.id
-            }
+        except ThreadBusyError:
+            return {"success": False, "busy": True, "error": THREAD_BUSY_MESSAGE}
             
         except Exception as e:
             db.rollback()
@@ -677,107 +1065,35 @@ class AIService:
         db: Session
     ) -> Dict[str, Any]:
         """Send message to personal assistant using specific thread_id"""
+        self._release_connection(db)
         
         try:
-            # Get user progress and learning insights
-            progress_context = self._get_user_progress_context(user, db)
-            learning_insights = self._get_user_learning_insights(user, db)
-            
-            # Get recent chat history for this specific thread
-            recent_chat = db.query(ChatMessage).filter(
-                ChatMessage.user_id == user.id,
-                ChatMessage.thread_id == thread_id,
-                ChatMessage.course_id.is_(None),
-                ChatMessage.lesson_id.is_(None)
-            ).order_by(ChatMessage.created_at.desc()).limit(10).all()
-            
-            # Build context message
-            contextual_message = f"""ПЕРСОНАЛЬНЫЙ AI-АССИСТЕНТ
-{progress_context}
-{learning_insights}
-
-ПОСЛЕДНИЕ СООБЩЕНИЯ В ЭТОМ ЧАТЕ:
-"""
-            
-            for msg in reversed(recent_chat[-5:]):  # Last 5 messages in chronological order
-                role_name = "Студент" if msg.sender == "user" else "Ассистент"
-                contextual_message += f"{role_name}: {msg.content}\n"
-            
-            contextual_message += f"\nНОВОЕ СООБЩЕНИЕ СТУДЕНТА: {message}"
-            
-            # Use Chat Completions API for personal assistant
-            completion = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": """Ты - персональный AI-ассистент для обучения на платформе ExpoVisionED. У тебя есть полная информация о прогрессе студента, его курсах, пройденных уроках и активности.
-
-ТВОЯ ЗАДАЧА:
-- Анализировать прогресс студента и давать конкретные рекомендации
-- Помогать с планированием обучения
-- Мотивировать к продолжению изучения курсов
-- Отвечать на вопросы о контенте курсов
-- Предлагать оптимальные стратегии обучения
-
-СТРОГИЕ ПРАВИЛА ОБЩЕНИЯ:
-- НИКОГДА не используй слова "Привет", "Здравствуй" или любые приветствия в ответах
-- НИКОГДА не говори "рад видеть" или подобные фразы
-- СРАЗУ переходи к сути вопроса
-- Если история чата пустая, просто представь свои возможности БЕЗ приветствия
-- Будь конкретным и полезным
-- Анализируй данные и давай персональные советы
-- Отвечай кратко, но информативно
-
-НЕПРАВИЛЬНО: "Привет! Рад видеть твой интерес к обучению..."
-ПРАВИЛЬНО: "После анализа твоего прогресса на курсе..."
-
-ТВОИ ВОЗМОЖНОСТИ:
-- Видишь все курсы студента и прогресс по ним
-- Знаешь какие уроки пройдены, а какие нет
-- Анализируешь вопросы из урочных чатов
-- Можешь определить сложные темы для студента
-- Предлагаешь персональный план развития
-
-Отвечай на русском языке. Будь наставником, а не просто чат-ботом! ЗАПОМНИ: никаких приветствий!"""
-                    },
-                    {"role": "user", "content": contextual_message}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            ai_response = completion.choices[0].message.content
-            
-            # Save user message
-            user_message = ChatMessage(
-                user_id=user.id,
-                thread_id=thread_id,
-                sender="user",
-                content=message,
-                course_id=None,  # Personal assistant messages have no course_id
-                lesson_id=None   # Personal assistant messages have no lesson_id
-            )
-            db.add(user_message)
-            db.flush()  # Get the ID
-            
-            # Save assistant message
-            assistant_message = ChatMessage(
-                user_id=user.id,
-                thread_id=thread_id,
-                sender="assistant",
-                content=ai_response,
-                course_id=None,  # Personal assistant messages have no course_id
-                lesson_id=None   # Personal assistant messages have no lesson_id
-            )
-            db.add(assistant_message)
-            db.commit()
+            async with thread_queue.hold(thread_id, "personal_chat"):
+                prompt = await self._build_personal_messages(user, message, thread_id)
+                
+                # Use Chat Completions API for personal assistant
+                route = model_router.route("personal_chat", message, prompt)
+                completion = await self._complete(prompt.messages, user.id, "personal_chat", route=route)
+                
+                ai_response = completion.content
+                
+                assistant_message = self._save_exchange(
+                    db, user, thread_id, message, ai_response,
+                    assistant_message_data={
+                        "model": self.provider.resolve_model(route.tier.model),
+                        **route.message_data(),
+                        **completion_usage(completion, prompt)
+                    }
+                )
+                
+                return {
+                    "success": True, 
+                    "message": ai_response, 
+                    "message_id": assistant_message.id
+                }
             
-            return {
-                "success": True, 
-                "message": ai_response, 
-                "message_id": assistant_message.id
-            }
+        except ThreadBusyError:
+            return {"success": False, "busy": True, "error": THREAD_BUSY_MESSAGE}
             
         except Exception as e:
             db.rollback()
@@ -787,7 +1103,44 @@ class AIService:
                 "error": str(e)
             }
 
+    async def stream_personal_assistant_message_to_thread(
+        self,
+        user: User,
+        message: str,
+        thread_id: str,
+        db: Session
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream personal assistant answer as delta events, saving both messages once finished"""
+        self._release_connection(db)
+        try:
+            async with thread_queue.hold(thread_id, "personal_chat"):
+                prompt = await self._build_personal_messages(user, message, thread_id)
+                route = model_router.route("personal_chat", message, prompt)
+                
+                parts = []
+                try:
+                    async for delta in self._stream_completion(prompt.messages, user.id, "personal_chat", route):
+                        parts.append(delta)
+                        yield {"type": "delta", "content": delta}
+                except Exception as e:
+                    print(f"❌ Error streaming personal assistant completion: {e}")
+                    yield {"type": "error", "message": "Произошла ошибка при обработке сообщения"}
+                    return
+                
+                ai_response = "".join(parts)
+                assistant_message = self._save_exchange(
+                    db, user, thread_id, message, ai_response,
+                    assistant_message_data={
+                        "model": self.provider.resolve_model(route.tier.model),
+                        "streamed": True,
+                        **route.message_data(),
+                        **completion_usage(None, prompt, ai_response)
+                    }
+                )
+                yield {"type": "done", "message_id": assistant_message.id}
+        except ThreadBusyError:
+            yield {"type": "error", "message": THREAD_BUSY_MESSAGE}
+
 
 # Global AI service instance
 ai_service = AIService()
-
@@ -0,0 +1,137 @@
+"""
+Lesson-chat answer cache
+
+Answers are keyed by lesson, transcript version and normalized question, so
+students asking the same thing about the same lesson share one completion.
+Only prompts without the student's course history or thread summary are
+looked up or stored, so personalized answers never reach other students.
+Redis is used when reachable (configure it with maxmemory-policy allkeys-lru
+for LRU eviction); otherwise an in-process LRU cache takes over.
+"""
+
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.redis_fallback import RedisFallback
+
+KEY_PREFIX = "answer_cache"
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+cache_requests = metrics.counter(
+    "answer_cache_requests_total",
+    "Lesson-chat answer cache lookups by result and backend"
+)
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    text = question.lower().replace("ё", "е")
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class LocalLRUCache:
+    """Thread-safe in-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+
+class AnswerCache:
+    """Answer cache backed by Redis with an in-process fallback"""
+
+    def __init__(self):
+        self.local = LocalLRUCache(settings.ANSWER_CACHE_MAX_ENTRIES)
+        self.redis = RedisFallback(
+            lambda: settings.ANSWER_CACHE_BACKEND == "redis",
+            timeout=0.5,
+            unavailable_message="Redis answer cache unavailable, using in-process cache"
+        )
+
+    def is_cacheable(self, question: str) -> bool:
+        """Very short messages are usually follow-ups or thanks that depend on the conversation"""
+        return len(normalize_question(question)) >= settings.ANSWER_CACHE_MIN_QUESTION_CHARS
+
+    def make_key(self, lesson_id: int, version: str, question: str) -> str:
+        digest = hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()
+        return f"{KEY_PREFIX}:{lesson_id}:{version}:{digest}"
+
+    async def get(self, key: str) -> Optional[str]:
+        redis = self.redis.client()
+        if redis is not None:
+            try:
+                value = await redis.get(key)
+                cache_requests.inc(result="hit" if value is not None else "miss", backend="redis")
+                return value.decode("utf-8") if value is not None else None
+            except Exception as e:
+                self.redis.failed(e)
+
+        value = self.local.get(key)
+        cache_requests.inc(result="hit" if value is not None else "miss", backend="memory")
+        return value
+
+    async def set(self, key: str, answer: str):
+        redis = self.redis.client()
+        if redis is not None:
+            try:
+                await redis.set(key, answer, ex=settings.ANSWER_CACHE_TTL)
+                return
+            except Exception as e:
+                self.redis.failed(e)
+
+        self.local.set(key, answer, settings.ANSWER_CACHE_TTL)
+
+    async def invalidate_lesson(self, lesson_id: int):
+        """Drop all cached answers for a lesson"""
+        prefix = f"{KEY_PREFIX}:{lesson_id}:"
+        self.local.delete_prefix(prefix)
+
+        redis = self.redis.client()
+        if redis is not None:
+            try:
+                keys = [key async for key in redis.scan_iter(match=f"{prefix}*")]
+                if keys:
+                    await redis.delete(*keys)
+            except Exception as e:
+                self.redis.failed(e)
+
+    async def aclose(self):
+        await self.redis.aclose()
+
+
+# Global answer cache instance
+answer_cache = AnswerCache()
@@ -0,0 +1,280 @@
+"""
+Full-text search over chat message content
+
+On PostgreSQL messages are matched with websearch_to_tsquery against the
+GIN-indexed to_tsvector of their content (Russian configuration, so word
+forms and stop words are handled), and snippets come from ts_headline.
+On SQLite (the local expovision_ed.db setup) an external-content FTS5 table,
+chat_messages_fts, is kept in step with chat_messages by triggers; every query
+word matches as a prefix there, which stands in for stemming.
+
+Results are newest first and keyset-paginated on (created_at, id), like the
+history endpoints. Asked to, the search continues into the compressed archive
+of old months once the hot table runs out. Each archive block keeps its
+distinct words in search_text, indexed the same way (GIN on PostgreSQL,
+chat_message_archives_fts on SQLite), so only blocks that may hold a match
+are decompressed; their messages are then matched and highlighted with the
+same rules as the hot table.
+
+Snippets are HTML-escaped message text with matched terms wrapped in <mark>.
+"""
+
+import re
+import html
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import column, func, literal_column, select, table, text, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.chat_message import ChatMessage, SEARCH_CONFIG, search_vector
+from app.models.chat_message_archive import ChatMessageArchive
+from app.services.chat_storage import Position, chat_storage
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_ELLIPSIS = "…"
+SNIPPET_WORDS = 24
+
+# Private-use characters the database puts around matches, swapped for the
+# highlight tags only after the snippet text has been escaped
+_MATCH_START = "\ue000"
+_MATCH_END = "\ue001"
+
+FTS_TABLE = "chat_messages_fts"
+ARCHIVE_FTS_TABLE = "chat_message_archives_fts"
+_fts = table(FTS_TABLE, column("rowid"))
+_archive_fts = table(ARCHIVE_FTS_TABLE, column("rowid"))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_HEADLINE_OPTIONS = (
+    f'StartSel="{_MATCH_START}", StopSel="{_MATCH_END}", '
+    f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}, '
+    f'MaxFragments=2, FragmentDelimiter=" {SNIPPET_ELLIPSIS} "'
+)
+
+# Archived contents go to PostgreSQL as an array and come back matched or highlighted, in order
+_ARCHIVE_MATCHES = text(
+    f"SELECT m.ord FROM unnest(CAST(:contents AS text[])) WITH ORDINALITY AS m(content, ord) "
+    f"WHERE to_tsvector('{SEARCH_CONFIG}', m.content) @@ websearch_to_tsquery('{SEARCH_CONFIG}', :query)"
+)
+_ARCHIVE_HEADLINES = text(
+    f"SELECT ts_headline('{SEARCH_CONFIG}', m.content, websearch_to_tsquery('{SEARCH_CONFIG}', :query), :options) "
+    f"FROM unnest(CAST(:contents AS text[])) WITH ORDINALITY AS m(content, ord) ORDER BY m.ord"
+)
+
+
+def _fts_ddl(fts_table: str, source: str, source_column: str) -> List[str]:
+    """External-content FTS5 table over source_column of source, the triggers that keep it in step, and its first fill"""
+    return [
+        f"CREATE VIRTUAL TABLE {fts_table} USING fts5("
+        f"{source_column}, content='{source}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_insert AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {source_column}) VALUES (new.id, new.{source_column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_delete AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {source_column}) VALUES ('delete', old.id, old.{source_column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_update AFTER UPDATE OF {source_column} ON {source} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {source_column}) VALUES ('delete', old.id, old.{source_column}); "
+        f"INSERT INTO {fts_table}(rowid, {source_column}) VALUES (new.id, new.{source_column}); END",
+        # Index the rows that were there before the table
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ]
+
+
+_SQLITE_INDEXES = {
+    FTS_TABLE: _fts_ddl(FTS_TABLE, "chat_messages", "content"),
+    ARCHIVE_FTS_TABLE: _fts_ddl(ARCHIVE_FTS_TABLE, "chat_message_archives", "search_text"),
+}
+
+
+def _terms(query: str) -> List[str]:
+    return _WORD_RE.findall(query.lower())
+
+
+def fts5_query(query: str) -> Optional[str]:
+    """FTS5 MATCH expression for free text: every word as a quoted prefix; None if there are no words"""
+    terms = _terms(query)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _render(snippet: str) -> str:
+    """Snippet from the database, escaped, with its match markers turned into highlight tags"""
+    return html.escape(snippet).replace(_MATCH_START, HIGHLIGHT_START).replace(_MATCH_END, HIGHLIGHT_END)
+
+
+def _is_match(word: str, terms: List[str]) -> bool:
+    word = word.lower()
+    return any(word.startswith(term) for term in terms)
+
+
+def _matches(content: str, terms: List[str]) -> bool:
+    """Every term is a prefix of some word of content"""
+    words = [word.lower() for word in _WORD_RE.findall(content)]
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+def _highlight(content: str, terms: List[str]) -> str:
+    """Escaped snippet of about SNIPPET_WORDS words around the first match, matches highlighted"""
+    words = list(_WORD_RE.finditer(content))
+    if not words:
+        return html.escape(content)
+    first = next((i for i, word in enumerate(words) if _is_match(word.group(), terms)), 0)
+    start = max(0, first - SNIPPET_WORDS // 4)
+    end = min(len(words), start + SNIPPET_WORDS)
+
+    # Text around the first and last word is kept unless an ellipsis replaces it
+    parts = [SNIPPET_ELLIPSIS] if start > 0 else []
+    position = words[start].start() if start > 0 else 0
+    for word in words[start:end]:
+        parts.append(html.escape(content[position:word.start()]))
+        if _is_match(word.group(), terms):
+            parts.append(f"{HIGHLIGHT_START}{html.escape(word.group())}{HIGHLIGHT_END}")
+        else:
+            parts.append(html.escape(word.group()))
+        position = word.end()
+    if end < len(words):
+        parts.append(SNIPPET_ELLIPSIS)
+    else:
+        parts.append(html.escape(content[position:]))
+    return "".join(parts)
+
+
+class ChatSearch:
+    """Full-text index upkeep and search of a user's chat messages"""
+
+    def ensure_index(self, engine: Engine) -> List[str]:
+        """Create the missing SQLite FTS5 tables and their triggers; returns the ones created.
+
+        PostgreSQL's GIN indexes come from the models for new databases and from
+        app/db/migrate_chat_search.py for existing ones.
+        """
+        if engine.dialect.name != "sqlite":
+            return []
+        created = []
+        with engine.begin() as connection:
+            for fts_table, statements in _SQLITE_INDEXES.items():
+                exists = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {"name": fts_table}
+                ).first()
+                if exists:
+                    continue
+                for statement in statements:
+                    connection.execute(text(statement))
+                created.append(fts_table)
+        return created
+
+    def search(
+        self,
+        db: Session,
+        query: str,
+        scope: Dict[str, Any],
+        limit: int,
+        before_id: Optional[int] = None,
+        include_archive: bool = False
+    ) -> List[Tuple[ChatMessage, str]]:
+        """Up to limit (message, snippet) pairs matching query in scope, newest first, older than before_id.
+
+        scope holds ChatMessage column values, as for history pages. Archived months
+        are only searched with include_archive.
+        """
+        terms = _terms(query)
+        if not terms:
+            return []
+
+        archived_before = None
+        if before_id is not None and not db.query(ChatMessage.id).filter(
+            ChatMessage.id == before_id, *[getattr(ChatMessage, name) == value for name, value in scope.items()]
+        ).first():
+            archived_before = chat_storage.locate(db, scope, before_id) if include_archive else None
+            if archived_before is None:
+                return []
+
+        hits = [] if archived_before is not None else self._search_hot(db, query, scope, limit, before_id)
+        if include_archive and len(hits) < limit:
+            # The archive only holds messages older than the hot table
+            hits += self._search_archive(db, query, scope, limit - len(hits), archived_before)
+        return hits
+
+    def _search_hot(
+        self,
+        db: Session,
+        query: str,
+        scope: Dict[str, Any],
+        limit: int,
+        before_id: Optional[int]
+    ) -> List[Tuple[ChatMessage, str]]:
+        """Matches in chat_messages through the full-text index"""
+        filters = [getattr(ChatMessage, name) == value for name, value in scope.items()]
+        if before_id is not None:
+            created_at = select(ChatMessage.created_at).where(ChatMessage.id == before_id).scalar_subquery()
+            filters.append(tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(created_at, before_id))
+
+        if db.get_bind().dialect.name == "postgresql":
+            ts_query = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'"), query)
+            snippet = func.ts_headline(literal_column(f"'{SEARCH_CONFIG}'"), ChatMessage.content, ts_query, _HEADLINE_OPTIONS)
+            rows = db.query(ChatMessage, snippet).filter(search_vector(ChatMessage.content).op("@@")(ts_query), *filters)
+        else:
+            fts = literal_column(FTS_TABLE)
+            snippet = func.snippet(fts, 0, _MATCH_START, _MATCH_END, SNIPPET_ELLIPSIS, SNIPPET_WORDS)
+            rows = db.query(ChatMessage, snippet).join(
+                _fts, _fts.c.rowid == ChatMessage.id
+            ).filter(fts.op("MATCH")(fts5_query(query)), *filters)
+
+        return [
+            (message, _render(snippet))
+            for message, snippet in rows.order_by(
+                ChatMessage.created_at.desc(), ChatMessage.id.desc()
+            ).limit(limit).all()
+        ]
+
+    def _search_archive(
+        self,
+        db: Session,
+        query: str,
+        scope: Dict[str, Any],
+        limit: int,
+        before: Optional[Position]
+    ) -> List[Tuple[ChatMessage, str]]:
+        """Matches in the archive, decompressing only the blocks whose words the index says could match"""
+        terms = _terms(query)
+
+        if db.get_bind().dialect.name == "postgresql":
+            # Any query word will do for a block: a message matching the whole query has at least one.
+            # Words are \w+ runs, so they are safe as to_tsquery operands
+            any_term = func.to_tsquery(literal_column(f"'{SEARCH_CONFIG}'"), " | ".join(terms))
+            block_filter = search_vector(ChatMessageArchive.search_text).op("@@")(any_term)
+
+            def where(messages: List[ChatMessage]) -> List[ChatMessage]:
+                matched = db.execute(_ARCHIVE_MATCHES, {
+                    "contents": [message.content for message in messages], "query": query
+                }).scalars().all()
+                return [messages[ordinal - 1] for ordinal in sorted(matched)]
+
+            messages = chat_storage.page(db, scope, limit, before=before, block_filters=[block_filter], where=where)
+            if not messages:
+                return []
+            snippets = db.execute(_ARCHIVE_HEADLINES, {
+                "contents": [message.content for message in messages], "query": query, "options": _HEADLINE_OPTIONS
+            }).scalars().all()
+            return [(message, _render(snippet)) for message, snippet in zip(messages, snippets)]
+
+        # A block holding a message with every word as a prefix holds all of them too
+        fts = literal_column(ARCHIVE_FTS_TABLE)
+        block_filter = ChatMessageArchive.id.in_(
+            select(_archive_fts.c.rowid).where(fts.op("MATCH")(fts5_query(query)))
+        )
+        messages = chat_storage.page(
+            db, scope, limit,
+            before=before,
+            block_filters=[block_filter],
+            where=lambda messages: [message for message in messages if _matches(message.content, terms)]
+        )
+        return [(message, _highlight(message.content, terms)) for message in messages]
+
+
+# Global chat search instance
+chat_search = ChatSearch()
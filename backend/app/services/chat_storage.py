@@ -0,0 +1,388 @@
+"""
+Chat message storage tiers
+
+chat_messages gets two rows per exchange and is the fastest-growing table.
+On PostgreSQL it is range-partitioned by month on created_at (converted once
+by app/db/migrate_partition_chat_messages.py), and this service creates the
+coming months' partitions ahead of time, so inserts never pile up in the
+default partition.
+
+Whole months older than CHAT_ARCHIVE_AFTER_MONTHS move to
+chat_message_archives, one zlib-compressed JSON block per thread and month,
+and their emptied partitions are dropped. Archived messages stay readable:
+the history endpoints continue from the hot table into the archive, which
+only ever holds older messages than the hot table.
+"""
+
+import re
+import json
+import zlib
+import asyncio
+from itertools import groupby
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session, defer
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import SessionLocal
+from app.models.chat_message import ChatMessage
+from app.models.chat_message_archive import ChatMessageArchive
+
+DEFAULT_PARTITION = "chat_messages_default"
+_PARTITION_RE = re.compile(r"chat_messages_p(\d{4})_(\d{2})")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# PostgreSQL advisory lock key; one worker archives at a time
+ARCHIVE_LOCK_KEY = 7240311
+
+# (created_at, id): the order of chat history
+Position = Tuple[datetime, int]
+
+archived_total = metrics.counter(
+    "chat_archived_messages_total",
+    "Chat messages moved from chat_messages to the compressed archive"
+)
+partition_changes = metrics.counter(
+    "chat_partition_changes_total",
+    "chat_messages partitions created ahead or dropped after archiving, by action"
+)
+
+
+def month_start(moment: datetime, offset: int = 0) -> datetime:
+    """First instant (UTC) of moment's month, shifted by offset months; naive moments are taken as UTC"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    index = moment.year * 12 + moment.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def month_key(moment: datetime) -> str:
+    return month_start(moment).strftime("%Y-%m")
+
+
+def partition_name(start: datetime) -> str:
+    return f"chat_messages_p{start:%Y_%m}"
+
+
+def partition_ddl(start: datetime) -> str:
+    """CREATE statement for the partition of the month beginning at start"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF chat_messages "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{month_start(start, 1).isoformat()}')"
+    )
+
+
+def _item(message: ChatMessage) -> Dict[str, Any]:
+    return {
+        "id": message.id,
+        "sender": message.sender,
+        "content": message.content,
+        "message_data": message.message_data,
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+def _item_position(item: Dict[str, Any]) -> Position:
+    return datetime.fromisoformat(item["created_at"]), item["id"]
+
+
+def search_text(items: List[Dict[str, Any]]) -> str:
+    """A block's distinct lowercased words in order of first use, for the archive search index"""
+    words = dict.fromkeys(word.lower() for item in items for word in _WORD_RE.findall(item["content"]))
+    return " ".join(words)
+
+
+def _items(block: ChatMessageArchive) -> List[Dict[str, Any]]:
+    return json.loads(zlib.decompress(block.payload))
+
+
+def _messages(block: ChatMessageArchive) -> List[ChatMessage]:
+    """Block contents as detached ChatMessage objects, oldest first"""
+    return [
+        ChatMessage(
+            id=item["id"],
+            user_id=block.user_id,
+            course_id=block.course_id,
+            lesson_id=block.lesson_id,
+            thread_id=block.thread_id,
+            sender=item["sender"],
+            content=item["content"],
+            message_data=item["message_data"],
+            created_at=datetime.fromisoformat(item["created_at"])
+        )
+        for item in _items(block)
+    ]
+
+
+def _in_scope(scope: Dict[str, Any]) -> list:
+    """Archive filters for a history scope: equality on ChatMessage columns, None meaning IS NULL"""
+    return [getattr(ChatMessageArchive, column) == value for column, value in scope.items()]
+
+
+class ChatStorage:
+    """Partition upkeep and the compressed archive tier of chat_messages"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    # Maintenance
+
+    def is_partitioned(self, db: Session) -> bool:
+        if db.get_bind().dialect.name != "postgresql":
+            return False
+        return bool(db.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('chat_messages'))"
+        )).scalar())
+
+    def _partitions(self, db: Session) -> List[str]:
+        return [row[0] for row in db.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass('chat_messages') ORDER BY c.relname"
+        ))]
+
+    def ensure_partitions(self, db: Session, now: Optional[datetime] = None) -> List[str]:
+        """Create this month's and the next CHAT_PARTITIONS_AHEAD_MONTHS partitions; returns the new ones"""
+        if not self.is_partitioned(db):
+            return []
+        now = now or datetime.now(timezone.utc)
+        existing = set(self._partitions(db))
+        created = []
+        for offset in range(settings.CHAT_PARTITIONS_AHEAD_MONTHS + 1):
+            start = month_start(now, offset)
+            if partition_name(start) not in existing:
+                self._create_partition(db, start)
+                db.commit()
+                created.append(partition_name(start))
+                partition_changes.inc(action="created")
+        return created
+
+    def _create_partition(self, db: Session, start: datetime):
+        """Create the month's partition, first moving its rows out of the default partition.
+
+        PostgreSQL refuses to attach a range the default partition already has rows
+        for, so they wait in a temporary table and go back in through the parent.
+        """
+        bounds = {"start": start, "end": month_start(start, 1)}
+        in_month = "created_at >= :start AND created_at < :end"
+        stranded = db.execute(
+            text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month})"), bounds
+        ).scalar()
+        if not stranded:
+            db.execute(text(partition_ddl(start)))
+            return
+        db.execute(text("CREATE TEMPORARY TABLE chat_messages_moving (LIKE chat_messages) ON COMMIT DROP"))
+        db.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_month} RETURNING *) "
+            f"INSERT INTO chat_messages_moving SELECT * FROM moved"
+        ), bounds)
+        db.execute(text(partition_ddl(start)))
+        db.execute(text("INSERT INTO chat_messages SELECT * FROM chat_messages_moving"))
+
+    def _lock(self, db: Session) -> bool:
+        """Take the archive lock for the current transaction; False if another worker holds it"""
+        if db.get_bind().dialect.name != "postgresql":
+            return True
+        return bool(db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ARCHIVE_LOCK_KEY}).scalar())
+
+    def archive_expired(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Move whole months older than CHAT_ARCHIVE_AFTER_MONTHS to the archive; returns how many messages"""
+        if settings.CHAT_ARCHIVE_AFTER_MONTHS <= 0:
+            return 0
+        cutoff = month_start(now or datetime.now(timezone.utc), -settings.CHAT_ARCHIVE_AFTER_MONTHS)
+        moved = 0
+        while True:
+            count = self._archive_batch(db, cutoff)
+            moved += count
+            if count < settings.CHAT_ARCHIVE_BATCH_MESSAGES:
+                break
+        if self.is_partitioned(db):
+            self._drop_archived_partitions(db, cutoff)
+        return moved
+
+    def _archive_batch(self, db: Session, cutoff: datetime) -> int:
+        """Move up to CHAT_ARCHIVE_BATCH_MESSAGES messages older than cutoff in one transaction"""
+        if not self._lock(db):
+            db.rollback()
+            return 0
+        rows = db.query(ChatMessage).filter(
+            ChatMessage.created_at < cutoff
+        ).order_by(ChatMessage.id).limit(settings.CHAT_ARCHIVE_BATCH_MESSAGES).all()
+        if not rows:
+            db.rollback()
+            return 0
+
+        groups: Dict[Tuple, List[ChatMessage]] = {}
+        for message in rows:
+            key = (message.thread_id, message.user_id, message.course_id, message.lesson_id, month_key(message.created_at))
+            groups.setdefault(key, []).append(message)
+
+        for (thread_id, user_id, course_id, lesson_id, month), messages in groups.items():
+            scope = {"thread_id": thread_id, "user_id": user_id, "course_id": course_id, "lesson_id": lesson_id}
+            block = db.query(ChatMessageArchive).filter(
+                *_in_scope(scope), ChatMessageArchive.month == month
+            ).first()
+            items = [_item(message) for message in messages]
+            if block is None:
+                block = ChatMessageArchive(month=month, **scope)
+                db.add(block)
+            else:
+                # Earlier batch of the same thread and month
+                items += _items(block)
+            items.sort(key=_item_position)
+            block.payload = zlib.compress(json.dumps(items, ensure_ascii=False).encode("utf-8"))
+            block.message_count = len(items)
+            block.first_message_id = min(item["id"] for item in items)
+            block.last_message_id = max(item["id"] for item in items)
+            block.first_created_at = _item_position(items[0])[0]
+            block.last_created_at = _item_position(items[-1])[0]
+            block.search_text = search_text(items)
+
+        # created_at bound lets PostgreSQL prune to the old partitions
+        db.query(ChatMessage).filter(
+            ChatMessage.created_at < cutoff,
+            ChatMessage.id.in_([message.id for message in rows])
+        ).delete(synchronize_session=False)
+        db.commit()
+        archived_total.inc(len(rows))
+        return len(rows)
+
+    def _drop_archived_partitions(self, db: Session, cutoff: datetime):
+        """Drop month partitions that ended before cutoff and have been emptied into the archive"""
+        if not self._lock(db):
+            db.rollback()
+            return
+        for name in self._partitions(db):
+            match = _PARTITION_RE.fullmatch(name)
+            if not match:
+                continue  # Default partition
+            start = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+            if month_start(start, 1) > cutoff:
+                continue
+            if db.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+                continue  # Not fully archived yet
+            db.execute(text(f"DROP TABLE {name}"))
+            partition_changes.inc(action="dropped")
+        db.commit()
+
+    def maintain(self) -> Dict[str, Any]:
+        """One maintenance pass on its own session; called from a worker thread.
+
+        Each step runs even if the one before it failed; failures are listed under "errors".
+        """
+        db = SessionLocal()
+        result = {"partitioned": False, "partitions_created": [], "messages_archived": 0, "errors": {}}
+        steps = [
+            ("partitions_created", "Creating chat_messages partitions", self.ensure_partitions),
+            ("messages_archived", "Archiving expired chat messages", self.archive_expired),
+        ]
+        try:
+            for key, action, step in steps:
+                try:
+                    result[key] = step(db)
+                except Exception as e:
+                    db.rollback()
+                    print(f"❌ {action} failed: {e}")
+                    result["errors"][key] = str(e)
+            result["partitioned"] = self.is_partitioned(db)
+            return result
+        finally:
+            db.close()
+
+    def start(self):
+        """Run maintenance now, then every CHAT_STORAGE_MAINTENANCE_INTERVAL"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.maintain)
+            except Exception as e:
+                print(f"❌ Chat storage maintenance failed: {e}")
+            if settings.CHAT_STORAGE_MAINTENANCE_INTERVAL <= 0:
+                return
+            await asyncio.sleep(settings.CHAT_STORAGE_MAINTENANCE_INTERVAL)
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # Reads
+
+    def locate(self, db: Session, scope: Dict[str, Any], message_id: int) -> Optional[Position]:
+        """Position of an archived message in scope, or None if scope has no such archived message"""
+        blocks = db.query(ChatMessageArchive).filter(
+            *_in_scope(scope),
+            ChatMessageArchive.last_message_id >= message_id,
+            ChatMessageArchive.first_message_id <= message_id
+        ).all()
+        for block in blocks:
+            for item in _items(block):
+                if item["id"] == message_id:
+                    return _item_position(item)
+        return None
+
+    def page(
+        self,
+        db: Session,
+        scope: Dict[str, Any],
+        limit: int,
+        before: Optional[Position] = None,
+        after: Optional[Position] = None,
+        block_filters: Sequence = (),
+        where: Optional[Callable[[List[ChatMessage]], List[ChatMessage]]] = None
+    ) -> List[ChatMessage]:
+        """Up to limit archived messages in scope: newest first below before, or oldest first above after.
+        
+        block_filters are extra conditions on ChatMessageArchive that blocks must meet to be
+        decompressed at all. where, if given, gets each month's messages in page order and
+        returns the ones to keep, in the same order.
+        """
+        newest_first = after is None
+        # Payloads are only loaded for the blocks that get decompressed
+        query = db.query(ChatMessageArchive).options(
+            defer(ChatMessageArchive.payload), defer(ChatMessageArchive.search_text)
+        ).filter(*_in_scope(scope), *block_filters)
+        if before is not None:
+            query = query.filter(
+                ChatMessageArchive.month <= month_key(before[0]),
+                ChatMessageArchive.first_created_at <= before[0]
+            )
+        if after is not None:
+            query = query.filter(
+                ChatMessageArchive.month >= month_key(after[0]),
+                ChatMessageArchive.last_created_at >= after[0]
+            )
+        blocks = query.order_by(
+            ChatMessageArchive.month.desc() if newest_first else ChatMessageArchive.month
+        ).all()
+
+        page = []
+        for _, month_blocks in groupby(blocks, key=lambda block: block.month):
+            # Blocks of other threads in scope interleave within the month
+            messages = [message for block in month_blocks for message in _messages(block)]
+            messages.sort(key=lambda message: (message.created_at, message.id), reverse=newest_first)
+            messages = [
+                message for message in messages
+                if not (before is not None and (message.created_at, message.id) >= before)
+                and not (after is not None and (message.created_at, message.id) <= after)
+            ]
+            if where is not None and messages:
+                messages = where(messages)
+            page += messages[:limit - len(page)]
+            if len(page) == limit:
+                break
+        return page
+
+    def count(self, db: Session, scope: Dict[str, Any]) -> int:
+        """Archived messages in scope"""
+        return db.query(func.coalesce(func.sum(ChatMessageArchive.message_count), 0)).filter(*_in_scope(scope)).scalar()
+
+
+# Global chat storage instance
+chat_storage = ChatStorage()
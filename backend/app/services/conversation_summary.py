@@ -0,0 +1,201 @@
+"""
+Rolling summaries of long chat threads
+
+Prompts carry a thread's summary plus only the messages written after it,
+so prompt size stays flat as a conversation grows. Once enough messages
+pile up past the verbatim tail, a background job folds the older ones into
+the summary with one extra completion.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import SessionLocal
+from app.models.chat_message import ChatMessage
+from app.models.conversation_summary import ConversationSummary
+from app.services.prompt_builder import truncate_text
+from app.services.transcript_index import count_tokens
+
+# All compaction jobs share one fair-queue slot, so they can't crowd out live chats
+SUMMARY_USER_KEY = "background:summaries"
+
+SUMMARY_PROMPT = """Ты ведешь краткий конспект диалога студента с AI-ассистентом платформы ExpoVisionED.
+Обнови конспект с учетом новых сообщений. Сохрани факты о студенте и его целях,
+обсужденные темы и выводы, договоренности и вопросы, оставшиеся без ответа.
+Пиши по пунктам, кратко, на русском языке, не более 200 слов. Выведи только обновленный конспект."""
+
+compactions = metrics.counter(
+    "conversation_compactions_total",
+    "Background thread summary refreshes by result"
+)
+messages_compacted = metrics.counter(
+    "conversation_messages_compacted_total",
+    "Chat messages folded into rolling summaries"
+)
+
+# (messages, user_key, endpoint, max_tokens) -> Completion
+CompleteFn = Callable[[List[Dict[str, str]], str, str, int], Awaitable]
+
+
+class ConversationSummaryService:
+    """Reads thread summaries and refreshes them in the background"""
+
+    def __init__(self):
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def get(self, thread_id: str, db: Session) -> Optional[ConversationSummary]:
+        return db.query(ConversationSummary).filter(
+            ConversationSummary.thread_id == thread_id
+        ).first()
+
+    def schedule(self, thread_id: str, user_id: int, complete: CompleteFn):
+        """Refresh the thread summary in the background if it's due; one job per thread at a time"""
+        if thread_id in self._running:
+            return
+        self._running.add(thread_id)
+        task = asyncio.get_running_loop().create_task(self._compact(thread_id, user_id, complete))
+        self._tasks.add(task)
+
+        def done(task: asyncio.Task):
+            self._tasks.discard(task)
+            self._running.discard(thread_id)
+
+        task.add_done_callback(done)
+
+    async def _compact(self, thread_id: str, user_id: int, complete: CompleteFn):
+        try:
+            db = SessionLocal()
+            try:
+                summary = self.get(thread_id, db)
+                previous = summary.summary if summary else ""
+                covered_id = summary.covered_message_id if summary else 0
+                covered_count = summary.covered_messages if summary else 0
+                batch = self._pending_batch(thread_id, covered_id, previous, db)
+            finally:
+                db.close()
+
+            if not batch:
+                return
+
+            lines = [
+                f"{'Студент' if msg.sender == 'user' else 'Ассистент'}: "
+                f"{truncate_text(msg.content, settings.PROMPT_HISTORY_ITEM_MAX_TOKENS)}"
+                for msg in batch
+            ]
+            messages = [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {
+                    "role": "user",
+                    "content": f"ТЕКУЩИЙ КОНСПЕКТ:\n{previous or 'пока пусто'}\n\nНОВЫЕ СООБЩЕНИЯ:\n" + "\n".join(lines)
+                }
+            ]
+            completion = await complete(messages, SUMMARY_USER_KEY, "summary", settings.SUMMARY_MAX_TOKENS)
+            text = completion.content.strip()
+            if not text:
+                compactions.inc(result="empty")
+                return
+
+            db = SessionLocal()
+            try:
+                saved = self._save(
+                    db, thread_id, user_id, text, covered_id,
+                    batch[-1].id, covered_count + len(batch)
+                )
+            finally:
+                db.close()
+
+            compactions.inc(result="ok" if saved else "conflict")
+            if saved:
+                messages_compacted.inc(len(batch))
+
+        except Exception as e:
+            compactions.inc(result="error")
+            print(f"❌ Error compacting conversation {thread_id}: {e}")
+
+    def _pending_batch(self, thread_id: str, covered_id: int, previous: str, db: Session) -> List[ChatMessage]:
+        """Oldest unsummarized messages to fold, or [] if the thread isn't due yet"""
+        pending = db.query(func.count(ChatMessage.id)).filter(
+            ChatMessage.thread_id == thread_id,
+            ChatMessage.id > covered_id
+        ).scalar()
+        keep = settings.SUMMARY_KEEP_RECENT_MESSAGES
+        if pending < keep + settings.SUMMARY_REFRESH_MESSAGES:
+            return []
+
+        candidates = db.query(ChatMessage).filter(
+            ChatMessage.thread_id == thread_id,
+            ChatMessage.id > covered_id
+        ).order_by(ChatMessage.id).limit(min(pending - keep, settings.SUMMARY_MAX_BATCH_MESSAGES)).all()
+
+        # Stop before the summarization prompt itself outgrows the budget
+        budget = (
+            settings.PROMPT_TOKEN_BUDGET
+            - count_tokens(SUMMARY_PROMPT)
+            - count_tokens(previous)
+            - settings.SUMMARY_MAX_TOKENS
+        )
+        batch = []
+        for msg in candidates:
+            budget -= min(count_tokens(msg.content), settings.PROMPT_HISTORY_ITEM_MAX_TOKENS) + 4
+            if batch and budget < 0:
+                break
+            batch.append(msg)
+        return batch
+
+    def _save(
+        self,
+        db: Session,
+        thread_id: str,
+        user_id: int,
+        text: str,
+        previous_covered_id: int,
+        covered_id: int,
+        covered_count: int
+    ) -> bool:
+        """Store the new summary unless another worker moved it on meanwhile"""
+        values = {
+            ConversationSummary.summary: text,
+            ConversationSummary.covered_message_id: covered_id,
+            ConversationSummary.covered_messages: covered_count,
+        }
+        if previous_covered_id:
+            updated = db.query(ConversationSummary).filter(
+                ConversationSummary.thread_id == thread_id,
+                ConversationSummary.covered_message_id == previous_covered_id
+            ).update(values, synchronize_session=False)
+            db.commit()
+            return updated == 1
+
+        db.add(ConversationSummary(
+            thread_id=thread_id,
+            user_id=user_id,
+            summary=text,
+            covered_message_id=covered_id,
+            covered_messages=covered_count
+        ))
+        try:
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+
+    async def aclose(self):
+        """Give in-flight compactions SUMMARY_SHUTDOWN_TIMEOUT to finish on shutdown, then cancel them"""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=settings.SUMMARY_SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+# Global conversation summary service instance
+conversation_summaries = ConversationSummaryService()
@@ -0,0 +1,281 @@
+"""
+Incremental sync of course materials to the OpenAI assistant
+
+Course text files are hashed and compared with a local manifest of what was
+uploaded before, so only new or changed courses are re-uploaded (through a
+bounded worker pool). The files live in one vector store that the assistant's
+file_search tool reads (Assistants API v2); the store is updated once at the
+end with what was added and removed. Runs as a background job whose progress
+can be polled.
+
+openai 1.3.7 has no vector store API and pins its assistants calls to v1, so
+the store and the assistant's tool_resources are managed with raw requests.
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import SessionLocal
+from app.models.course import Course
+
+VECTOR_STORE_NAME = "ExpoVisionED course materials"
+ASSISTANTS_V2 = {"headers": {"OpenAI-Beta": "assistants=v2"}}
+
+uploads_total = metrics.counter(
+    "course_materials_uploads_total",
+    "Course material files by sync outcome"
+)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MaterialsSyncJob:
+    """Progress of one sync run"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.status = "pending"  # pending, running, completed, failed
+        self.total = 0
+        self.processed = 0
+        self.uploaded = 0
+        self.skipped = 0
+        self.removed = 0
+        self.failed = 0
+        self.errors: List[str] = []
+        self.started_at = _now()
+        self.finished_at: Optional[str] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("pending", "running")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "uploaded": self.uploaded,
+            "skipped": self.skipped,
+            "removed": self.removed,
+            "failed": self.failed,
+            "errors": self.errors[-10:],
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class CourseMaterialsSync:
+    """Runs at most one materials sync job at a time"""
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.job: Optional[MaterialsSyncJob] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        """{"assistant_id", "vector_store_id", "courses": {course_id: {hash, file_id, filename, uploaded_at}}}"""
+        empty = {"assistant_id": None, "vector_store_id": None, "courses": {}}
+        if not os.path.exists(self.manifest_path):
+            return empty
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return {**empty, **json.load(f)}
+        except (OSError, ValueError) as e:
+            print(f"❌ Unreadable course materials manifest, resyncing everything: {e}")
+            return empty
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    async def _attach(
+        self,
+        client,
+        assistant_id: str,
+        manifest: Dict[str, Any],
+        added_file_ids: List[str],
+        removed_file_ids: List[str]
+    ):
+        """Bring the vector store in line with the manifest and point the assistant's file_search at it"""
+        store_id = manifest["vector_store_id"]
+        if store_id is None:
+            store = await client.post(
+                "/vector_stores",
+                body={
+                    "name": VECTOR_STORE_NAME,
+                    "file_ids": [entry["file_id"] for entry in manifest["courses"].values()]
+                },
+                cast_to=Dict[str, Any],
+                options=ASSISTANTS_V2
+            )
+            manifest["vector_store_id"] = store["id"]
+            manifest["assistant_id"] = None  # A new store always has to be attached
+        else:
+            try:
+                if added_file_ids:
+                    await client.post(
+                        f"/vector_stores/{store_id}/file_batches",
+                        body={"file_ids": added_file_ids},
+                        cast_to=Dict[str, Any],
+                        options=ASSISTANTS_V2
+                    )
+                for file_id in removed_file_ids:
+                    await client.delete(f"/vector_stores/{store_id}/files/{file_id}", cast_to=Dict[str, Any], options=ASSISTANTS_V2)
+            except Exception:
+                # Store is out of step with the manifest: the next sync replaces it with a fresh one
+                manifest["vector_store_id"] = None
+                try:
+                    await client.delete(f"/vector_stores/{store_id}", cast_to=Dict[str, Any], options=ASSISTANTS_V2)
+                except Exception as e:
+                    print(f"❌ Error deleting vector store {store_id}: {e}")
+                raise
+        
+        if manifest["assistant_id"] != assistant_id:
+            await client.post(
+                f"/assistants/{assistant_id}",
+                body={"tool_resources": {"file_search": {"vector_store_ids": [manifest["vector_store_id"]]}}},
+                cast_to=Dict[str, Any],
+                options=ASSISTANTS_V2
+            )
+            manifest["assistant_id"] = assistant_id
+
+    def start(
+        self,
+        client,
+        assistant_id: str,
+        generate_content: Callable[[Course, Session], str]
+    ) -> MaterialsSyncJob:
+        """Start a sync in the background, or return the one already running"""
+        if self.job is not None and self.job.is_active:
+            return self.job
+
+        self.job = MaterialsSyncJob()
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(self.job, client, assistant_id, generate_content)
+        )
+        return self.job
+
+    def _collect(self, generate_content: Callable[[Course, Session], str]) -> Dict[str, Dict[str, str]]:
+        """Render and hash every published course"""
+        db = SessionLocal()
+        try:
+            courses = db.query(Course).filter(Course.is_published == True).order_by(Course.id).all()
+            rendered = {}
+            for course in courses:
+                content = generate_content(course, db)
+                if content:
+                    rendered[str(course.id)] = {
+                        "title": course.title,
+                        "content": content,
+                        "hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+                    }
+            return rendered
+        finally:
+            db.close()
+
+    async def _run(self, job: MaterialsSyncJob, client, assistant_id: str, generate_content):
+        job.status = "running"
+        try:
+            # Rendering is sync DB work; keep it off the event loop
+            rendered = await asyncio.to_thread(self._collect, generate_content)
+            manifest = self._load_manifest()
+            entries = manifest["courses"]
+
+            changed = {
+                course_id: course for course_id, course in rendered.items()
+                if entries.get(course_id, {}).get("hash") != course["hash"]
+            }
+            job.total = len(rendered)
+            job.skipped = job.processed = len(rendered) - len(changed)
+            uploads_total.inc(job.skipped, result="unchanged")
+
+            semaphore = asyncio.Semaphore(settings.COURSE_MATERIALS_UPLOAD_CONCURRENCY)
+            added_file_ids = []
+            stale_file_ids = []
+
+            async def upload(course_id: str, course: Dict[str, str]):
+                filename = f"course_{course_id}_{course['title'].replace(' ', '_')}.txt"
+                try:
+                    async with semaphore:
+                        # Uploaded from memory: STATIC_DIR is publicly served
+                        file = await client.files.create(
+                            file=(filename, course["content"].encode("utf-8")),
+                            purpose='assistants'
+                        )
+                    added_file_ids.append(file.id)
+                    previous = entries.get(course_id)
+                    if previous:
+                        stale_file_ids.append(previous["file_id"])
+                    entries[course_id] = {
+                        "hash": course["hash"],
+                        "file_id": file.id,
+                        "filename": filename,
+                        "uploaded_at": _now(),
+                    }
+                    job.uploaded += 1
+                    uploads_total.inc(result="uploaded")
+                    print(f"✅ Uploaded course materials: {course['title']}")
+                except Exception as e:
+                    job.failed += 1
+                    job.errors.append(f"{course['title']}: {e}")
+                    uploads_total.inc(result="failed")
+                    print(f"❌ Error uploading course {course['title']}: {e}")
+                finally:
+                    job.processed += 1
+
+            await asyncio.gather(*(upload(course_id, course) for course_id, course in changed.items()))
+
+            # Courses that were unpublished or deleted since the last sync
+            for course_id in [c for c in entries if c not in rendered]:
+                stale_file_ids.append(entries.pop(course_id)["file_id"])
+                job.removed += 1
+
+            attached = True
+            if job.uploaded or job.removed or manifest["assistant_id"] != assistant_id or manifest["vector_store_id"] is None:
+                try:
+                    await self._attach(client, assistant_id, manifest, added_file_ids, stale_file_ids)
+                except Exception as e:
+                    # The manifest is still saved, so the next sync retries attaching
+                    # instead of uploading every course again
+                    attached = False
+                    job.errors.append(f"Attaching files to the assistant: {e}")
+                    print(f"❌ Error attaching course materials to the assistant: {e}")
+            self._save_manifest(manifest)
+
+            for file_id in stale_file_ids:
+                try:
+                    await client.files.delete(file_id)
+                except Exception as e:
+                    print(f"❌ Error deleting superseded course file {file_id}: {e}")
+
+            job.status = "completed" if not job.failed and attached else "failed"
+
+        except Exception as e:
+            job.status = "failed"
+            job.errors.append(str(e))
+            print(f"❌ Error uploading course materials: {e}")
+        finally:
+            job.finished_at = _now()
+
+    async def aclose(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+# Global course materials sync instance
+course_materials_sync = CourseMaterialsSync(settings.COURSE_MATERIALS_MANIFEST)
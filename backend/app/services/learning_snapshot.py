@@ -0,0 +1,202 @@
+"""
+Per-user learning snapshot for the personal assistant
+
+Course progress, most active lessons and recent lesson questions are kept in
+one UserLearningSnapshot row per user. Progress updates and lesson-chat
+writes patch it incrementally, so building a Jarvis prompt costs one
+indexed read instead of several queries per enrolled course. Changes that
+affect many users at once (lesson added, access revoked, ...) just mark the
+affected snapshots stale and they are rebuilt on next read.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.course import Course
+from app.models.lesson import Lesson
+from app.models.chat_message import ChatMessage
+from app.models.user_course_progress import UserCourseProgress
+from app.models.user_lesson_progress import UserLessonProgress
+from app.models.user_learning_snapshot import UserLearningSnapshot
+
+QUESTION_WORDS = ('как', 'что', 'почему', 'зачем', 'когда')
+RECENT_QUESTIONS_LIMIT = 20
+QUESTION_PREVIEW_CHARS = 100
+
+
+def _date(value: Optional[datetime]) -> Optional[str]:
+    return value.strftime('%d.%m.%Y') if value else None
+
+
+def _is_question(content: str) -> bool:
+    text = content.lower()
+    return any(word in text for word in QUESTION_WORDS)
+
+
+class LearningSnapshotService:
+    """Builds, patches and reads UserLearningSnapshot rows"""
+
+    def get(self, user_id: int, db: Session) -> Dict[str, Any]:
+        """Snapshot data for a user, rebuilding it if missing or stale"""
+        snapshot = db.query(UserLearningSnapshot).filter(
+            UserLearningSnapshot.user_id == user_id
+        ).first()
+
+        if snapshot is None or snapshot.is_stale:
+            snapshot = self.rebuild(user_id, db, snapshot)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another request created the snapshot concurrently
+                db.rollback()
+                return self.get(user_id, db)
+
+        return snapshot.data
+
+    def rebuild(
+        self,
+        user_id: int,
+        db: Session,
+        snapshot: Optional[UserLearningSnapshot] = None
+    ) -> UserLearningSnapshot:
+        """Recompute the snapshot from the source tables (does not commit)"""
+        enrolled = db.query(Course, UserCourseProgress).join(
+            UserCourseProgress, UserCourseProgress.course_id == Course.id
+        ).filter(UserCourseProgress.user_id == user_id).all()
+        course_ids = [course.id for course, _ in enrolled]
+
+        lesson_totals = dict(db.query(Lesson.course_id, func.count(Lesson.id)).filter(
+            Lesson.course_id.in_(course_ids)
+        ).group_by(Lesson.course_id).all()) if course_ids else {}
+
+        completed_totals = dict(db.query(Lesson.course_id, func.count(UserLessonProgress.id)).join(
+            Lesson, Lesson.id == UserLessonProgress.lesson_id
+        ).filter(
+            UserLessonProgress.user_id == user_id,
+            UserLessonProgress.completed == True,
+            Lesson.course_id.in_(course_ids)
+        ).group_by(Lesson.course_id).all()) if course_ids else {}
+
+        courses = {}
+        for course, progress in enrolled:
+            courses[str(course.id)] = {
+                "title": course.title,
+                "completed": completed_totals.get(course.id, 0),
+                "total": lesson_totals.get(course.id, 0),
+                "started_at": _date(progress.created_at),
+                "completed_at": _date(progress.completed_at),
+            }
+
+        lesson_activity = {}
+        for lesson_id, title, count in db.query(
+            Lesson.id, Lesson.title, func.count(ChatMessage.id)
+        ).join(ChatMessage, Lesson.id == ChatMessage.lesson_id).filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.sender == 'user'
+        ).group_by(Lesson.id, Lesson.title).all():
+            lesson_activity[str(lesson_id)] = {"title": title, "count": count}
+
+        recent_messages = db.query(ChatMessage.content).filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.lesson_id.isnot(None),
+            ChatMessage.sender == 'user'
+        ).order_by(ChatMessage.created_at.desc()).limit(RECENT_QUESTIONS_LIMIT).all()
+
+        data = {
+            "courses": courses,
+            "lesson_activity": lesson_activity,
+            # Oldest first, so new questions are appended
+            "recent_questions": [
+                {"text": content[:QUESTION_PREVIEW_CHARS], "is_question": _is_question(content)}
+                for (content,) in reversed(recent_messages)
+            ],
+        }
+
+        if snapshot is None:
+            snapshot = UserLearningSnapshot(user_id=user_id, data=data)
+            db.add(snapshot)
+        else:
+            snapshot.data = data
+            snapshot.is_stale = False
+        db.flush()
+        return snapshot
+
+    def _current(self, user_id: int, db: Session) -> Optional[UserLearningSnapshot]:
+        """Snapshot row worth patching; missing or stale ones are rebuilt on read anyway.
+        
+        The row stays locked until the caller commits, so concurrent patches of the
+        JSON data apply one after another instead of overwriting each other.
+        """
+        snapshot = db.query(UserLearningSnapshot).filter(
+            UserLearningSnapshot.user_id == user_id
+        ).with_for_update().populate_existing().first()
+        if snapshot is None or snapshot.is_stale:
+            return None
+        return snapshot
+
+    def apply_course_progress(self, db: Session, progress: UserCourseProgress):
+        """Patch one course entry after a lesson progress change (does not commit)"""
+        snapshot = self._current(progress.user_id, db)
+        if snapshot is None:
+            return
+
+        data = dict(snapshot.data)
+        courses = dict(data["courses"])
+        entry = courses.get(str(progress.course_id))
+        if entry is None:
+            # Newly enrolled course, let the next read pick up its title and totals
+            snapshot.is_stale = True
+            return
+
+        courses[str(progress.course_id)] = {
+            **entry,
+            "completed": progress.completed_lessons,
+            "total": progress.total_lessons,
+            "completed_at": _date(progress.completed_at),
+        }
+        data["courses"] = courses
+        snapshot.data = data
+
+    def record_lesson_message(self, db: Session, user_id: int, lesson_id: int, content: str):
+        """Count a student's lesson-chat message (does not commit)"""
+        snapshot = self._current(user_id, db)
+        if snapshot is None:
+            return
+
+        data = dict(snapshot.data)
+        activity = dict(data["lesson_activity"])
+        entry = activity.get(str(lesson_id))
+        if entry is None:
+            lesson = db.get(Lesson, lesson_id)
+            entry = {"title": lesson.title if lesson else "", "count": 0}
+        activity[str(lesson_id)] = {**entry, "count": entry["count"] + 1}
+
+        recent = data["recent_questions"] + [
+            {"text": content[:QUESTION_PREVIEW_CHARS], "is_question": _is_question(content)}
+        ]
+        data["lesson_activity"] = activity
+        data["recent_questions"] = recent[-RECENT_QUESTIONS_LIMIT:]
+        snapshot.data = data
+
+    def mark_stale(self, db: Session, user_id: int):
+        """Force a rebuild of one user's snapshot on next read (does not commit)"""
+        db.query(UserLearningSnapshot).filter(
+            UserLearningSnapshot.user_id == user_id
+        ).update({UserLearningSnapshot.is_stale: True}, synchronize_session=False)
+
+    def mark_course_stale(self, db: Session, course_id: int):
+        """Force a rebuild for everyone enrolled in a course (does not commit)"""
+        enrolled_users = db.query(UserCourseProgress.user_id).filter(
+            UserCourseProgress.course_id == course_id
+        )
+        db.query(UserLearningSnapshot).filter(
+            UserLearningSnapshot.user_id.in_(enrolled_users.scalar_subquery())
+        ).update({UserLearningSnapshot.is_stale: True}, synchronize_session=False)
+
+
+# Global learning snapshot service instance
+learning_snapshot = LearningSnapshotService()
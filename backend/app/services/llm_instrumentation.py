@@ -0,0 +1,242 @@
+"""
+Per-call instrumentation of upstream LLM requests
+
+Every completion, stream and assistants run is timed (queue wait, time to
+first token, total), and its tokens, estimated cost, model and outcome are
+exported as metrics labelled by entry point. Per-user totals are kept in
+process for capacity planning, since user IDs are too many for labels.
+"""
+
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from app.core.metrics import metrics
+
+# USD per 1K tokens (prompt, completion); unknown models are counted as free
+MODEL_PRICES_PER_1K = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4-turbo": (0.01, 0.03),
+}
+
+# Share of the prompt price charged for tokens served from the upstream prefix cache
+CACHED_PROMPT_PRICE_FACTOR = 0.5
+
+# Per-user totals kept for this many most recently active users
+USER_USAGE_MAX_ENTRIES = 10000
+
+call_seconds = metrics.histogram(
+    "llm_call_seconds",
+    "LLM call time from entry to finish, including queueing and retries"
+)
+queue_seconds = metrics.histogram(
+    "llm_call_queue_seconds",
+    "Time from entry until the LLM call was first admitted"
+)
+first_token_seconds = metrics.histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from entry until the first streamed token"
+)
+calls_total = metrics.counter(
+    "llm_calls_total",
+    "LLM calls by entry point, model and outcome"
+)
+tokens_total = metrics.counter(
+    "llm_tokens_total",
+    "LLM tokens by entry point, model and kind (prompt/completion/cached_prompt)"
+)
+cost_total = metrics.counter(
+    "llm_cost_usd_total",
+    "Estimated LLM spend in USD by entry point and model"
+)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """cached_tokens are the part of prompt_tokens read from the prefix cache"""
+    prompt_price, completion_price = MODEL_PRICES_PER_1K.get(model, (0.0, 0.0))
+    uncached = prompt_tokens - cached_tokens
+    return (
+        (uncached + cached_tokens * CACHED_PROMPT_PRICE_FACTOR) * prompt_price
+        + completion_tokens * completion_price
+    ) / 1000
+
+
+class UserUsage:
+    """Running LLM totals for one user (or background job key)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.cost_usd = 0.0
+        self.seconds = 0.0
+        self.endpoints: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "seconds": round(self.seconds, 3),
+            "endpoints": dict(self.endpoints),
+        }
+
+
+class LLMCall:
+    """Timing and usage of one upstream call; finish it exactly once"""
+
+    def __init__(self, tracker: "LLMCallTracker", endpoint: str, model: str, user_key: Optional[Hashable]):
+        self.tracker = tracker
+        self.endpoint = endpoint
+        self.model = model
+        self.user_key = user_key
+        self.started = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.finished = False
+
+    def wrap(self, call: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+        """Mark admission when the scheduler first invokes call"""
+        def invoke():
+            if self.admitted_at is None:
+                self.admitted_at = time.monotonic()
+                queue_seconds.observe(self.admitted_at - self.started, endpoint=self.endpoint)
+            return call()
+        return invoke
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+            first_token_seconds.observe(self.first_token_at - self.started, endpoint=self.endpoint, model=self.model)
+
+    def succeed(self, prompt_tokens: Optional[int], completion_tokens: Optional[int], cached_tokens: Optional[int] = None):
+        self.finish("ok", prompt_tokens, completion_tokens, cached_tokens)
+
+    def fail(self, error: BaseException):
+        # GeneratorExit: the client went away mid-stream
+        cancelled = isinstance(error, (asyncio.CancelledError, GeneratorExit))
+        self.finish("cancelled" if cancelled else "error")
+
+    def finish(
+        self,
+        outcome: str,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        cached_tokens: Optional[int] = None
+    ):
+        if self.finished:
+            return
+        self.finished = True
+        prompt_tokens = prompt_tokens or 0
+        completion_tokens = completion_tokens or 0
+        elapsed = time.monotonic() - self.started
+        labels = {"endpoint": self.endpoint, "model": self.model}
+
+        call_seconds.observe(elapsed, outcome=outcome, **labels)
+        calls_total.inc(outcome=outcome, **labels)
+        cost = estimate_cost(self.model, prompt_tokens, completion_tokens, cached_tokens or 0)
+        if prompt_tokens:
+            tokens_total.inc(prompt_tokens, kind="prompt", **labels)
+        if completion_tokens:
+            tokens_total.inc(completion_tokens, kind="completion", **labels)
+        if cached_tokens:
+            tokens_total.inc(cached_tokens, kind="cached_prompt", **labels)
+        if cost:
+            cost_total.inc(cost, **labels)
+
+        self.tracker._record_prompt_cache(self.endpoint, prompt_tokens, cached_tokens)
+        self.tracker._record_user(self, outcome, prompt_tokens, completion_tokens, cached_tokens or 0, cost, elapsed)
+
+
+class LLMCallTracker:
+    """Starts LLMCall records and keeps per-user aggregates"""
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._users: "OrderedDict[Hashable, UserUsage]" = OrderedDict()
+        self._prompt_cache: Dict[str, List[int]] = {}  # endpoint -> [calls, prompt tokens, cached tokens]
+        self._lock = threading.Lock()
+
+    def start(self, endpoint: str, model: str, user_key: Optional[Hashable] = None) -> LLMCall:
+        return LLMCall(self, endpoint, model, user_key)
+
+    def _record_prompt_cache(self, endpoint: str, prompt_tokens: int, cached_tokens: Optional[int]):
+        # Only calls whose upstream reports cache usage count towards the hit rate
+        if cached_tokens is None or not prompt_tokens:
+            return
+        with self._lock:
+            stats = self._prompt_cache.setdefault(endpoint, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += prompt_tokens
+            stats[2] += cached_tokens
+
+    def _record_user(
+        self,
+        call: LLMCall,
+        outcome: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        cost: float,
+        elapsed: float
+    ):
+        if call.user_key is None:
+            return
+        with self._lock:
+            usage = self._users.get(call.user_key)
+            if usage is None:
+                usage = self._users[call.user_key] = UserUsage()
+            self._users.move_to_end(call.user_key)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+            usage.calls += 1
+            usage.errors += outcome != "ok"
+            usage.prompt_tokens += prompt_tokens
+            usage.completion_tokens += completion_tokens
+            usage.cached_prompt_tokens += cached_tokens
+            usage.cost_usd += cost
+            usage.seconds += elapsed
+            usage.endpoints[call.endpoint] = usage.endpoints.get(call.endpoint, 0) + 1
+
+    def top_users(self, limit: int = 50, order_by: str = "total_tokens") -> List[Dict[str, Any]]:
+        """Heaviest users of this worker since start"""
+        def weight(item):
+            usage = item[1]
+            if order_by == "cost":
+                return usage.cost_usd
+            if order_by == "calls":
+                return usage.calls
+            return usage.prompt_tokens + usage.completion_tokens
+
+        with self._lock:
+            ranked = sorted(self._users.items(), key=weight, reverse=True)[:limit]
+            return [{"user": str(user_key), **usage.to_dict()} for user_key, usage in ranked]
+
+    def prompt_cache_report(self) -> List[Dict[str, Any]]:
+        """Per endpoint: share of prompt tokens served from the upstream prefix cache"""
+        with self._lock:
+            stats = sorted(self._prompt_cache.items())
+        return [
+            {
+                "endpoint": endpoint,
+                "calls": calls,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "hit_rate": round(cached_tokens / prompt_tokens, 4),
+            }
+            for endpoint, (calls, prompt_tokens, cached_tokens) in stats
+        ]
+
+
+# Global LLM call tracker instance
+llm_calls = LLMCallTracker(USER_USAGE_MAX_ENTRIES)
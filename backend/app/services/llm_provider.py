@@ -0,0 +1,257 @@
+"""
+LLM provider backends
+
+Chat completion, streaming and embeddings go through an LLMProvider chosen by
+Settings.LLM_PROVIDER:
+
+- "openai": the OpenAI API or compatible upstreams (OPENAI_API_BASES), with
+  failover, circuit breaking and optional hedging between them
+- "local": deterministic offline backend with configurable latency and token
+  rate, for load-testing the chat stack without network access
+
+Admission control and retries stay in the LLM scheduler; providers only make
+the calls.
+"""
+
+import re
+import math
+import random
+import asyncio
+import hashlib
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.transcript_index import count_tokens, tokenize
+from app.services.upstream_pool import UpstreamPool, create_upstream_pool
+
+
+class Completion:
+    """Provider-neutral chat completion result"""
+
+    def __init__(
+        self,
+        content: str,
+        model: str,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        cached_tokens: Optional[int] = None
+    ):
+        self.content = content
+        self.model = model
+        self.prompt_tokens = prompt_tokens  # None when the backend doesn't report usage
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens  # Prompt tokens served from the upstream prefix cache
+
+
+class CompletionStream:
+    """Async iterator of text deltas; aclose() aborts the upstream response"""
+
+    def __init__(self, deltas: AsyncIterator[str], close=None):
+        self._deltas = deltas
+        self._close = close
+
+    def __aiter__(self):
+        return self._deltas
+
+    async def aclose(self):
+        await self._deltas.aclose()
+        if self._close is not None:
+            await self._close()
+
+
+class LLMProvider:
+    """Interface for chat completion backends"""
+
+    name = "base"
+    supports_assistants = False  # Assistants API threads, runs and files
+
+    def __init__(self, model: str, embedding_model: str):
+        self.model = model  # Default when a call doesn't ask for a specific model
+        self.embedding_model = embedding_model
+
+    def resolve_model(self, model: Optional[str] = None) -> str:
+        """Model a call asking for model will actually run on"""
+        return model or self.model
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float = 0.7,
+        model: Optional[str] = None
+    ) -> Completion:
+        raise NotImplementedError
+
+    async def open_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float = 0.7,
+        model: Optional[str] = None
+    ) -> CompletionStream:
+        """Start a streamed completion; returns once the upstream accepted the request"""
+        raise NotImplementedError
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+def _cached_tokens(usage) -> Optional[int]:
+    """usage.prompt_tokens_details.cached_tokens; the client's models predate it, so it arrives as an extra field"""
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    if isinstance(details, dict):
+        return details.get("cached_tokens")
+    return getattr(details, "cached_tokens", None)
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions and embeddings, routed through an upstream pool"""
+
+    name = "openai"
+    supports_assistants = True
+
+    def __init__(self, pool: UpstreamPool, model: str, embedding_model: str):
+        super().__init__(model, embedding_model)
+        self.pool = pool
+
+    async def complete(self, messages, max_tokens, temperature=0.7, model=None) -> Completion:
+        model = self.resolve_model(model)
+        completion = await self.pool.call(lambda client: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        ))
+        usage = completion.usage
+        return Completion(
+            completion.choices[0].message.content or "",
+            completion.model or model,
+            usage.prompt_tokens if usage else None,
+            usage.completion_tokens if usage else None,
+            _cached_tokens(usage)
+        )
+
+    async def open_stream(self, messages, max_tokens, temperature=0.7, model=None) -> CompletionStream:
+        model = self.resolve_model(model)
+
+        async def close_stream(stream):
+            await stream.response.aclose()
+
+        stream = await self.pool.call(
+            lambda client: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            ),
+            discard=close_stream
+        )
+
+        async def deltas():
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        return CompletionStream(deltas(), stream.response.aclose)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response = await self.pool.call(
+            lambda client: client.embeddings.create(model=self.embedding_model, input=texts)
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class LocalProvider(LLMProvider):
+    """Deterministic offline backend.
+
+    The same messages always produce the same answer. Timing mimics a hosted
+    model: LOCAL_LLM_LATENCY until the first token, then LOCAL_LLM_TOKENS_PER_SECOND.
+    """
+
+    name = "local"
+
+    VOCABULARY = (
+        "урок", "переменная", "функция", "пример", "значение", "данные", "шаг",
+        "объяснение", "задача", "результат", "код", "вопрос", "идея", "модуль",
+        "практика", "понятие", "метод", "список", "условие", "цикл",
+    )
+
+    def __init__(self, model: str, embedding_model: str, latency: float, tokens_per_second: float, embedding_dim: int):
+        super().__init__(model, embedding_model)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.embedding_dim = embedding_dim
+
+    def resolve_model(self, model: Optional[str] = None) -> str:
+        # Tiers name hosted models; everything runs on the one local model
+        return self.model
+
+    def _answer_words(self, messages: List[Dict[str, str]], max_tokens: int) -> List[str]:
+        digest = hashlib.sha256(
+            "\n".join(f"{m['role']}:{m['content']}" for m in messages).encode("utf-8")
+        ).hexdigest()
+        rng = random.Random(digest)
+        question = re.sub(r"\s+", " ", messages[-1]["content"][-200:]).strip() if messages else ""
+
+        words = ["Ответ", f"[{digest[:8]}]:"]
+        words += rng.choices(self.VOCABULARY, k=rng.randint(30, 90))
+        words += ["Вопрос:", question]
+        # Roughly one token per word; stop at the completion limit like a real model
+        return words[:max(1, max_tokens)]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    async def complete(self, messages, max_tokens, temperature=0.7, model=None) -> Completion:
+        words = self._answer_words(messages, max_tokens)
+        await asyncio.sleep(self.latency + len(words) * self._token_delay())
+        content = " ".join(words)
+        return Completion(
+            content,
+            self.model,
+            sum(count_tokens(m["content"]) for m in messages),
+            count_tokens(content)
+        )
+
+    async def open_stream(self, messages, max_tokens, temperature=0.7, model=None) -> CompletionStream:
+        words = self._answer_words(messages, max_tokens)
+        await asyncio.sleep(self.latency)
+
+        async def deltas():
+            for i, word in enumerate(words):
+                await asyncio.sleep(self._token_delay())
+                yield word if i == 0 else f" {word}"
+
+        return CompletionStream(deltas())
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Hashed bag-of-words vectors: deterministic, and similar texts land close together"""
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.embedding_dim
+            for term in tokenize(text):
+                bucket = int(hashlib.md5(term.encode("utf-8")).hexdigest(), 16)
+                vector[bucket % self.embedding_dim] += 1.0 if bucket & 1 else -1.0
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+
+def create_provider(openai_client_factory=None) -> LLMProvider:
+    """Provider selected by Settings.LLM_PROVIDER; openai_client_factory(base_url) builds upstream clients"""
+    if settings.LLM_PROVIDER == "local":
+        return LocalProvider(
+            model="local-deterministic",
+            embedding_model="local-hashing",
+            latency=settings.LOCAL_LLM_LATENCY,
+            tokens_per_second=settings.LOCAL_LLM_TOKENS_PER_SECOND,
+            embedding_dim=settings.LOCAL_LLM_EMBEDDING_DIM
+        )
+    if settings.LLM_PROVIDER == "openai":
+        return OpenAIProvider(
+            create_upstream_pool(openai_client_factory),
+            settings.LLM_MODEL,
+            settings.LLM_EMBEDDING_MODEL
+        )
+    raise ValueError(f"Unknown LLM_PROVIDER: {settings.LLM_PROVIDER}")
@@ -0,0 +1,214 @@
+"""
+Admission scheduler for outbound LLM calls
+
+Bounds how many completions run upstream at once and hands free slots to
+waiting users round-robin, so one user firing many requests can't starve
+the rest of a class. Rate-limit responses pause admissions for the
+Retry-After period and the call is retried with jittered backoff.
+"""
+
+import time
+import random
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Hashable, Optional
+
+import openai
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # Includes APITimeoutError
+    openai.InternalServerError,
+)
+
+queue_depth = metrics.gauge(
+    "llm_queue_depth",
+    "LLM calls waiting for an admission slot"
+)
+active_calls = metrics.gauge(
+    "llm_active_calls",
+    "LLM calls currently holding an admission slot"
+)
+queue_wait_seconds = metrics.histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM calls spent waiting for an admission slot"
+)
+retries_total = metrics.counter(
+    "llm_retries_total",
+    "LLM calls retried after a retryable upstream error"
+)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read Retry-After (seconds or HTTP date) from an upstream error response"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = response.headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """Concurrency-bounded scheduler with per-user round-robin queues"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._active = 0
+        self._queues: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        self._paused_until = 0.0
+        self._resume_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _update_gauges(self):
+        queue_depth.set(self.queued)
+        active_calls.set(self._active)
+
+    def _is_paused(self) -> bool:
+        return time.monotonic() < self._paused_until
+
+    async def acquire(self, user_key: Hashable):
+        """Wait for an admission slot, taking turns with other users"""
+        if self._active < self.max_concurrency and not self._queues and not self._is_paused():
+            self._active += 1
+            self._update_gauges()
+            queue_wait_seconds.observe(0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_key, deque()).append(future)
+        self._dispatch()
+        started = time.monotonic()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled
+                self.release()
+            else:
+                self._forget(user_key, future)
+            raise
+        finally:
+            queue_wait_seconds.observe(time.monotonic() - started)
+
+    def release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def pause(self, seconds: float):
+        """Stop admitting new calls for a while, e.g. after a 429"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _forget(self, user_key: Hashable, future: asyncio.Future):
+        queue = self._queues.get(user_key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self._queues[user_key]
+        self._update_gauges()
+
+    def _dispatch(self):
+        """Grant free slots to queued users round-robin"""
+        while self._active < self.max_concurrency and self._queues:
+            if self._is_paused():
+                self._schedule_resume()
+                break
+
+            user_key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_key)
+            else:
+                del self._queues[user_key]
+
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+        self._update_gauges()
+
+    def _schedule_resume(self):
+        if self._resume_handle is not None and not self._resume_handle.cancelled():
+            return
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, self._paused_until - time.monotonic())
+
+        def resume():
+            self._resume_handle = None
+            self._dispatch()
+
+        self._resume_handle = loop.call_later(delay, resume)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def _call_with_retries(self, user_key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Acquire a slot and run the call, retrying retryable errors; returns holding the slot"""
+        attempt = 0
+        while True:
+            await self.acquire(user_key)
+            try:
+                return await call()
+            except RETRYABLE_ERRORS as e:
+                self.release()
+                if attempt >= settings.LLM_MAX_RETRIES:
+                    raise
+                retry_after = retry_after_seconds(e)
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                if isinstance(e, openai.RateLimitError):
+                    # Everyone would hit the same limit, so hold the whole queue
+                    self.pause(delay)
+                retries_total.inc(reason=type(e).__name__)
+            except BaseException:
+                self.release()
+                raise
+
+            # Slot is released while backing off
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def run(self, user_key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run an upstream call under admission control"""
+        result = await self._call_with_retries(user_key, call)
+        self.release()
+        return result
+
+    @asynccontextmanager
+    async def admitted(self, user_key: Hashable, call: Callable[[], Awaitable[Any]]):
+        """Like run(), but keep the slot until the block exits (for streamed responses)"""
+        result = await self._call_with_retries(user_key, call)
+        try:
+            yield result
+        finally:
+            self.release()
+
+
+# Global LLM scheduler instance
+llm_scheduler = LLMScheduler(settings.LLM_MAX_CONCURRENCY)
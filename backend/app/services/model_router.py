@@ -0,0 +1,166 @@
+"""
+Model routing by request complexity
+
+Small talk and simple questions go to a fast tier with a small completion
+limit; explanation or code requests, long questions and prompts carrying a
+large lesson context go to a strong tier. The classifier only looks at the
+question text and the prompt's token accounting, so it costs nothing next
+to the call itself.
+
+Every decision is counted with its reason, and per-tier latency is checked
+against the endpoint's SLO, so thresholds can be tuned from /metrics or
+/api/admin/llm-routing.
+"""
+
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.prompt_builder import Prompt
+from app.services.transcript_index import count_tokens
+
+TIER_FAST = "fast"
+TIER_STRONG = "strong"
+
+# Whole-message pleasantries that need no more than a line in reply
+SMALL_TALK_WORDS = {
+    "спасибо", "благодарю", "пасибо", "спс", "привет", "здравствуйте", "здравствуй",
+    "пока", "ок", "окей", "понятно", "ясно", "хорошо", "отлично", "супер", "класс",
+    "да", "нет", "ага", "большое", "огромное", "понял", "поняла",
+    "thanks", "thank", "you", "hi", "hello", "ok", "okay", "great",
+}
+SMALL_TALK_MAX_WORDS = 4
+
+# Word stems asking for explanation, reasoning or code
+STRONG_INTENT_STEMS = (
+    "объясн", "подробн", "почему", "зачем", "сравн", "разниц", "отлича", "докаж",
+    "пример", "код", "напиш", "реши", "решени", "пошагов", "разбер", "проанализ",
+    "оптимиз", "ошибк", "explain", "why", "compare", "code", "example", "step",
+)
+
+# Prompt sections that count as context for the large-context rule
+CONTEXT_SECTIONS = ("lesson_context", "lesson_excerpts", "summary", "history", "progress", "insights")
+
+route_decisions = metrics.counter(
+    "llm_route_decisions_total",
+    "Model tier chosen per chat call, by endpoint and reason"
+)
+route_latency = metrics.histogram(
+    "llm_route_latency_seconds",
+    "Chat latency per endpoint and tier (complete: full answer, first_token: streams)"
+)
+slo_breaches = metrics.counter(
+    "llm_slo_breaches_total",
+    "Chat calls slower than the endpoint's latency SLO, by tier and phase"
+)
+
+
+class ModelTier:
+    """A model and the completion limit used with it"""
+
+    def __init__(self, name: str, model: str, max_tokens: int):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+
+
+class RouteDecision:
+    """Tier picked for one call and why"""
+
+    def __init__(self, tier: ModelTier, reason: str):
+        self.tier = tier
+        self.reason = reason
+
+    def message_data(self) -> Dict[str, str]:
+        """Routing info for ChatMessage.message_data"""
+        return {"route": self.tier.name, "route_reason": self.reason}
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class ModelRouter:
+    """Classifies chat requests into model tiers and tracks latency against SLOs"""
+
+    def __init__(self):
+        self.tiers = {
+            TIER_FAST: ModelTier(
+                TIER_FAST,
+                settings.LLM_FAST_MODEL or settings.LLM_MODEL,
+                settings.LLM_FAST_MAX_TOKENS
+            ),
+            TIER_STRONG: ModelTier(
+                TIER_STRONG,
+                settings.LLM_STRONG_MODEL or settings.LLM_MODEL,
+                settings.LLM_MAX_COMPLETION_TOKENS
+            ),
+        }
+        self._stats: Dict[Tuple[str, str, str], List[int]] = {}  # (endpoint, tier, phase) -> [calls, breaches]
+        self._lock = threading.Lock()
+
+    def classify(self, question: str, prompt: Prompt) -> Tuple[str, str]:
+        """(tier name, reason) for a question and its assembled prompt"""
+        words = _words(question)
+        if words and len(words) <= SMALL_TALK_MAX_WORDS and "?" not in question \
+                and all(word in SMALL_TALK_WORDS for word in words):
+            return TIER_FAST, "small_talk"
+
+        if any(word.startswith(STRONG_INTENT_STEMS) for word in words):
+            return TIER_STRONG, "intent"
+        if count_tokens(question) >= settings.LLM_ROUTE_LONG_QUESTION_TOKENS:
+            return TIER_STRONG, "long_question"
+        context_tokens = sum(prompt.sections.get(name, 0) for name in CONTEXT_SECTIONS)
+        if context_tokens >= settings.LLM_ROUTE_LARGE_CONTEXT_TOKENS:
+            return TIER_STRONG, "large_context"
+        return TIER_FAST, "simple"
+
+    def route(self, endpoint: str, question: str, prompt: Prompt) -> RouteDecision:
+        if settings.LLM_ROUTING_ENABLED:
+            tier, reason = self.classify(question, prompt)
+        else:
+            tier, reason = TIER_STRONG, "disabled"
+        route_decisions.inc(endpoint=endpoint, tier=tier, reason=reason)
+        return RouteDecision(self.tiers[tier], reason)
+
+    def observe(self, endpoint: str, decision: RouteDecision, phase: str, seconds: float):
+        """Record a latency (phase "complete" or "first_token") and check it against the SLO"""
+        tier = decision.tier.name
+        route_latency.observe(seconds, endpoint=endpoint, tier=tier, phase=phase)
+        slo = self.slo(endpoint, phase)
+        breached = slo is not None and seconds > slo
+        if breached:
+            slo_breaches.inc(endpoint=endpoint, tier=tier, phase=phase)
+        with self._lock:
+            stats = self._stats.setdefault((endpoint, tier, phase), [0, 0])
+            stats[0] += 1
+            stats[1] += breached
+
+    def slo(self, endpoint: str, phase: str) -> Optional[float]:
+        if phase == "first_token":
+            return settings.LLM_FIRST_TOKEN_SLO_SECONDS
+        return settings.LLM_LATENCY_SLO_SECONDS.get(endpoint)
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Per endpoint/tier/phase: calls, p50/p95 and SLO attainment since start"""
+        with self._lock:
+            stats = sorted(self._stats.items())
+        rows = []
+        for (endpoint, tier, phase), (calls, breaches) in stats:
+            labels = {"endpoint": endpoint, "tier": tier, "phase": phase}
+            rows.append({
+                **labels,
+                "model": self.tiers[tier].model,
+                "calls": calls,
+                "p50_seconds": route_latency.quantile(0.5, **labels),
+                "p95_seconds": route_latency.quantile(0.95, **labels),
+                "slo_seconds": self.slo(endpoint, phase),
+                "slo_attainment": round(1 - breaches / calls, 4) if calls else None,
+            })
+        return rows
+
+
+# Global model router instance
+model_router = ModelRouter()
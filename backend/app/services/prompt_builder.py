@@ -0,0 +1,236 @@
+"""
+Token-budgeted prompt assembly for chat completions
+
+Sections are admitted by priority (system prompt, question, lesson or user
+context, conversation summary, chat history) until the prompt budget is
+spent, then rendered in their display order. Sections that don't fit are
+cut at a sentence boundary; chat history drops its oldest messages first.
+
+PromptTemplate fixes the system message and section layout once, so every
+prompt of a kind starts with the same bytes and the parts that change most
+often come last, where they don't break provider prefix caching.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.transcript_index import CHARS_PER_TOKEN, count_tokens
+
+# Lower value = admitted first
+PRIORITY_SYSTEM = 0
+PRIORITY_QUESTION = 1
+PRIORITY_CONTEXT = 2
+PRIORITY_SUMMARY = 3
+PRIORITY_HISTORY = 4
+
+# Chat format overhead: role/separators per message, plus priming of the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+# Sections left with less room than this are dropped rather than cut to a stub
+MIN_SECTION_TOKENS = 32
+
+TRUNCATION_MARK = " …"
+SECTION_SEPARATOR = "\n\n"
+
+_SENTENCE_END_RE = re.compile(r"[.!?…](\s|$)|\n")
+
+prompt_tokens_histogram = metrics.histogram(
+    "llm_prompt_tokens",
+    "Estimated prompt tokens per chat completion",
+    buckets=(250, 500, 1000, 2000, 3000, 4000, 8000, 16000)
+)
+completion_tokens_histogram = metrics.histogram(
+    "llm_completion_tokens",
+    "Completion tokens per chat completion",
+    buckets=(50, 100, 250, 500, 1000, 2000)
+)
+sections_truncated = metrics.counter(
+    "llm_prompt_sections_truncated_total",
+    "Prompt sections cut or dropped to fit the token budget"
+)
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring a sentence then a word boundary"""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max(0, int(max_tokens * CHARS_PER_TOKEN) - len(TRUNCATION_MARK))
+    head = text[:max_chars]
+
+    # Only back off to a boundary if it doesn't throw away too much
+    min_chars = int(max_chars * 0.7)
+    sentence_ends = [m.end() for m in _SENTENCE_END_RE.finditer(head) if m.end() >= min_chars]
+    if sentence_ends:
+        head = head[:sentence_ends[-1]]
+    else:
+        space = head.rfind(" ")
+        if space >= min_chars:
+            head = head[:space]
+
+    return head.rstrip() + TRUNCATION_MARK
+
+
+class PromptSection:
+    """One block of the user message"""
+
+    def __init__(self, name: str, priority: int, text: str = "", title: str = "", items: Optional[List[str]] = None):
+        self.name = name
+        self.priority = priority
+        self.text = text
+        self.title = title
+        self.items = items  # History entries, oldest first; None for plain text blocks
+        self.rendered = ""
+
+    def fit(self, budget: int) -> Tuple[str, bool]:
+        """Render the section within budget tokens; returns (text, truncated)"""
+        if self.items is None:
+            truncated = count_tokens(self.text) > budget
+            return truncate_text(self.text, budget), truncated
+
+        lines = []
+        used = count_tokens(self.title) + 1
+        for item in reversed(self.items):  # Newest first
+            item = truncate_text(item, settings.PROMPT_HISTORY_ITEM_MAX_TOKENS)
+            cost = count_tokens(item) + 1
+            if used + cost > budget:
+                break
+            lines.append(item)
+            used += cost
+
+        truncated = len(lines) < len(self.items)
+        body = "\n".join(reversed(lines))
+        return f"{self.title}\n{body}" if self.title else body, truncated
+
+
+class Prompt:
+    """Assembled messages plus token accounting"""
+
+    def __init__(self, messages: List[Dict[str, str]], tokens: int, sections: Dict[str, int], truncated: List[str]):
+        self.messages = messages
+        self.tokens = tokens
+        self.sections = sections
+        self.truncated = truncated
+
+    def usage_data(self) -> Dict[str, object]:
+        """Prompt accounting for ChatMessage.message_data"""
+        data = {"prompt_tokens_estimate": self.tokens, "prompt_sections": self.sections}
+        if self.truncated:
+            data["prompt_truncated"] = self.truncated
+        return data
+
+
+class PromptBuilder:
+    """Fills a token budget with a system prompt and prioritized user-message sections"""
+
+    def __init__(self, kind: str, budget: Optional[int] = None):
+        self.kind = kind
+        self.budget = budget if budget is not None else settings.PROMPT_TOKEN_BUDGET
+        self.system_prompt = ""
+        self.sections: List[PromptSection] = []
+
+    def system(self, text: str) -> "PromptBuilder":
+        self.system_prompt = text
+        return self
+
+    def text(self, name: str, text: str, priority: int) -> "PromptBuilder":
+        self.sections.append(PromptSection(name, priority, text=text))
+        return self
+
+    def history(self, name: str, title: str, items: Optional[List[str]], priority: int = PRIORITY_HISTORY) -> "PromptBuilder":
+        """Chat history, oldest first; the oldest entries are dropped first"""
+        self.sections.append(PromptSection(name, priority, title=title, items=items))
+        return self
+
+    def build(self) -> Prompt:
+        remaining = self.budget - REPLY_PRIMING_TOKENS - 2 * MESSAGE_OVERHEAD_TOKENS
+        sizes = {"system": count_tokens(self.system_prompt)}
+        remaining -= sizes["system"]
+        truncated = []
+
+        # Stable sort keeps display order within the same priority
+        for section in sorted(self.sections, key=lambda s: s.priority):
+            if not section.text and section.items is None:
+                continue
+            room = remaining - count_tokens(SECTION_SEPARATOR)
+            if room < MIN_SECTION_TOKENS and section.priority > PRIORITY_QUESTION:
+                section.rendered, cut = "", True
+            else:
+                section.rendered, cut = section.fit(max(room, MIN_SECTION_TOKENS))
+            if cut:
+                truncated.append(section.name)
+                sections_truncated.inc(prompt=self.kind, section=section.name)
+            sizes[section.name] = count_tokens(section.rendered)
+            remaining -= sizes[section.name] + count_tokens(SECTION_SEPARATOR)
+
+        user_message = SECTION_SEPARATOR.join(s.rendered for s in self.sections if s.rendered)
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+
+        tokens = (
+            sum(count_tokens(m["content"]) for m in messages)
+            + len(messages) * MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS
+        )
+        prompt_tokens_histogram.observe(tokens, prompt=self.kind)
+        return Prompt(messages, tokens, sizes, truncated)
+
+
+class TemplateSection:
+    """Layout of one dynamic section: heading, priority and whether it is chat history"""
+
+    def __init__(self, name: str, priority: int, title: str = "", history: bool = False):
+        self.name = name
+        self.priority = priority
+        self.title = title
+        self.is_history = history
+        self.prefix = f"{title}\n" if title and not history else ""
+
+
+class PromptTemplate:
+    """Compiled prompt layout: a static system message, then dynamic sections in display order.
+
+    Order sections from the most to the least stable (per lesson or user first,
+    per message last) so consecutive prompts share the longest possible prefix.
+    """
+
+    def __init__(self, kind: str, system: str, sections: List[TemplateSection]):
+        self.kind = kind
+        self.system = system
+        self.sections = sections
+
+    def render(self, budget: Optional[int] = None, **values) -> Prompt:
+        """Fill the sections from values (text, or a list of entries for history); empty ones are skipped"""
+        builder = PromptBuilder(self.kind, budget).system(self.system)
+        for section in self.sections:
+            value = values.get(section.name)
+            if section.is_history:
+                builder.history(section.name, section.title, value or None, section.priority)
+            else:
+                builder.text(section.name, f"{section.prefix}{value}" if value else "", section.priority)
+        return builder.build()
+
+
+def completion_usage(completion, prompt: Prompt, response_text: Optional[str] = None) -> Dict[str, object]:
+    """Token usage for message_data: upstream usage when reported, estimates otherwise"""
+    if completion is not None and completion.prompt_tokens is not None:
+        data = {
+            "prompt_tokens": completion.prompt_tokens,
+            "completion_tokens": completion.completion_tokens,
+            "usage_estimated": False,
+        }
+        if completion.cached_tokens is not None:
+            data["cached_tokens"] = completion.cached_tokens
+    else:
+        # Streamed completions don't report usage
+        data = {
+            "prompt_tokens": prompt.tokens,
+            "completion_tokens": count_tokens(response_text or (completion.content if completion else "")),
+            "usage_estimated": True,
+        }
+    completion_tokens_histogram.observe(data["completion_tokens"])
+    return {**prompt.usage_data(), **data}
@@ -0,0 +1,73 @@
+"""
+Compiled chat prompt templates
+
+One template per kind of chat, shared by its regular and streaming
+entry points. System messages and section headings are fixed here, never
+interpolated, so every prompt of a kind starts with byte-identical text.
+Dynamic sections are laid out from the most stable (per lesson, per user)
+to the most volatile (chat history, the new message), which keeps the
+shared prefix long enough for upstream prompt caching to apply.
+"""
+
+from app.services.prompt_builder import (
+    PromptTemplate, TemplateSection,
+    PRIORITY_QUESTION, PRIORITY_CONTEXT, PRIORITY_SUMMARY, PRIORITY_HISTORY
+)
+
+LESSON_TUTOR_PROMPT = """Ты - дружелюбный AI-преподаватель платформы ExpoVisionED.
+Отвечай на вопросы студентов по материалам уроков, используя предоставленный контекст урока.
+Помни предыдущие разговоры по курсу и связывай новые вопросы с ранее изученным материалом.
+Всегда отвечай на русском языке дружелюбно и профессионально."""
+
+PERSONAL_ASSISTANT_PROMPT = """Ты - персональный AI-ассистент для обучения на платформе ExpoVisionED. У тебя есть полная информация о прогрессе студента, его курсах, пройденных уроках и активности.
+
+ТВОЯ ЗАДАЧА:
+- Анализировать прогресс студента и давать конкретные рекомендации
+- Помогать с планированием обучения
+- Мотивировать к продолжению изучения курсов
+- Отвечать на вопросы о контенте курсов
+- Предлагать оптимальные стратегии обучения
+
+СТРОГИЕ ПРАВИЛА ОБЩЕНИЯ:
+- НИКОГДА не используй слова "Привет", "Здравствуй" или любые приветствия в ответах
+- НИКОГДА не говори "рад видеть" или подобные фразы
+- СРАЗУ переходи к сути вопроса
+- Если история чата пустая, просто представь свои возможности БЕЗ приветствия
+- Будь конкретным и полезным
+- Анализируй данные и давай персональные советы
+- Отвечай кратко, но информативно
+
+НЕПРАВИЛЬНО: "Привет! Рад видеть твой интерес к обучению..."
+ПРАВИЛЬНО: "После анализа твоего прогресса на курсе..."
+
+ТВОИ ВОЗМОЖНОСТИ:
+- Видишь все курсы студента и прогресс по ним
+- Знаешь какие уроки пройдены, а какие нет
+- Анализируешь вопросы из урочных чатов
+- Можешь определить сложные темы для студента
+- Предлагаешь персональный план развития
+
+Отвечай на русском языке. Будь наставником, а не просто чат-ботом! ЗАПОМНИ: никаких приветствий!"""
+
+LESSON_CHAT_TEMPLATE = PromptTemplate("lesson", LESSON_TUTOR_PROMPT, [
+    # Same for every student of the lesson
+    TemplateSection("lesson_context", PRIORITY_CONTEXT, "КОНТЕКСТ УРОКА:"),
+    # Per student, changes every few messages
+    TemplateSection("summary", PRIORITY_SUMMARY, "КРАТКОЕ СОДЕРЖАНИЕ ПРЕДЫДУЩЕГО РАЗГОВОРА:"),
+    TemplateSection("history", PRIORITY_HISTORY, "ИСТОРИЯ ЧАТА ПО КУРСУ:", history=True),
+    # Per message
+    TemplateSection("lesson_excerpts", PRIORITY_CONTEXT, "ФРАГМЕНТЫ УРОКА, ОТНОСЯЩИЕСЯ К ВОПРОСУ:"),
+    TemplateSection("question", PRIORITY_QUESTION, "ВОПРОС СТУДЕНТА:"),
+])
+
+# Jarvis and personal chats share one template
+PERSONAL_CHAT_TEMPLATE = PromptTemplate("personal", PERSONAL_ASSISTANT_PROMPT, [
+    # Per student, changes with progress
+    TemplateSection("progress", PRIORITY_CONTEXT, "ПЕРСОНАЛЬНЫЙ AI-АССИСТЕНТ"),
+    TemplateSection("insights", PRIORITY_CONTEXT),
+    # Per thread
+    TemplateSection("summary", PRIORITY_SUMMARY, "КРАТКОЕ СОДЕРЖАНИЕ ПРЕДЫДУЩЕГО РАЗГОВОРА:"),
+    TemplateSection("history", PRIORITY_HISTORY, "ПОСЛЕДНИЕ СООБЩЕНИЯ В ЭТОМ ЧАТЕ:", history=True),
+    # Per message
+    TemplateSection("question", PRIORITY_QUESTION, "НОВОЕ СООБЩЕНИЕ СТУДЕНТА:"),
+])
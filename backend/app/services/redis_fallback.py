@@ -0,0 +1,48 @@
+"""
+Optional Redis connection with an in-process fallback
+
+Services that share state across workers through Redis (answer cache,
+thread locks) keep working on their in-process implementation when Redis
+is turned off or unreachable. After a failure Redis is left alone for
+REDIS_RETRY_INTERVAL, so requests don't each wait on a dead server.
+"""
+
+import time
+from typing import Callable
+
+from app.core.config import settings
+
+REDIS_RETRY_INTERVAL = 30.0
+
+
+class RedisFallback:
+    """Lazily connected Redis client that steps aside for a while after an error"""
+
+    def __init__(self, enabled: Callable[[], bool], timeout: float, unavailable_message: str):
+        self._enabled = enabled
+        self._timeout = timeout
+        self._unavailable_message = unavailable_message
+        self._client = None
+        self._down_until = 0.0
+
+    def client(self):
+        """Redis client, or None while Redis is disabled or recently failed"""
+        if not self._enabled() or time.monotonic() < self._down_until:
+            return None
+        if self._client is None:
+            import redis.asyncio as redis
+            self._client = redis.from_url(
+                settings.REDIS_URL,
+                socket_connect_timeout=self._timeout,
+                socket_timeout=self._timeout
+            )
+        return self._client
+
+    def failed(self, e: Exception):
+        """Fall back to the in-process implementation for REDIS_RETRY_INTERVAL"""
+        print(f"❌ {self._unavailable_message}: {e}")
+        self._down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
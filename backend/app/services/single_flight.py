@@ -0,0 +1,39 @@
+"""
+Single-flight coalescing of identical in-flight calls
+
+Concurrent callers with the same key share one execution of the underlying
+call and all receive its result (or its exception).
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from app.core.metrics import metrics
+
+calls_coalesced = metrics.counter(
+    "llm_calls_coalesced_total",
+    "Upstream LLM calls saved by joining an identical in-flight call"
+)
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run call once per key at a time; returns (result, shared)"""
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if shared:
+            calls_coalesced.inc(flight=self.name)
+        else:
+            # Run as its own task so a cancelled leader doesn't fail the followers
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return await asyncio.shield(task), shared
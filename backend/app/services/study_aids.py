@@ -0,0 +1,269 @@
+"""
+Pre-generated lesson study aids
+
+"Summarize this lesson" and "quiz me" don't need a live completion over the
+whole transcript each time. When a lesson's transcript changes, a background
+job generates a summary, key points and quiz items once and stores them in
+LessonStudyAid; they are served as-is by the API and the summary doubles as
+compact whole-lesson context in lesson-chat prompts.
+"""
+
+import json
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import SessionLocal
+from app.models.lesson import Lesson
+from app.models.lesson_study_aid import LessonStudyAid
+from app.services.conversation_summary import CompleteFn
+from app.services.transcript_index import count_tokens, split_transcript, transcript_version
+
+# Generation jobs are scheduled as one background user, like summary compaction (see SUMMARY_USER_KEY)
+STUDY_AIDS_USER_KEY = "background:study_aids"
+
+STUDY_AIDS_PROMPT = """Ты методист платформы ExpoVisionED. По транскрипту урока подготовь учебные материалы.
+Ответь только JSON-объектом без пояснений и без markdown, в формате:
+{"summary": "краткое содержание урока, 5-8 предложений",
+ "key_points": ["ключевая мысль", ...],
+ "quiz": [{"question": "вопрос", "options": ["вариант", ...], "answer": 0, "explanation": "почему этот ответ верный"}, ...]}
+Ключевых мыслей 5-8, вопросов 5, у каждого вопроса 4 варианта, answer - индекс верного варианта.
+Пиши на русском языке и опирайся только на содержание урока."""
+
+generations = metrics.counter(
+    "study_aids_generations_total",
+    "Lesson study aid generation jobs by result"
+)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _age(aid: LessonStudyAid) -> float:
+    """Seconds since the row was last written"""
+    updated_at = aid.updated_at or aid.created_at
+    if updated_at is None:
+        return 0.0
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)  # SQLite drops the offset
+    return (_now() - updated_at).total_seconds()
+
+
+def _excerpt(transcript: str, budget: int) -> str:
+    """Transcript within budget tokens; long ones are sampled evenly so every part is represented"""
+    if count_tokens(transcript) <= budget:
+        return transcript
+    chunks = split_transcript(transcript, settings.LESSON_CHUNK_WORDS, 0)
+    per_chunk = max(1, count_tokens(transcript) // len(chunks))
+    keep = max(1, budget // per_chunk)
+    step = len(chunks) / keep
+    return "\n...\n".join(chunks[int(i * step)] for i in range(keep))
+
+
+def _parse(content: str) -> Dict[str, Any]:
+    """Validated study aids from the model's JSON answer; raises ValueError"""
+    start, end = content.find("{"), content.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("no JSON object in the answer")
+    data = json.loads(content[start:end + 1])
+
+    summary = str(data.get("summary") or "").strip()
+    key_points = [str(point).strip() for point in data.get("key_points") or [] if str(point).strip()]
+    quiz = []
+    for item in data.get("quiz") or []:
+        options = [str(option) for option in item.get("options") or []]
+        answer = item.get("answer")
+        if not item.get("question") or len(options) < 2 or not isinstance(answer, int) \
+                or not 0 <= answer < len(options):
+            continue  # Drop malformed items rather than the whole set
+        quiz.append({
+            "question": str(item["question"]),
+            "options": options,
+            "answer": answer,
+            "explanation": str(item.get("explanation") or ""),
+        })
+
+    if not summary:
+        raise ValueError("empty summary")
+    return {"summary": summary, "key_points": key_points, "quiz": quiz}
+
+
+class StudyAidService:
+    """Generates LessonStudyAid rows in the background and reads current ones"""
+
+    def __init__(self):
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def get(self, lesson: Lesson, db: Session) -> Optional[LessonStudyAid]:
+        """Study aids for the lesson's current transcript, if generated"""
+        aid = db.query(LessonStudyAid).filter(LessonStudyAid.lesson_id == lesson.id).first()
+        if aid is None or aid.transcript_version != transcript_version(lesson.transcript):
+            return None
+        return aid
+
+    def status(self, lesson: Lesson, db: Session) -> str:
+        """ready, pending, failed, missing (never generated or stale) or no_transcript.
+        
+        A pending row nobody has finished within STUDY_AIDS_PENDING_TIMEOUT was left by a
+        worker that died mid-generation, and counts as failed.
+        """
+        if not lesson.transcript:
+            return "no_transcript"
+        if lesson.id in self._running:
+            return "pending"
+        aid = self.get(lesson, db)
+        if aid is None:
+            return "missing"
+        if aid.status == "pending" and _age(aid) > settings.STUDY_AIDS_PENDING_TIMEOUT:
+            return "failed"
+        return aid.status
+
+    def retry_due(self, lesson: Lesson, db: Session) -> bool:
+        """Whether a viewer may (re)start generation: missing aids, or failed ones past their backoff.
+        
+        Failures are retried after STUDY_AIDS_RETRY_AFTER, doubling with every attempt,
+        up to STUDY_AIDS_MAX_ATTEMPTS per transcript version.
+        """
+        if not settings.STUDY_AIDS_ENABLED:
+            return False
+        current = self.status(lesson, db)
+        if current == "missing":
+            return True
+        if current != "failed":
+            return False
+        aid = self.get(lesson, db)
+        attempts = aid.attempts or 0
+        if attempts >= settings.STUDY_AIDS_MAX_ATTEMPTS:
+            return False
+        return _age(aid) >= settings.STUDY_AIDS_RETRY_AFTER * 2 ** max(attempts - 1, 0)
+
+    def schedule(self, lesson_id: int, complete: CompleteFn):
+        """Generate the lesson's study aids in the background unless they are current; one job per lesson"""
+        if not settings.STUDY_AIDS_ENABLED or lesson_id in self._running:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.STUDY_AIDS_CONCURRENCY)
+        self._running.add(lesson_id)
+        task = asyncio.get_running_loop().create_task(self._generate(lesson_id, complete))
+        self._tasks.add(task)
+
+        def done(task: asyncio.Task):
+            self._tasks.discard(task)
+            self._running.discard(lesson_id)
+
+        task.add_done_callback(done)
+
+    def schedule_stale(self, db: Session, complete: CompleteFn) -> int:
+        """Schedule every lesson whose study aids are missing, stale or failed; returns how many"""
+        current = {
+            aid.lesson_id: aid
+            for aid in db.query(LessonStudyAid).filter(LessonStudyAid.status == "ready").all()
+        }
+        scheduled = 0
+        for lesson in db.query(Lesson).filter(Lesson.transcript.isnot(None)).all():
+            aid = current.get(lesson.id)
+            if lesson.transcript and (aid is None or aid.transcript_version != transcript_version(lesson.transcript)):
+                self.schedule(lesson.id, complete)
+                scheduled += 1
+        return scheduled
+
+    async def _generate(self, lesson_id: int, complete: CompleteFn):
+        async with self._semaphore:
+            try:
+                db = SessionLocal()
+                try:
+                    lesson = db.get(Lesson, lesson_id)
+                    if lesson is None or not lesson.transcript:
+                        return
+                    aid = self.get(lesson, db)
+                    if aid is not None and aid.status == "ready":
+                        generations.inc(result="current")
+                        return
+                    version = transcript_version(lesson.transcript)
+                    title = lesson.title
+                    budget = settings.PROMPT_TOKEN_BUDGET - count_tokens(STUDY_AIDS_PROMPT)
+                    transcript = _excerpt(lesson.transcript, budget)
+                    self._save(db, lesson_id, version, {"status": "pending"})
+                finally:
+                    db.close()
+
+                messages = [
+                    {"role": "system", "content": STUDY_AIDS_PROMPT},
+                    {"role": "user", "content": f"УРОК: {title}\n\nТРАНСКРИПТ:\n{transcript}"}
+                ]
+                try:
+                    completion = await complete(messages, STUDY_AIDS_USER_KEY, "study_aids", settings.STUDY_AIDS_MAX_TOKENS)
+                    values = {**_parse(completion.content), "status": "ready", "error": None, "generated_at": _now()}
+                    result = "ok"
+                except ValueError as e:
+                    values = {"status": "failed", "error": f"Unparseable answer: {e}"}
+                    result = "invalid"
+                except Exception as e:
+                    values = {"status": "failed", "error": f"Completion failed: {e}"}
+                    result = "error"
+                    print(f"❌ Error generating study aids for lesson {lesson_id}: {e}")
+
+                db = SessionLocal()
+                try:
+                    self._save(db, lesson_id, version, values)
+                finally:
+                    db.close()
+                generations.inc(result=result)
+
+            except Exception as e:
+                generations.inc(result="error")
+                print(f"❌ Error generating study aids for lesson {lesson_id}: {e}")
+
+    def _save(self, db: Session, lesson_id: int, version: str, values: Dict[str, Any]):
+        """Upsert the lesson's row for transcript version"""
+        aid = db.query(LessonStudyAid).filter(LessonStudyAid.lesson_id == lesson_id).first()
+        if aid is None:
+            aid = LessonStudyAid(lesson_id=lesson_id, transcript_version=version)
+            db.add(aid)
+        elif aid.transcript_version != version:
+            # Previous revision's aids no longer apply
+            aid.summary = aid.key_points = aid.quiz = aid.error = aid.generated_at = None
+            aid.attempts = 0
+        aid.transcript_version = version
+        if values.get("status") == "pending":
+            aid.attempts = (aid.attempts or 0) + 1
+        for field, value in values.items():
+            setattr(aid, field, value)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Row created concurrently (another worker); it will converge on the next change
+            db.rollback()
+
+    def context_text(self, aid: Optional[LessonStudyAid]) -> str:
+        """Compact whole-lesson context for chat prompts"""
+        if aid is None or aid.status != "ready":
+            return ""
+        text = f"Краткое содержание урока:\n{aid.summary}\n"
+        if aid.key_points:
+            text += "Ключевые моменты:\n" + "\n".join(f"- {point}" for point in aid.key_points) + "\n"
+        return text
+
+    async def aclose(self):
+        """Give in-flight generations STUDY_AIDS_SHUTDOWN_TIMEOUT to finish on shutdown, then cancel them.
+        
+        A cancelled generation leaves its row pending, which reads as failed after STUDY_AIDS_PENDING_TIMEOUT.
+        """
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=settings.STUDY_AIDS_SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+# Global study aid service instance
+study_aids = StudyAidService()
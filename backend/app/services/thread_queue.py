@@ -0,0 +1,136 @@
+"""
+Per-thread serialization of chat work
+
+A double submit or a second tab must not start two runs on the same
+Assistants thread, nor interleave history writes of one conversation.
+Work on the same thread runs one at a time in arrival order; different
+threads run in parallel. With THREAD_QUEUE_BACKEND=redis a Redis lock
+extends this across workers.
+"""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.redis_fallback import RedisFallback
+
+queue_wait = metrics.histogram(
+    "chat_thread_queue_wait_seconds",
+    "Time a chat request waited for earlier work on the same thread"
+)
+queue_waiting = metrics.gauge(
+    "chat_thread_queue_waiting",
+    "Chat requests currently waiting behind another on the same thread"
+)
+queue_timeouts = metrics.counter(
+    "chat_thread_queue_timeouts_total",
+    "Chat requests rejected after waiting THREAD_QUEUE_TIMEOUT for their thread"
+)
+
+
+class ThreadBusyError(Exception):
+    """Earlier work on the thread didn't finish within THREAD_QUEUE_TIMEOUT"""
+
+
+class _ThreadSlot:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # Holders plus waiters; the slot is dropped at zero
+
+
+class ThreadWorkQueue:
+    """FIFO queue per thread ID, parallel across threads"""
+
+    def __init__(self):
+        self._slots: Dict[str, _ThreadSlot] = {}
+        self.redis = RedisFallback(
+            lambda: settings.THREAD_QUEUE_BACKEND == "redis",
+            timeout=1,
+            unavailable_message="Redis thread lock unavailable, serializing in-process only"
+        )
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str, endpoint: str) -> AsyncIterator[None]:
+        """Run the block exclusively for thread_id; raises ThreadBusyError on timeout"""
+        slot = self._slots.get(thread_id)
+        if slot is None:
+            slot = self._slots[thread_id] = _ThreadSlot()
+        slot.users += 1
+
+        started = time.monotonic()
+        deadline = started + settings.THREAD_QUEUE_TIMEOUT
+        redis_lock = None
+        acquired = False
+        waiting = slot.users > 1
+        if waiting:
+            queue_waiting.inc(endpoint=endpoint)
+        try:
+            # In-process first: same-worker contention never polls Redis
+            try:
+                await asyncio.wait_for(slot.lock.acquire(), settings.THREAD_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                queue_timeouts.inc(endpoint=endpoint)
+                raise ThreadBusyError(f"Thread {thread_id} is busy")
+            acquired = True
+
+            redis_lock = await self._acquire_redis(thread_id, endpoint, deadline)
+            queue_wait.observe(time.monotonic() - started, endpoint=endpoint)
+        except BaseException:
+            if acquired:
+                slot.lock.release()
+            self._leave(thread_id, slot)
+            raise
+        finally:
+            if waiting:
+                queue_waiting.dec(endpoint=endpoint)
+
+        try:
+            yield
+        finally:
+            if redis_lock is not None:
+                await self._release_redis(redis_lock)
+            slot.lock.release()
+            self._leave(thread_id, slot)
+
+    def _leave(self, thread_id: str, slot: _ThreadSlot):
+        slot.users -= 1
+        if slot.users == 0 and self._slots.get(thread_id) is slot:
+            del self._slots[thread_id]
+
+    async def _acquire_redis(self, thread_id: str, endpoint: str, deadline: float):
+        redis = self.redis.client()
+        if redis is None:
+            return None
+        # The TTL frees the thread if a worker dies mid-run
+        lock = redis.lock(
+            f"chat_thread_lock:{thread_id}",
+            timeout=settings.THREAD_LOCK_TTL,
+            sleep=0.05,
+            blocking_timeout=max(0.0, deadline - time.monotonic())
+        )
+        try:
+            acquired = await lock.acquire()
+        except Exception as e:
+            self.redis.failed(e)
+            return None
+        if not acquired:
+            queue_timeouts.inc(endpoint=endpoint)
+            raise ThreadBusyError(f"Thread {thread_id} is busy in another worker")
+        return lock
+
+    async def _release_redis(self, lock):
+        try:
+            await lock.release()
+        except Exception as e:
+            # Expired (run outlived THREAD_LOCK_TTL) or Redis went away; either way it's free
+            print(f"❌ Error releasing thread lock: {e}")
+
+    async def aclose(self):
+        await self.redis.aclose()
+
+
+# Global thread work queue instance
+thread_queue = ThreadWorkQueue()
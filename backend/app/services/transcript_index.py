@@ -0,0 +1,146 @@
+"""
+Lesson transcript retrieval index
+
+Transcripts are split into overlapping word windows and indexed with BM25,
+so lesson-chat prompts only carry the chunks relevant to the question
+instead of the whole transcript.
+"""
+
+import re
+import math
+import hashlib
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+# Rough chars-per-token ratio for mixed Russian/English text
+CHARS_PER_TOKEN = 3.0
+
+STOPWORDS = {
+    "это", "как", "что", "для", "или", "так", "его", "она", "они", "мы", "вы",
+    "при", "над", "под", "все", "еще", "уже", "был", "была", "были", "быть",
+    "когда", "где", "кто", "чем", "тем", "если", "the", "and", "for", "that", "this",
+}
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens in text"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def transcript_version(transcript: Optional[str]) -> str:
+    """Short content hash identifying a transcript revision"""
+    return hashlib.sha1((transcript or "").encode("utf-8")).hexdigest()[:12]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words with stopwords dropped and a light prefix stem"""
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        terms.append(word[:6])  # Cheap stemming for inflected Russian word forms
+    return terms
+
+
+def split_transcript(transcript: str, chunk_words: int, overlap_words: int) -> List[str]:
+    """Split transcript into overlapping windows of words"""
+    words = transcript.split()
+    if not words:
+        return []
+
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+class TranscriptIndex:
+    """BM25 index over the chunks of a single transcript"""
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, transcript: str, chunk_words: int, overlap_words: int):
+        self.version = transcript_version(transcript)
+        self.chunks = split_transcript(transcript, chunk_words, overlap_words)
+        self.total_tokens = count_tokens(transcript)
+
+        self._term_freqs = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0
+
+        doc_freq = Counter()
+        for tf in self._term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(self.chunks)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freq.items()
+        }
+
+    def search(self, query: str, top_k: int) -> List[int]:
+        """Return indexes of the top_k chunks, in transcript order"""
+        terms = tokenize(query)
+        scores = []
+        for i, tf in enumerate(self._term_freqs):
+            score = 0.0
+            norm = self.K1 * (1 - self.B + self.B * self._lengths[i] / (self._avg_length or 1))
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self.K1 + 1) / (freq + norm)
+            scores.append((score, i))
+
+        ranked = [i for score, i in sorted(scores, key=lambda s: (-s[0], s[1])) if score > 0]
+        if not ranked:
+            # No lexical overlap (e.g. "explain this lesson"): fall back to the opening chunks
+            ranked = list(range(len(self.chunks)))
+        return sorted(ranked[:top_k])
+
+
+class TranscriptIndexStore:
+    """Per-lesson transcript indexes, rebuilt when the transcript changes"""
+
+    def __init__(self):
+        self._indexes: Dict[int, TranscriptIndex] = {}
+        self._lock = threading.Lock()
+
+    def index_lesson(self, lesson_id: int, transcript: Optional[str]) -> Optional[TranscriptIndex]:
+        """(Re)build the index for a lesson; called when a lesson is created or updated"""
+        if not transcript:
+            self.remove(lesson_id)
+            return None
+
+        index = TranscriptIndex(
+            transcript,
+            settings.LESSON_CHUNK_WORDS,
+            settings.LESSON_CHUNK_OVERLAP_WORDS
+        )
+        with self._lock:
+            self._indexes[lesson_id] = index
+        return index
+
+    def get(self, lesson_id: int, transcript: Optional[str]) -> Optional[TranscriptIndex]:
+        """Get the index for a lesson, building it if missing or stale"""
+        index = self._indexes.get(lesson_id)
+        if index is not None and index.version == transcript_version(transcript):
+            return index
+        return self.index_lesson(lesson_id, transcript)
+
+    def remove(self, lesson_id: int):
+        with self._lock:
+            self._indexes.pop(lesson_id, None)
+
+
+# Global transcript index store
+transcript_index = TranscriptIndexStore()
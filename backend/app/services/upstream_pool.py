@@ -0,0 +1,268 @@
+"""
+Routing across several OpenAI-compatible upstreams
+
+Each base URL has its own circuit breaker and latency estimate. Calls go to
+the fastest healthy upstream and fail over to the next one on connection
+errors and 5xx responses; an upstream whose breaker is open is skipped
+without waiting for its timeout. With hedging on, a duplicate request goes
+to the next upstream once the primary is slower than its recent p95, and
+whichever answers first wins.
+"""
+
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import openai
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Errors that say something about the upstream rather than the request
+UPSTREAM_FAILURES = (
+    openai.APIConnectionError,  # Includes APITimeoutError
+    openai.InternalServerError,
+)
+
+# Share of calls routed to a random healthy upstream, so latency estimates of
+# slower ones keep getting refreshed
+EXPLORE_RATIO = 0.05
+
+LATENCY_SAMPLES = 200
+MIN_HEDGE_SAMPLES = 20
+EWMA_ALPHA = 0.2
+
+upstream_requests = metrics.counter(
+    "llm_upstream_requests_total",
+    "Requests per upstream base URL by outcome"
+)
+upstream_latency = metrics.histogram(
+    "llm_upstream_latency_seconds",
+    "Upstream response time (until headers for streams)"
+)
+circuit_state = metrics.gauge(
+    "llm_upstream_circuit_state",
+    "Circuit breaker state per upstream: 0 closed, 1 half-open, 2 open"
+)
+hedged_requests = metrics.counter(
+    "llm_hedged_requests_total",
+    "Duplicate requests sent after the primary passed its p95, by which one won"
+)
+
+
+class UpstreamUnavailableError(Exception):
+    """Every upstream's circuit is open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through"""
+
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> int:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.open_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allows(self) -> bool:
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self.probing)
+
+    def on_attempt(self):
+        if self.state == self.HALF_OPEN:
+            self.probing = True
+
+    def on_abandoned(self):
+        """Attempt was cancelled before it told us anything"""
+        self.probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class Upstream:
+    """One base URL with its client, breaker and latency stats"""
+
+    def __init__(self, base_url: str, client, breaker: CircuitBreaker, priority: int):
+        self.base_url = base_url
+        self.client = client
+        self.breaker = breaker
+        self.priority = priority
+        self.ewma: Optional[float] = None
+        self.samples: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def _update_state_gauge(self):
+        circuit_state.set(self.breaker.state, upstream=self.base_url)
+
+    def record_success(self, latency: float):
+        self.breaker.record_success()
+        self.samples.append(latency)
+        self.ewma = latency if self.ewma is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma
+        upstream_latency.observe(latency, upstream=self.base_url)
+        upstream_requests.inc(upstream=self.base_url, outcome="ok")
+        self._update_state_gauge()
+
+    def record_failure(self, error: Exception):
+        self.breaker.record_failure()
+        upstream_requests.inc(upstream=self.base_url, outcome=type(error).__name__)
+        self._update_state_gauge()
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        if len(self.samples) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class UpstreamPool:
+    """Latency-routed, circuit-broken calls across upstreams"""
+
+    def __init__(self, upstreams: List[Upstream]):
+        if not upstreams:
+            raise ValueError("UpstreamPool needs at least one upstream")
+        self.upstreams = upstreams
+
+    def _candidates(self) -> List[Upstream]:
+        healthy = [u for u in self.upstreams if u.breaker.allows()]
+        # Unmeasured upstreams sort first so they get a latency sample
+        healthy.sort(key=lambda u: (u.ewma if u.ewma is not None else 0.0, u.priority))
+        if len(healthy) > 1 and random.random() < EXPLORE_RATIO:
+            healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+        return healthy
+
+    def _hedge_delay(self, upstream: Upstream) -> Optional[float]:
+        if not settings.LLM_HEDGING_ENABLED:
+            return None
+        quantile = upstream.latency_quantile(settings.LLM_HEDGE_QUANTILE)
+        if quantile is None:
+            return None
+        return max(quantile, settings.LLM_HEDGE_MIN_DELAY)
+
+    async def _attempt(self, upstream: Upstream, call: Callable[[Any], Awaitable[Any]]) -> Any:
+        upstream.breaker.on_attempt()
+        started = time.monotonic()
+        try:
+            result = await call(upstream.client)
+        except asyncio.CancelledError:
+            upstream.breaker.on_abandoned()
+            raise
+        except UPSTREAM_FAILURES as e:
+            upstream.record_failure(e)
+            raise
+        except Exception:
+            # The upstream answered, the request itself was rejected
+            upstream.breaker.record_success()
+            raise
+        upstream.record_success(time.monotonic() - started)
+        return result
+
+    async def call(
+        self,
+        call: Callable[[Any], Awaitable[Any]],
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None
+    ) -> Any:
+        """Run call(client) on the best upstream, failing over and hedging as needed.
+
+        discard disposes of results that lost a hedge race (e.g. closes an open stream).
+        """
+        candidates = self._candidates()
+        if not candidates:
+            raise UpstreamUnavailableError("All LLM upstreams are unavailable")
+
+        pending: Dict[asyncio.Task, Upstream] = {}
+        next_index = 0
+        hedge: Optional[Upstream] = None
+        last_error: Optional[BaseException] = None
+
+        def launch() -> Upstream:
+            nonlocal next_index
+            upstream = candidates[next_index]
+            next_index += 1
+            pending[asyncio.ensure_future(self._attempt(upstream, call))] = upstream
+            return upstream
+
+        primary = launch()
+        try:
+            while pending:
+                timeout = None
+                if hedge is None and next_index < len(candidates) and len(pending) == 1:
+                    timeout = self._hedge_delay(primary)
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge = launch()
+                    continue
+
+                winner = None
+                for task in done:
+                    upstream = pending.pop(task)
+                    if task.exception() is None:
+                        if winner is None:
+                            winner = (task.result(), upstream)
+                        elif discard is not None:
+                            await discard(task.result())
+                    else:
+                        last_error = task.exception()
+                        if not isinstance(last_error, UPSTREAM_FAILURES):
+                            # Same request would fail the same way elsewhere
+                            raise last_error
+
+                if winner is not None:
+                    result, upstream = winner
+                    if hedge is not None:
+                        hedged_requests.inc(winner="hedge" if upstream is hedge else "primary")
+                    return result
+
+                # Fail over, unless a hedge is still in flight
+                if not pending and next_index < len(candidates):
+                    primary = launch()
+
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+                if discard is not None:
+                    task.add_done_callback(lambda t: self._discard_late(t, discard))
+
+    def _discard_late(self, task: asyncio.Task, discard: Callable[[Any], Awaitable[None]]):
+        if not task.cancelled() and task.exception() is None:
+            asyncio.ensure_future(discard(task.result()))
+
+
+def configured_bases() -> List[str]:
+    """Upstream base URLs in priority order"""
+    return settings.OPENAI_API_BASES or [settings.OPENAI_API_BASE]
+
+
+def create_upstream_pool(client_factory: Callable[[str], Any]) -> UpstreamPool:
+    return UpstreamPool([
+        Upstream(
+            base_url,
+            client_factory(base_url),
+            CircuitBreaker(settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_OPEN_SECONDS),
+            priority
+        )
+        for priority, base_url in enumerate(configured_bases())
+    ])
@@ -0,0 +1,112 @@
+"""
+Shared helpers for backend benchmarks
+
+Benchmarks run against a throwaway SQLite database and a local fake
+OpenAI-compatible upstream, so they need neither Postgres nor network access.
+Call setup_environment() before importing anything from the app package.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import tempfile
+import threading
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_openai(latency: float = 1.0) -> str:
+    """Start a fake chat completions server in a background thread, return its base URL"""
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    fake = FastAPI()
+
+    answer = "Тестовый ответ преподавателя."
+
+    async def stream_chunks(model: str):
+        for word in answer.split(" "):
+            await asyncio.sleep(latency / 10)
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @fake.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        model = body.get("model", "gpt-3.5-turbo")
+        if body.get("stream"):
+            return StreamingResponse(stream_chunks(model), media_type="text/event-stream")
+        await asyncio.sleep(latency)
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}
+        }
+
+    @fake.api_route("/{path:path}", methods=["GET", "POST"])
+    async def not_found(path: str):
+        return JSONResponse(status_code=404, content={"error": {"message": "not found"}})
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def setup_environment(openai_base: str = "http://127.0.0.1:9/v1") -> str:
+    """Point settings at a temporary SQLite database and the given upstream"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="expovision_bench_"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["OPENAI_API_BASE"] = openai_base
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DEBUG"] = "false"
+    return db_path
+
+
+def seed_lesson(db) -> tuple:
+    """Create a user, a course and a lesson, return (user, lesson)"""
+    from app.models.user import User
+    from app.models.course import Course
+    from app.models.lesson import Lesson
+
+    user = User(email="bench@test.com", name="Bench", password_hash="x")
+    course = Course(title="Benchmark course", is_published=True)
+    db.add_all([user, course])
+    db.flush()
+
+    lesson = Lesson(
+        course_id=course.id,
+        title="Переменные",
+        transcript="Переменная - это именованная область памяти. " * 50,
+        duration=600
+    )
+    db.add(lesson)
+    db.commit()
+    return user, lesson
@@ -0,0 +1,109 @@
+"""
+Benchmark: N concurrent lesson-chat requests against a slow upstream
+
+With a non-blocking LLM client the wall time of N concurrent requests should
+stay close to the latency of a single request instead of growing N times.
+
+With --same-question every request asks the same first question, which
+exercises the answer cache and in-flight coalescing instead.
+
+With --provider local the deterministic local LLM backend stands in for the
+upstream, so not even the fake HTTP server is involved.
+
+Usage (from the backend directory):
+    python -m benchmarks.concurrent_lesson_chat --concurrency 20 --latency 1.0
+    python -m benchmarks.concurrent_lesson_chat --concurrency 20 --same-question
+    python -m benchmarks.concurrent_lesson_chat --concurrency 50 --provider local
+"""
+
+import os
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import setup_environment, start_fake_openai, seed_lesson
+
+
+async def send_one(ai_service, SessionLocal, user_id: int, lesson, question: str) -> dict:
+    """Mirror one HTTP request: own session, auth lookup, lesson message"""
+    from app.models.user import User
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        return await ai_service.send_lesson_message(
+            user=user,
+            message=question,
+            lesson_id=lesson.id,
+            course_id=lesson.course_id,
+            db=db
+        )
+    finally:
+        db.close()
+
+
+async def run_batch(
+    ai_service, SessionLocal, user_ids: list, lesson, same_question: bool
+) -> float:
+    """Send one lesson message per user at once, return wall time"""
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        send_one(
+            ai_service, SessionLocal, user_id, lesson,
+            "Что такое переменная?" if same_question else f"Что такое переменная? #{i}"
+        )
+        for i, user_id in enumerate(user_ids)
+    ])
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if not r["success"]]
+    if failed:
+        raise RuntimeError(f"{len(failed)} requests failed")
+    return elapsed
+
+
+async def main(concurrency: int, latency: float, same_question: bool, provider: str):
+    if provider == "local":
+        setup_environment()
+        os.environ["LLM_PROVIDER"] = "local"
+        os.environ["LOCAL_LLM_LATENCY"] = str(latency)
+    else:
+        setup_environment(start_fake_openai(latency))
+
+    from app.db.database import SessionLocal, engine, Base
+    from app.core.metrics import metrics
+    from app.models.user import User
+    from app.services.ai_service import ai_service
+    import app.models  # noqa: F401 - register all tables
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user, lesson = seed_lesson(db)
+
+    # Separate students, so no request carries another one's chat history
+    students = [User(email=f"student{i}@test.com", name=f"Student {i}", password_hash="x") for i in range(concurrency)]
+    db.add_all(students)
+    db.commit()
+    student_ids = [s.id for s in students]
+
+    single = await run_batch(ai_service, SessionLocal, [user.id], lesson, False)
+    batch = await run_batch(ai_service, SessionLocal, student_ids, lesson, same_question)
+    await ai_service.aclose()
+    db.close()
+
+    print(f"Provider:                  {provider}")
+    print(f"Upstream latency:          {latency:.2f}s")
+    print(f"1 request:                 {single:.2f}s")
+    print(f"{concurrency} concurrent requests: {batch:.2f}s")
+    print(f"Slowdown vs single:        {batch / single:.2f}x (serial would be ~{concurrency}x)")
+    print(f"Upstream calls coalesced:  {metrics.counter('llm_calls_coalesced_total', '').value(flight='lesson_chat'):.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--same-question", action="store_true")
+    parser.add_argument("--provider", choices=("fake-openai", "local"), default="fake-openai")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.latency, args.same_question, args.provider))
@@ -0,0 +1,84 @@
+"""
+Benchmark: cold import time of app.main
+
+Each sample imports the app in a fresh interpreter, so it measures what a
+worker start, test run or CLI script pays before serving anything. The
+upstream is unreachable on purpose: importing must not touch the network.
+
+Usage (from the backend directory):
+    python -m benchmarks.import_time --runs 5
+    python -m benchmarks.import_time --runs 5 --max-seconds 3 --top 15
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+from benchmarks.common import setup_environment
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_once(env: dict, importtime: bool = False) -> tuple:
+    """Import app.main in a fresh interpreter, return (seconds, stderr)"""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", "import app.main"]
+
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import app.main failed:\n{result.stderr[-2000:]}")
+    return elapsed, result.stderr
+
+
+def direct_imports(stderr: str, top: int) -> list:
+    """Slowest modules imported directly by app.main (cumulative microseconds) from -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        # Nesting is shown as two extra spaces per level; app.main itself sits at one
+        if match and len(match.group(3)) == 3:
+            entries.append((int(match.group(2)), match.group(4)))
+    return sorted(entries, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="exit with status 1 if the median import time exceeds this")
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports made by app.main")
+    args = parser.parse_args()
+
+    setup_environment()
+    env = dict(os.environ)
+
+    import_once(env)  # Warm the filesystem and bytecode caches
+    samples = [import_once(env)[0] for _ in range(args.runs)]
+
+    median = statistics.median(samples)
+    print(f"import app.main: median {median:.3f}s, min {min(samples):.3f}s, max {max(samples):.3f}s "
+          f"over {args.runs} runs")
+
+    if args.top:
+        _, stderr = import_once(env, importtime=True)
+        print("\nSlowest imports made by app.main:")
+        for micros, module in direct_imports(stderr, args.top):
+            print(f"  {micros / 1e6:7.3f}s  {module}")
+
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"\n❌ Median import time {median:.3f}s exceeds {args.max_seconds:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark: lesson chat history for a heavy chat user
+
+Seeds one student with a long chat history spread over the lessons of a
+course, then times GET /api/chat/lesson/{id}/history for the newest page and
+for a page deep in the history, next to the previous approach of loading the
+whole course history and filtering it in Python. Page time should stay flat
+as --messages grows; the in-memory approach grows with it.
+
+Usage (from the backend directory):
+    python -m benchmarks.lesson_chat_history --messages 20000 --lessons 20
+    python -m benchmarks.lesson_chat_history --messages 100000 --runs 20 --limit 50
+"""
+
+import math
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import setup_environment, seed_lesson
+
+
+def seed_history(db, user, lesson, messages: int, lessons: int) -> list:
+    """Insert messages spread round-robin over lessons of lesson's course; returns the lesson IDs"""
+    from app.models.lesson import Lesson
+    from app.models.chat_message import ChatMessage
+
+    extra = [
+        Lesson(course_id=lesson.course_id, title=f"Урок {i}", order_index=i + 1)
+        for i in range(lessons - 1)
+    ]
+    db.add_all(extra)
+    db.commit()
+    lesson_ids = [lesson.id] + [l.id for l in extra]
+
+    start = datetime.now(timezone.utc) - timedelta(seconds=messages)
+    rows = []
+    for i in range(messages):
+        lesson_id = lesson_ids[(i // 2) % len(lesson_ids)]
+        rows.append({
+            "user_id": user.id,
+            "course_id": lesson.course_id,
+            "lesson_id": lesson_id,
+            "thread_id": f"lesson_{lesson_id}_user_{user.id}",
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "content": f"Сообщение {i} о переменных и функциях",
+            "created_at": start + timedelta(seconds=i // 2),  # An exchange shares its timestamp
+        })
+    db.execute(ChatMessage.__table__.insert(), rows)
+    db.commit()
+    return lesson_ids
+
+
+def load_all_then_filter(db, user_id: int, course_id: int, lesson_id: int) -> tuple:
+    """The previous endpoint body: whole course history in memory, filtered and counted in Python"""
+    from app.models.chat_message import ChatMessage
+
+    course_messages = db.query(ChatMessage).filter(
+        ChatMessage.user_id == user_id,
+        ChatMessage.course_id == course_id
+    ).order_by(ChatMessage.created_at).all()
+    lesson_messages = [msg for msg in course_messages if msg.lesson_id == lesson_id]
+    return lesson_messages, len(course_messages)
+
+
+def timed(fn, runs: int) -> tuple:
+    """(median ms, p95 ms, last result) of fn over runs calls"""
+    samples = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[math.ceil(0.95 * len(samples)) - 1], result
+
+
+def main(messages: int, lessons: int, runs: int, limit: int):
+    setup_environment()
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+    from app.db.database import SessionLocal, engine, Base
+    from app.main import app as api
+    from app.core.security import get_current_active_user
+    from app.models.user import User
+    import app.models  # noqa: F401 - register all tables
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user, lesson = seed_lesson(db)
+    seed_history(db, user, lesson, messages, lessons)
+    user_id, course_id, lesson_id = user.id, lesson.course_id, lesson.id
+
+    api.dependency_overrides[get_current_active_user] = lambda: SessionLocal().get(User, user_id)
+    client = TestClient(api)
+    url = f"/api/chat/lesson/{lesson_id}/history"
+
+    def page(**params):
+        response = client.get(url, params={"limit": limit, **params})
+        response.raise_for_status()
+        return response
+
+    newest_ms, newest_p95, newest = timed(lambda: page(), runs)
+
+    # Walk back to the oldest page once, then time a page right at the start of the history
+    cursor, pages = newest.headers.get("x-prev-cursor"), 1
+    deep_cursor = None
+    while cursor:
+        deep_cursor = cursor
+        cursor = page(before_id=cursor).headers.get("x-prev-cursor")
+        pages += 1
+    deep_ms, deep_p95, _ = timed(lambda: page(before_id=deep_cursor), runs) if deep_cursor else (0.0, 0.0, None)
+
+    def legacy():
+        session = SessionLocal()
+        try:
+            return load_all_then_filter(session, user_id, course_id, lesson_id)
+        finally:
+            session.close()
+
+    legacy_ms, legacy_p95, (lesson_messages, total) = timed(legacy, max(1, runs // 4))
+
+    body = newest.json()
+    if body["total_course_messages"] != total:
+        raise RuntimeError(f"count mismatch: {body['total_course_messages']} != {total}")
+    if [m["id"] for m in body["messages"]] != [m.id for m in lesson_messages[-limit:]]:
+        raise RuntimeError("newest page differs from the in-memory result")
+
+    plan = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM chat_messages "
+        "WHERE user_id = :u AND course_id = :c AND lesson_id = :l ORDER BY created_at DESC, id DESC LIMIT 51"
+    ), {"u": user_id, "c": course_id, "l": lesson_id}).fetchall()
+    db.close()
+
+    print(f"Messages in course:        {total} ({len(lesson_messages)} in the lesson, {pages} pages of {limit})")
+    print(f"Newest page:               {newest_ms:.1f} ms median, {newest_p95:.1f} ms p95")
+    print(f"Oldest page (keyset):      {deep_ms:.1f} ms median, {deep_p95:.1f} ms p95")
+    print(f"Load all + filter (old):   {legacy_ms:.1f} ms median, {legacy_p95:.1f} ms p95")
+    print(f"Query plan:                {'; '.join(row[-1] for row in plan)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--lessons", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    main(args.messages, args.lessons, args.runs, args.limit)
@@ -0,0 +1,21 @@
+"""
+Tests for chat search snippets
+"""
+
+from app.services.chat_search import SNIPPET_ELLIPSIS, SNIPPET_WORDS, _highlight
+
+
+def test_highlight_keeps_leading_markup():
+    assert _highlight("<b>hello</b> world", ["hello"]) == "&lt;b&gt;<mark>hello</mark>&lt;/b&gt; world"
+
+
+def test_highlight_keeps_leading_and_trailing_punctuation():
+    assert _highlight("«Привет», мир!", ["привет"]) == "«<mark>Привет</mark>», мир!"
+
+
+def test_highlight_drops_text_replaced_by_ellipsis():
+    words = [f"w{i}" for i in range(SNIPPET_WORDS * 2)]
+    content = "(" + " ".join(words + ["match"]) + ")"
+    snippet = _highlight(content, ["match"])
+    assert snippet.startswith(SNIPPET_ELLIPSIS + "w")
+    assert snippet.endswith("<mark>match</mark>)")